@@ -1,4 +1,5 @@
 import sysfs_paths_xu3 as sfs
+import sysfs_reader as sfr
 import devfreq_utils_xu3 as dvfs
 from state_space_params_xu3 import *
 import perf_module as pm
@@ -48,17 +49,19 @@ def init_RL():
 	print("FINISHED")
 	return
 
+# Counter attribute paths are built once so every read hits the persistent
+# descriptor cached by the sysfs reader.
+counter_paths = {}
 def get_counter_value(cpu_num, attr_name):
-	with open("/sys/kernel/performance_counters/cpu{}/{}".format(cpu_num, attr_name), 
-				'r') as f:
-		val = float(f.readline().strip())
-	return val
+	path = counter_paths.get((cpu_num, attr_name))
+	if path is None:
+		path = sfs.fn_perf_counter.format(cpu_num, attr_name)
+		counter_paths[(cpu_num, attr_name)] = path
+	return float(sfr.read_int(path))
 
 def set_period(p):
 	for cpu_num in range(4,8):
-		with open("/sys/kernel/performance_counters/cpu{}/sample_period_ms".format(cpu_num), 
-				'w') as f:
-			f.write("{}\n".format(p))
+		sfr.write_int(sfs.fn_perf_sample_period.format(cpu_num), p)
 
 
 '''
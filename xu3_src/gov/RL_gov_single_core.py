@@ -9,7 +9,10 @@ from collections import deque
 
 # Local imports:
 import sysfs_paths_xu3 as sfs
+import sysfs_reader as sfr
 import devfreq_utils_xu3 as dvfs
+from freq_actuator import FreqActuator
+from sensor_hub import SensorHub
 from state_space_params_xu3_single_core import *
 
 num_buckets = np.array([BUCKETS[k] for k in LABELS], dtype=np.double)
@@ -25,6 +28,9 @@ C = np.zeros( dims )
 all_mins = np.array([MINS[k] for k in LABELS], dtype=np.double)
 all_maxs = np.array([MAXS[k] for k in LABELS], dtype=np.double)
 widths = np.divide( np.array(all_maxs) - np.array(all_mins), num_buckets)
+# Big cluster frequency actuator and shared sensor hub, created by init():
+actuator = None
+sensors = None
 
 
 def checkpoint_statespace():
@@ -59,8 +65,15 @@ def load_statespace():
 # XU3 has built-in sensors, so use them:
 def get_power():
 	# Just return big cluster power:
+	if sensors is not None:
+		return sensors.get_power()[0]
 	return dvfs.getPowerComponents()[0]
 
+def get_temps():
+	if sensors is not None:
+		return sensors.get_temps()
+	return [float(x) for x in dvfs.getTemps()]
+
 def init():
 	# Make sure perf counter module is loaded:
 	process = subprocess.Popen(['lsmod'], stdout=subprocess.PIPE)
@@ -73,18 +86,27 @@ def init():
 	ms_period = int(PERIOD*1000)
 	print("Running with period: {} ms".format(ms_period))
 	set_period(ms_period)
-
+	# Cache the big cluster OPP table and start the frequency writer:
+	global actuator
+	actuator = FreqActuator(4, dvfs.setClusterFreq, dvfs.getAvailFreqs(4))
+	# Sample thermal zones and power rails once per period:
+	global sensors
+	sensors = SensorHub(dvfs.getTemps, PERIOD, power_fn=dvfs.getPowerComponents)
+	sensors.start()
+
+# Counter attribute paths are built once so every read hits the persistent
+# descriptor cached by the sysfs reader.
+counter_paths = {}
 def get_counter_value(cpu_num, attr_name):
-	with open("/sys/kernel/performance_counters/cpu{}/{}".format(cpu_num, attr_name), 
-				'r') as f:
-		val = float(f.readline().strip())
-	return val
+	path = counter_paths.get((cpu_num, attr_name))
+	if path is None:
+		path = sfs.fn_perf_counter.format(cpu_num, attr_name)
+		counter_paths[(cpu_num, attr_name)] = path
+	return float(sfr.read_int(path))
 
 def set_period(p):
 	cpu_num = 4
-	with open("/sys/kernel/performance_counters/cpu{}/sample_period_ms".format(cpu_num), 
-				'w') as f:
-		f.write("{}\n".format(p))
+	sfr.write_int(sfs.fn_perf_sample_period.format(cpu_num), p)
 
 '''
 Returns state figures, non-quantized.
@@ -107,7 +129,7 @@ def get_raw_state():
 	instructions = get_counter_value(cpu, "instructions_retired")
 	l2misses = get_counter_value(cpu, "l2_data_refills")
 	dmemaccesses = get_counter_value(cpu, "data_memory_accesses")
-	T = [float(x) for x in dvfs.getTemps()]
+	T = get_temps()
 	P = get_power()
 	# Throughput stats:
 	IPC_u = instructions / cycles_used
@@ -229,13 +251,13 @@ def Q_learning():
 		# (note big_freqs is lookup table from state_space module).
 		# Also counter increment is performed in Q off policy update function.
 		if ACTIONS == FREQS:
-			dvfs.setClusterFreq(4, big_freqs[best_action])
+			actuator.request(big_freqs[best_action])
 		else:
 			stay = ACTIONS // 2
 			cur_freq_index = freq_to_bucket[ stats['freq'] ]
 			cur_freq_index += (best_action - stay)
 			bounded_freq_index = max( 0, min( cur_freq_index, FREQS-1))
-			dvfs.setClusterFreq(4, big_freqs[bounded_freq_index])
+			actuator.request(big_freqs[bounded_freq_index])
 		
 		# Save state and action:
 		last_state = state
@@ -292,13 +314,13 @@ def run_offline():
 		# Take action.
 		# (note big_freqs is lookup table from state_space module).
 		if ACTIONS == FREQS:
-			dvfs.setClusterFreq(4, big_freqs[best_action])
+			actuator.request(big_freqs[best_action])
 		else:
 			stay = ACTIONS // 2
 			cur_freq_index = freq_to_bucket[ stats['freq'] ]
 			cur_freq_index += (best_action - stay)
 			bounded_freq_index = max( 0, min( cur_freq_index, FREQS-1))
-			dvfs.setClusterFreq(4, big_freqs[bounded_freq_index])
+			actuator.request(big_freqs[bounded_freq_index])
 		
 		# Print state and action:
 		print([stats[k] for k in LABELS])
@@ -1,5 +1,6 @@
 import sys, os
 import sysfs_paths_xu3 as sysfs
+import sysfs_reader as sfr
 
 # Userspace cpu frequency governor and utilities for XU3
 # Based on:
@@ -16,18 +17,25 @@ prev_govs = None
 # Return the power for the big cluster, little cluster, gpu, and memory
 def getPowerComponents():
 	p_vals = []
-	with open(sysfs.big_cluster_power, 'r') as pf:
-		p_vals.append( float(pf.read()) )
-	with open(sysfs.little_cluster_power, 'r') as pf:
-		p_vals.append( float(pf.read()) )
-	with open(sysfs.gpu_power, 'r') as pf:
-		p_vals.append( float(pf.read()) )
-	with open(sysfs.mem_power, 'r') as pf:
-		p_vals.append( float(pf.read()) )
+	p_vals.append( sfr.read_float(sysfs.big_cluster_power) )
+	p_vals.append( sfr.read_float(sysfs.little_cluster_power) )
+	p_vals.append( sfr.read_float(sysfs.gpu_power) )
+	p_vals.append( sfr.read_float(sysfs.mem_power) )
 	return p_vals
 
 # Return list of ints of available frequencies, sorted from least to greatest.
+# The OPP tables do not change at runtime, so each cluster's table is read once.
+avail_freqs_cache = {}
 def getAvailFreqs(cpu_num):
+	cluster = (cpu_num//4)
+	if cluster not in avail_freqs_cache:
+		freqs = readAvailFreqs(cpu_num)
+		if freqs is None:
+			return None
+		avail_freqs_cache[cluster] = freqs
+	return list(avail_freqs_cache[cluster])
+
+def readAvailFreqs(cpu_num):
 	cluster = (cpu_num//4)
 	if cluster == 0:
 		freqs = open(sysfs.little_cluster_freq_range, 'r').read().strip().split(' ')
@@ -105,10 +113,11 @@ def unsetUserSpace(clusters=None):
 	
 
 # As with note at top of this file, clusters should be selected using CORE numbers.
+# Reads go through the persistent sysfs reader (one descriptor per file).
+freq_read_paths = [sysfs.fn_cpu_freq_read.format(i) for i in range(8)]
 def getClusterFreq(cpu_num):
 	#print("using cpu {}".format(cpu_num))
-	with open(sysfs.fn_cpu_freq_read.format(cpu_num), 'r') as f:
-		return int(f.read().strip())
+	return sfr.read_int(freq_read_paths[cpu_num])
 	
 # Accepts frequency in khz as int or string
 # As with note at top of this file, clusters should be selected using CORE numbers.
@@ -135,17 +144,17 @@ def setClusterFreq(cpu_num, frequency):
 		f.flush()
 
 def getGPUFreq():
-	with open(sysfs.gpu_freq, 'r') as f:
-		return int(f.read().strip()) * 1000 
+	return sfr.read_int(sysfs.gpu_freq) * 1000 
 
 def getMemFreq():
-	with open(sysfs.mem_freq, 'r') as f:
-		return int(f.read().strip()) 
+	return sfr.read_int(sysfs.mem_freq) 
 
+# The TMU file has one "sensorN : <millicelsius>" line per sensor.
+NUM_THERMAL_SENSORS = 5
 def getTemps():
-	with open(sysfs.thermal_sensors, 'r') as tempf:
-		temps = tempf.readlines()
-		temps = [int(x.strip().split(' ')[2])/1000 for x in temps]
+	temps = [0] * NUM_THERMAL_SENSORS
+	n = sfr.read_column_ints(sysfs.thermal_sensors, 2, temps)
+	temps = [x/1000 for x in temps[:n]]
 	# Note: on the 5422, cpu temperatures 5 and 7 (big cores 1 and 3, counting from 0)
 	# appear to be swapped at the hardware or firmware level.
 	# therefore, swap them back:
@@ -160,15 +169,15 @@ def cpuVoltage(n):
 	# 0 is little cluster
 	# 4 is big cluster
 	if n == 0:
-		temp = float(file(sysfs.little_micro_volts, 'r').readline().strip())/1000000
+		temp = sfr.read_int(sysfs.little_micro_volts)/1000000.0
 	elif n == 4:
-		temp = float(file(sysfs.big_micro_volts, 'r').readline().strip())/1000000
+		temp = sfr.read_int(sysfs.big_micro_volts)/1000000.0
 	else:
 		raise Exception('Error: {} is not a supported resource ID for voltage.'.format(n))
 	return temp
 
 def GPUVoltage():
-	return float(file(sysfs.gpu_micro_volts, 'r').readline().strip())/1000000
+	return sfr.read_int(sysfs.gpu_micro_volts)/1000000.0
 
 def memVoltage():
-	return float(file(sysfs.mem_micro_volts, 'r').readline().strip())/1000000
+	return sfr.read_int(sysfs.mem_micro_volts)/1000000.0
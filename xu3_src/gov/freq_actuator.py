@@ -0,0 +1,147 @@
+import threading
+import time
+
+# Coalescing cluster frequency actuator.
+# The control loop calls request() every period; the actuator snaps the
+# target to the cached OPP table, drops it if it matches the last value
+# written, and otherwise hands it to a writer thread. If the writer is still
+# busy with a slow cpufreq write, newer requests overwrite the pending one
+# (latest wins) so the control loop never blocks on sysfs.
+
+class FreqActuator(object):
+    '''
+    cpu_num: lowest core number of the cluster (as in devfreq_utils).
+    set_freq: function(cpu_num, khz) performing the actual sysfs write.
+    avail_freqs: OPP table in KHz, sorted least to greatest. Read once.
+    threaded: if False, writes happen synchronously inside request().
+    '''
+    def __init__(self, cpu_num, set_freq, avail_freqs, threaded=True):
+        self.cpu_num = cpu_num
+        self.set_freq = set_freq
+        self.avail_freqs = sorted(int(f) for f in avail_freqs)
+        self.threaded = threaded
+        # Last frequency written to sysfs, frequency being written right now
+        # and frequency waiting to be written:
+        self.applied = None
+        self.inflight = None
+        self.pending = None
+        # Counters:
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+        self.writes_coalesced = 0
+        self.write_time_total = 0.0
+        self.write_time_max = 0.0
+        self.write_time_last = 0.0
+        self.running = False
+        self.cond = threading.Condition()
+        self.thread = None
+        if threaded:
+            self.start()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._writer, name="freq-actuator")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    '''
+    Snap a frequency to the OPP table: clamp to the table range and pick the
+    highest OPP not above the target.
+    '''
+    def snap(self, frequency):
+        frequency = int(frequency)
+        freqs = self.avail_freqs
+        if frequency <= freqs[0]:
+            return freqs[0]
+        if frequency >= freqs[-1]:
+            return freqs[-1]
+        lo, hi = 0, len(freqs) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if freqs[mid] <= frequency:
+                lo = mid
+            else:
+                hi = mid - 1
+        return freqs[lo]
+
+    '''
+    Request a new cluster frequency (KHz). Returns immediately when threaded.
+    '''
+    def request(self, frequency):
+        frequency = self.snap(frequency)
+        if not self.threaded:
+            if frequency == self.applied:
+                self.writes_suppressed += 1
+            else:
+                self._write(frequency)
+            return
+        with self.cond:
+            if self.pending is not None:
+                # Unwritten request is superseded by this one.
+                self.writes_coalesced += 1
+                self.pending = None
+            current = self.inflight if self.inflight is not None else self.applied
+            if frequency == current:
+                self.writes_suppressed += 1
+                return
+            self.pending = frequency
+            self.cond.notify()
+
+    '''
+    Forget the last applied value, e.g. after something else wrote cpufreq.
+    The next request is always written.
+    '''
+    def invalidate(self):
+        with self.cond:
+            self.applied = None
+
+    def _write(self, frequency):
+        start = time.time()
+        self.set_freq(self.cpu_num, frequency)
+        self._record(frequency, time.time() - start)
+
+    def _record(self, frequency, elapsed):
+        self.applied = frequency
+        self.writes_issued += 1
+        self.write_time_total += elapsed
+        self.write_time_last = elapsed
+        if elapsed > self.write_time_max:
+            self.write_time_max = elapsed
+
+    def _writer(self):
+        while True:
+            with self.cond:
+                while self.running and self.pending is None:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                frequency = self.pending
+                self.pending = None
+                self.inflight = frequency
+            # Write outside the lock so request() never waits on sysfs:
+            start = time.time()
+            self.set_freq(self.cpu_num, frequency)
+            elapsed = time.time() - start
+            with self.cond:
+                self.inflight = None
+                self._record(frequency, elapsed)
+
+    def stats(self):
+        with self.cond:
+            issued = self.writes_issued
+            return {
+                'writes_issued': issued,
+                'writes_suppressed': self.writes_suppressed,
+                'writes_coalesced': self.writes_coalesced,
+                'write_time_avg': self.write_time_total / issued if issued else 0.0,
+                'write_time_max': self.write_time_max,
+                'write_time_last': self.write_time_last,
+                }
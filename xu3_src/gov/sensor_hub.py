@@ -0,0 +1,128 @@
+from multiprocessing import RawArray
+import threading
+import time
+
+# Shared sensor hub.
+# One thread samples the thermal zones (and, where available, the power
+# rails) once per period and publishes them in a shared memory block. The
+# control loop, the per-core runner processes (forked after the hub is
+# created) and the frequency arbiter then read the latest values from memory
+# instead of each reopening the same sysfs files.
+#
+# The block is guarded by a sequence counter (seqlock): the writer makes the
+# counter odd while it updates the values and even again when done, readers
+# retry if the counter was odd or changed while they copied the values.
+#
+# Layout of the shared block:
+#   [0] sequence counter
+#   [1] timestamp of the sample (time.time())
+#   [2 : 2+num_temps] temperatures
+#   [2+num_temps : ] power rails
+SEQ = 0
+STAMP = 1
+DATA = 2
+
+class SensorHub(object):
+    '''
+    temps_fn: function returning the list of temperatures (e.g. dvfs.getTemps).
+    period: sampling period in seconds.
+    ttl: maximum age of a published sample; older samples are considered
+         stale and readers sample the sensors themselves. Defaults to two
+         periods.
+    power_fn: optional function returning the list of power rails
+         (e.g. getPowerComponents on the XU3).
+    '''
+    def __init__(self, temps_fn, period, ttl=None, power_fn=None, num_temps=5, num_power=4):
+        self.temps_fn = temps_fn
+        self.power_fn = power_fn
+        self.period = period
+        self.ttl = ttl if ttl is not None else 2 * period
+        self.num_temps = num_temps
+        self.num_power = num_power if power_fn is not None else 0
+        self.shm = RawArray('d', DATA + self.num_temps + self.num_power)
+        self.stale_reads = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        # Publish a first sample before anyone reads:
+        self.sample()
+        self.running = True
+        self.thread = threading.Thread(target=self._sampler, name="sensor-hub")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    '''
+    Read the sensors once and publish the values.
+    '''
+    def sample(self):
+        temps = self.temps_fn()
+        power = self.power_fn() if self.power_fn is not None else ()
+        shm = self.shm
+        shm[SEQ] += 1
+        shm[STAMP] = time.time()
+        base = DATA
+        for i in range(self.num_temps):
+            shm[base + i] = temps[i]
+        base += self.num_temps
+        for i in range(self.num_power):
+            shm[base + i] = power[i]
+        shm[SEQ] += 1
+
+    def _sampler(self):
+        next_sample = time.time() + self.period
+        while self.running:
+            delay = next_sample - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.sample()
+            next_sample += self.period
+            # Skip missed periods instead of sampling back to back:
+            now = time.time()
+            if next_sample < now:
+                next_sample = now + self.period
+
+    '''
+    Copy a consistent set of published values [start, stop) out of the shared
+    block. Returns None if the published sample is older than the TTL.
+    '''
+    def _read(self, start, stop):
+        shm = self.shm
+        while True:
+            seq = shm[SEQ]
+            if int(seq) & 1:
+                continue
+            stamp = shm[STAMP]
+            vals = shm[start:stop]
+            if shm[SEQ] == seq:
+                break
+        if time.time() - stamp > self.ttl:
+            return None
+        return vals
+
+    def get_temps(self):
+        vals = self._read(DATA, DATA + self.num_temps)
+        if vals is None:
+            self.stale_reads += 1
+            return [float(x) for x in self.temps_fn()]
+        return vals
+
+    def get_power(self):
+        start = DATA + self.num_temps
+        vals = self._read(start, start + self.num_power)
+        if vals is None:
+            self.stale_reads += 1
+            return [float(x) for x in self.power_fn()]
+        return vals
+
+    '''
+    Age of the last published sample in seconds.
+    '''
+    def age(self):
+        return time.time() - self.shm[STAMP]
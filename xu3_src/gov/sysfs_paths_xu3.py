@@ -73,3 +73,8 @@ big_cluster_power = "/sys/bus/i2c/devices/3-0040/sensor_W"
 little_cluster_power = "/sys/bus/i2c/devices/3-0045/sensor_W"
 gpu_power = "/sys/bus/i2c/devices/3-0044/sensor_W"
 mem_power = "/sys/bus/i2c/devices/3-0041/sensor_W"
+
+# Paths for the performance counter kernel module (perfmod):
+perf_counters_base="/sys/kernel/performance_counters/cpu{}/"
+fn_perf_counter=perf_counters_base+"{}"
+fn_perf_sample_period=perf_counters_base+"sample_period_ms"
@@ -0,0 +1,204 @@
+import os
+import errno
+import threading
+
+# Persistent sysfs reader.
+# Every path is opened once and then reread from offset 0 into a reusable
+# buffer, instead of paying open()/read()/close() for every sample. Sysfs
+# attributes are regenerated by the kernel whenever they are read at offset 0,
+# so pread() on a held descriptor always returns the current value.
+#
+# Values are parsed straight out of the byte buffer; no intermediate strings
+# are built on the hot path.
+#
+# Reads use pread (positional), so descriptors inherited across fork() by the
+# multicore runner processes do not share a file offset. Each thread gets its
+# own reader (descriptors and buffer) through the module level functions.
+
+BUF_SIZE = 4096
+
+# Errors that mean the descriptor no longer refers to a live attribute, e.g.
+# after the perf counter module was reloaded or a cpufreq policy went away.
+STALE_ERRNOS = (errno.ENODEV, errno.ESTALE, errno.EBADF, errno.ENOENT, errno.ENXIO)
+
+# Powers of ten for exact decimal parsing (mantissa / 10**k is correctly
+# rounded, which is what float() returns for the same text).
+_POW10 = [10.0 ** k for k in range(23)]
+
+# Byte codes (indexing a bytearray gives ints on every Python):
+_SPACE = frozenset(bytearray(b' \t\n\r'))
+_DIGIT_0 = ord('0')
+_DIGIT_9 = ord('9')
+_MINUS = ord('-')
+_DOT = ord('.')
+_NEWLINE = ord('\n')
+
+
+class SysfsReader(object):
+    '''
+    Holds one open descriptor per path plus one read buffer.
+    Not thread safe: give each thread that reads sysfs its own reader.
+    '''
+    def __init__(self, buf_size=BUF_SIZE):
+        self.fds = {}
+        self.buf = bytearray(buf_size)
+        self.view = memoryview(self.buf)
+        self.reopens = 0
+
+    def _open(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        self.fds[path] = fd
+        return fd
+
+    def _drop(self, path):
+        fd = self.fds.pop(path, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _pread(self, fd):
+        if hasattr(os, 'preadv'):
+            return os.preadv(fd, [self.buf], 0)
+        # No preadv (Python before 3.7, or 2.7 for the xu3 governors): seek
+        # back and read into the same buffer.
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, len(self.buf))
+        n = len(data)
+        self.buf[:n] = data
+        return n
+
+    '''
+    Reread path into the buffer and return the number of valid bytes.
+    A stale descriptor (error, or an empty read where the attribute always
+    has content) is closed and the path reopened once before giving up.
+    '''
+    def read(self, path):
+        fd = self.fds.get(path)
+        if fd is None:
+            fd = self._open(path)
+        try:
+            n = self._pread(fd)
+        except (OSError, IOError) as e:
+            if e.errno not in STALE_ERRNOS:
+                raise
+            n = 0
+        if n == 0:
+            self._drop(path)
+            self.reopens += 1
+            n = self._pread(self._open(path))
+        return n
+
+    def read_int(self, path):
+        n = self.read(path)
+        return _parse_int(self.buf, 0, n)[0]
+
+    def read_float(self, path):
+        n = self.read(path)
+        return _parse_float(self.buf, 0, n)
+
+    '''
+    Parse the col-th whitespace separated token of every line in path as an
+    integer, storing the results in out. Returns the number of lines parsed.
+    Used for multi-line attributes such as the XU3 TMU 'temp' file.
+    '''
+    def read_column_ints(self, path, col, out):
+        n = self.read(path)
+        buf = self.buf
+        line = 0
+        i = 0
+        while i < n and line < len(out):
+            # Skip to the start of token col on this line:
+            for _ in range(col):
+                while i < n and buf[i] in _SPACE and buf[i] != _NEWLINE:
+                    i += 1
+                while i < n and buf[i] not in _SPACE:
+                    i += 1
+            out[line], i = _parse_int(buf, i, n)
+            line += 1
+            # Skip the rest of the line:
+            while i < n and buf[i] != _NEWLINE:
+                i += 1
+            i += 1
+        return line
+
+    def read_str(self, path):
+        n = self.read(path)
+        return bytes(self.view[:n]).decode().strip()
+
+    def close(self):
+        for path in list(self.fds.keys()):
+            self._drop(path)
+
+
+def _parse_int(buf, i, n):
+    while i < n and buf[i] in _SPACE:
+        i += 1
+    neg = i < n and buf[i] == _MINUS
+    if neg:
+        i += 1
+    val = 0
+    while i < n:
+        c = buf[i]
+        if c < _DIGIT_0 or c > _DIGIT_9:
+            break
+        val = val * 10 + (c - _DIGIT_0)
+        i += 1
+    return (-val if neg else val), i
+
+
+def _parse_float(buf, i, n):
+    while i < n and buf[i] in _SPACE:
+        i += 1
+    neg = i < n and buf[i] == _MINUS
+    if neg:
+        i += 1
+    mantissa = 0
+    decimals = -1
+    while i < n:
+        c = buf[i]
+        if c == _DOT and decimals < 0:
+            decimals = 0
+        elif _DIGIT_0 <= c <= _DIGIT_9:
+            mantissa = mantissa * 10 + (c - _DIGIT_0)
+            if decimals >= 0:
+                decimals += 1
+        else:
+            break
+        i += 1
+    val = float(mantissa) if decimals <= 0 else mantissa / _POW10[decimals]
+    return -val if neg else val
+
+
+# Per-thread default readers:
+_local = threading.local()
+
+def get_reader():
+    try:
+        return _local.reader
+    except AttributeError:
+        _local.reader = SysfsReader()
+        return _local.reader
+
+def read_int(path):
+    return get_reader().read_int(path)
+
+def read_float(path):
+    return get_reader().read_float(path)
+
+def read_str(path):
+    return get_reader().read_str(path)
+
+def read_column_ints(path, col, out):
+    return get_reader().read_column_ints(path, col, out)
+
+
+# Writes are configuration, not sampling: they happen a handful of times per
+# run, so they go through a fresh descriptor rather than the cached read ones.
+def write_int(path, value):
+    fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+    try:
+        os.write(fd, "{}\n".format(value).encode())
+    finally:
+        os.close(fd)
@@ -1,16 +1,34 @@
 import numpy as np
-from multiprocessing import Array, Process
 import subprocess, os, sys
 import ctypes
 import time
 import random
 import atexit
+import signal
 import select
+import json
 import copy
+import collections
 
 # Local imports:
 import sysfs_paths as sfs
+import sysfs_reader as sfr
 import devfreq_utils as dvfs
+from freq_actuator import FreqActuator
+from sensor_hub import SensorHub
+import loop_timing as lt
+import ring_log
+from trace_recorder import TraceRecorder
+from state_encoder import StateEncoder
+import compile_policy as cp
+from q_backends import DenseQ, SparseQ, TileQ
+from checkpoint import Checkpointer
+import checkpoint as ckpt
+import migrate_q
+from eligibility import EligibilityTrace
+from replay_buffer import ReplayBuffer
+import actor_learner as al
+from freq_arbiter import FreqArbiter, arbitrate
 from state_space_params import *
 import therm_params as tm
 from therm_params import big_f_to_v_MC1 as vvf_dict
@@ -18,25 +36,94 @@ from therm_params import big_f_to_v_MC1 as vvf_dict
 # Filesystem monitoring:
 watchers = [None] * 4
 watcher_files = [None] * 4
-# Multicore policy requested frequencies:
-requested_freqs =  Array('i', 8, lock=True)
-for i in requested_freqs:
-    i = 200000
+# Per-core runner processes and the arbiter of their frequency requests
+# (run all, see run_offline_multicore()):
 runners =  [None]*4
+arbiter = None
+# Big cluster frequency actuator and shared sensor hub, created by init():
+actuator = None
+sensors = None
+# Control loop stage timing, log and trace layouts, which follow PERIOD,
+# LABELS and FREQ_IN_STATE (rebuilt by configure()):
+def build_layouts():
+    global timer, log_fields, rlog, trace_columns, trace_buf
+    # Stage timing (dump with kill -USR1 <pid>):
+    timer = lt.LoopTimer(PERIOD) if TIMING else lt.NullTimer()
+    # Buffered control loop log, started by Q_learning():
+    log_fields = [
+        ['vvf_n', 'ips_n', 'power_penalty', 'thermal_penalty', 'reward'],
+        LABELS + ['freq'] + ['s_' + k for k in LABELS] + (['s_freq'] if FREQ_IN_STATE else [])
+            + ['action', 'reward', 'Q'],
+        ['decision_us'],
+        ]
+    rlog = ring_log.RingLog("log_{}ms".format(int(PERIOD*1000)), log_fields,
+            enabled=LOG_CATEGORIES, ctl_file=LOG_CTL_FILE)
+    # Per-step trace columns (see trace_row()), recorded by Q_learning() if TRACE:
+    trace_columns = [
+        ('t_ns', np.int64),
+        ('cycles', np.uint32),
+        ('instructions', np.uint32),
+        ('bmisses', np.uint32),
+        ('l2misses', np.uint32),
+        ('freq_mhz', np.uint16),
+        ('temp', np.float32),
+        ('IPC_u', np.float32),
+        ('IPC_p', np.float32),
+        ('MPKI', np.float32),
+        ('BMPKI', np.float32),
+        ('usage', np.float32),
+        ('IPS', np.float32),
+        ] + [('s_' + k, np.uint16) for k in LABELS] \
+        + ([('s_freq', np.uint16)] if FREQ_IN_STATE else []) + [
+        ('action', np.uint16),
+        ('reward', np.float32),
+        ('Q', np.float32),
+        ]
+    # Trace row filled in place by trace_row() every step:
+    trace_buf = [0] * len(trace_columns)
+build_layouts()
+recorder = None
+# Greedy action per flat state for run mode, see try_load():
+policy = None
+# Background checkpoint writer, created by Q_learning(), and the number of
+# training steps behind the current Q (restored from checkpoint metadata):
+checkpointer = None
+trained_steps = 0
+
+# Tables derived from the state space parameters, rebuilt by configure():
+def build_tables():
+    global num_buckets, dims, qtable, Q, Qf, C, Cf, all_mins, all_maxs, widths, encoder
+    num_buckets = np.array([BUCKETS[k] for k in LABELS], dtype=np.double)
+    if FREQ_IN_STATE:
+        dims = [int(b) for b in num_buckets] + [FREQS] + [ACTIONS]  
+    else:
+        dims = [int(b) for b in num_buckets] + [ACTIONS]
+    print(dims)
+    # For bucketing stats:
+    all_mins = np.array([MINS[k] for k in LABELS], dtype=np.double)
+    all_maxs = np.array([MAXS[k] for k in LABELS], dtype=np.double)
+    widths = np.divide( np.array(all_maxs) - np.array(all_mins), num_buckets)
+    encoder = StateEncoder(LABELS, MINS, MAXS, BUCKETS,
+            freq_to_bucket if FREQ_IN_STATE else None, FREQS)
+    # Q function backend (see q_backends); states are qtable.encode(stats):
+    Q = Qf = C = Cf = None
+    if Q_BACKEND == 'sparse':
+        qtable = SparseQ(ACTIONS, Q_MEMORY_BUDGET, encoder, dtype=Q_DTYPE)
+    elif Q_BACKEND == 'tile':
+        features = LABELS + (['freq'] if FREQ_IN_STATE else [])
+        qtable = TileQ(features, dict(MINS, freq=big_freqs_base[0]),
+                dict(MAXS, freq=big_freqs_base[-1]), dict(BUCKETS, freq=FREQS),
+                TILINGS, TILE_SIZE, ACTIONS, grid=encoder, dtype=Q_DTYPE)
+    else:
+        qtable = DenseQ(dims, encoder, dtype=Q_DTYPE)
+        # The dense table, and Q as (states, actions):
+        Q = qtable.Q
+        Qf = qtable.Qf
+        # Note: C is no longer used to keep track of exact counts, but if a state action has been seen ever.
+        C = np.zeros( dims, dtype=np.uint8 )
+        Cf = C.reshape(-1, ACTIONS)
+build_tables()
 
-num_buckets = np.array([BUCKETS[k] for k in LABELS], dtype=np.double)
-if FREQ_IN_STATE:
-    dims = [int(b) for b in num_buckets] + [FREQS] + [ACTIONS]  
-else:
-    dims = [int(b) for b in num_buckets] + [ACTIONS]
-print(dims)
-Q = np.zeros( dims ) 
-# Note: C is no longer used to keep track of exact counts, but if a state action has been seen ever.
-C = np.zeros( dims ) 
-# For bucketing stats:
-all_mins = np.array([MINS[k] for k in LABELS], dtype=np.double)
-all_maxs = np.array([MAXS[k] for k in LABELS], dtype=np.double)
-widths = np.divide( np.array(all_maxs) - np.array(all_mins), num_buckets)
 # VVF values and max IPS for reward_func:
 # Note in this dict the freqs are in GHz, but elsewhere in this code they are KHz.
 fslist = [f for f in vvf_dict.keys()]
@@ -52,36 +139,115 @@ print(IPS_max)
 ###########################################################################
 # State-Action value space checkpointing and system initialization:
 
-def checkpoint_statespace():
-    global Q
-    yn = str(raw_input("Save statespace? (y/n)") ).lower()
-    while yn != 'y' and yn != 'n':
-        yn = str(raw_input("Enter y/n: ")).lower()
-    if yn == 'n':
-        return
+'''
+Checkpoint file of the configured Q backend.
+'''
+def statespace_file():
     ms_period = int(PERIOD*1000)
-    np.save("Q_{}ms.npy".format(ms_period), Q)
-    #np.save("C_{}ms.npy".format(ms_period), C)
+    return "Q_{}ms.{}".format(ms_period, "npy" if Q_BACKEND == 'dense' else "npz")
 
-def load_statespace():
-    global Q, C
-    ms_period = int(PERIOD*1000)
-    try:
-        Q_t = np.load("Q_{}ms.npy".format(ms_period))
-        #C_t = np.load("C_{}ms.npy".format(ms_period))
-    except:
+def visits_file():
+    return "C_{}ms.npy".format(int(PERIOD*1000))
+
+def meta_file():
+    return "Q_{}ms.json".format(int(PERIOD*1000))
+
+'''
+Parameters that define the state space and the meaning of the Q values.
+'''
+def state_config():
+    config = {
+        'LABELS': LABELS, 'BUCKETS': BUCKETS, 'MINS': MINS, 'MAXS': MAXS,
+        'FREQ_IN_STATE': FREQ_IN_STATE, 'big_freqs': big_freqs, 'ACTIONS': ACTIONS,
+        'Q_BACKEND': Q_BACKEND,
+        }
+    if Q_BACKEND == 'tile':
+        config.update({'TILINGS': TILINGS, 'TILE_SIZE': TILE_SIZE})
+    return config
+
+'''
+Keys of state_config() whose value differs in saved (a stored configuration).
+'''
+def config_changes(saved):
+    current = json.loads(json.dumps(state_config(), default=ckpt.to_json))
+    return [k for k, v in current.items() if saved.get(k, v) != v]
+
+def checkpoint_meta():
+    config = state_config()
+    config.update({
+        'PERIOD': PERIOD, 'dims': dims, 'Q_DTYPE': Q_DTYPE,
+        'FREQ_STEP': FREQ_STEP, 'big_freqs_base': big_freqs_base,
+        'edges': {k: all_mins[j] + widths[j] * np.arange(num_buckets[j] + 1)
+            for j, k in enumerate(LABELS)},
+        'ALPHA': ALPHA, 'GAMMA': GAMMA, 'EPSILON': EPSILON,
+        'TRACE_LAMBDA': TRACE_LAMBDA, 'LAMBDA': LAMBDA, 'RHO': RHO, 'THERMAL_LIMIT': THERMAL_LIMIT,
+        })
+    return {'step': trained_steps, 'time': time.time(), 'config': config,
+            'rng': ckpt.rng_state()}
+
+'''
+Queue a checkpoint of Q, C and the metadata on the background writer; with
+wait, return once it is on disk.
+'''
+def checkpoint_statespace(wait=True):
+    global checkpointer
+    if checkpointer is None:
+        checkpointer = Checkpointer(statespace_file(), visits_file(), meta_file())
+    checkpointer.save(qtable, C, checkpoint_meta(), trained_steps)
+    if wait:
+        checkpointer.flush()
+
+'''
+The dense checkpoint is memory-mapped rather than read: copy-on-write ('c')
+for training, read-only ('r') for run mode (see DenseQ.load). A dense
+checkpoint whose metadata shows another state space configuration is
+remapped onto the current one in memory.
+'''
+def load_statespace(mmap_mode='c'):
+    global Q, Qf, C, Cf, trained_steps
+    path = statespace_file()
+    if not os.path.exists(path):
         raise Exception("Could not read previous statespace")
-        return
-    if Q_t.shape != Q.shape:
-        raise Exception("Mismatched loaded state space to desired statespace.")
+    meta = ckpt.load_meta(meta_file()) if os.path.exists(meta_file()) else None
+    changed = []
+    if meta is not None:
+        saved = meta['config']
+        changed = config_changes(saved)
+    if changed:
+        if Q_BACKEND != 'dense' or saved.get('Q_BACKEND', 'dense') != 'dense':
+            raise Exception("Mismatched loaded state space to desired statespace ({}).".format(
+                    ", ".join(changed)))
+        # Remap the old table onto the current grid (see migrate_q):
+        visits = np.load(visits_file()) if os.path.exists(visits_file()) else None
+        Q_old = np.load(path, mmap_mode='r')
+        if visits is not None and visits.shape != Q_old.shape:
+            visits = None
+        Q_new, covered = migrate_q.migrate(Q_old, saved, state_config(), big_freqs_base, visits)
+        qtable.Q[...] = Q_new
+        # States that got values count as visited, with every action:
+        C[...] = covered[..., None]
+        print("Migrated statespace {} -> {} ({} changed; {} of {} states covered)".format(
+                saved.get('dims'), dims, ", ".join(changed), int(covered.sum()), covered.size))
     else:
-        Q = Q_t
+        # Raises on a mismatched shape:
+        qtable.load(path, mmap_mode=mmap_mode)
+    if Q_BACKEND == 'dense':
+        Q = qtable.Q
+        Qf = qtable.Qf
+        if not changed and os.path.exists(visits_file()):
+            C_t = np.load(visits_file())
+            if C_t.shape == C.shape:
+                C = C_t.astype(np.uint8)
+                Cf = C.reshape(-1, ACTIONS)
+    if meta is not None:
+        trained_steps = meta['step']
+        ckpt.set_rng_state(meta['rng'])
 
 def init():
     # Make sure perf counter module is loaded:
     process = subprocess.Popen(['lsmod'], stdout=subprocess.PIPE)
     output, err = process.communicate()
-    loaded = "perfmod" in output
+    loaded = b"perfmod" in output
     if not loaded:
         print("WARNING: perf-counters module not loaded. Loading...")
         process = subprocess.Popen(['sudo', 'insmod', 'perfmod.ko'])
@@ -92,6 +258,61 @@ def init():
     print("Running with period: {} ms".format(ms_period))       
     # Set userspace on the big cluster:
     dvfs.setUserSpace(4)
+    # Cache the big cluster OPP table and start the frequency writer:
+    global actuator
+    actuator = FreqActuator(4, dvfs.setClusterFreq, dvfs.getAvailFreqs(4))
+    # Sample the thermal zones once per period for every consumer. Runner
+    # processes are forked later and read the same shared block.
+    global sensors
+    sensors = SensorHub(dvfs.getTemps, PERIOD)
+    sensors.start()
+
+'''
+Replace the board interfaces with a stand-in backend (trace replay or
+simulator) so the unchanged bucketing, reward and Q update code runs off the
+board. The backend provides get_raw_state(cpu), register_watcher(cpu),
+wait_for_sample(cpu) and the devfreq_utils calls used here (getClusterFreq,
+setClusterFreq, getTemps, getAvailFreqs).
+'''
+def use_backend(backend):
+    global dvfs, get_raw_state, register_watcher, wait_for_sample
+    global actuator, sensors
+    dvfs = backend
+    get_raw_state = backend.get_raw_state
+    register_watcher = backend.register_watcher
+    wait_for_sample = backend.wait_for_sample
+    sensors = None
+    actuator = FreqActuator(4, backend.setClusterFreq, backend.getAvailFreqs(4), threaded=False)
+
+'''
+Override state space parameters for this process, e.g.
+    configure({'ALPHA': 0.2, 'FREQ_STEP': 3, 'BUCKETS': {'temp': 8}})
+BUCKETS, MINS and MAXS are merged with the current values. The frequency
+tables, bucketing tables, a fresh Q and C, and the loop timer, log and trace
+layouts are rebuilt from the result.
+Sweep workers and other off-board runs configure their own copy of this
+module instead of editing state_space_params.
+'''
+def configure(params):
+    global BUCKETS, MINS, MAXS
+    global big_freqs, FREQS, ACTIONS, freq_to_bucket, VARS
+    params = dict(params)
+    for name in ('BUCKETS', 'MINS', 'MAXS'):
+        if name in params:
+            merged = dict(globals()[name])
+            merged.update(params.pop(name))
+            globals()[name] = merged
+    globals().update(params)
+    big_freqs = big_freqs_base[0::FREQ_STEP]
+    FREQS = len(big_freqs)
+    ACTIONS = FREQS
+    freq_to_bucket = {big_freqs_base[i]:i//FREQ_STEP for i in range(len(big_freqs_base))}
+    VARS = len(LABELS) + FREQ_IN_STATE
+    build_tables()
+    build_batch_tables()
+    if rlog.running:
+        rlog.stop()
+    build_layouts()
 
 ###########################################################################
 
@@ -100,18 +321,20 @@ def init():
 ###########################################################################
 # Interfacing functions to sysfs endpoints for performance kernel module:
 
+# Counter attribute paths are built once so every read hits the persistent
+# descriptor cached by the sysfs reader.
+counter_paths = {}
 def get_counter_value(cpu_num, attr_name):
-    with open("/sys/kernel/performance_counters/cpu{}/{}".format(cpu_num, attr_name), 
-                'r') as f:
-        val = float(f.readline().strip())
-    return val
+    path = counter_paths.get((cpu_num, attr_name))
+    if path is None:
+        path = sfs.fn_perf_counter.format(cpu_num, attr_name)
+        counter_paths[(cpu_num, attr_name)] = path
+    return float(sfr.read_int(path))
 
 
 def set_period(p):
     for cpu_num in range(4,8):
-        with open("/sys/kernel/performance_counters/cpu{}/sample_period_ms".format(cpu_num), 
-                'w') as f:
-            f.write("{}\n".format(p))
+        sfr.write_int(sfs.fn_perf_sample_period.format(cpu_num), p)
 
 '''
 Basically barrier on the counter update being performed by the kernel module.
@@ -124,6 +347,39 @@ def synch_to_counter_update(cpu_num):
         while int(f.readline().strip() == val):
             continue
 
+'''
+Register for the kernel module's per-sample sysfs_notify on this core.
+'''
+def register_watcher(cpu):
+    watchers[cpu-4] = select.poll()
+    watcher_files[cpu-4] = open(sfs.fn_perf_counter.format(cpu, "data_memory_accesses"), 'r')
+    watchers[cpu-4].register(watcher_files[cpu-4], select.POLLPRI | select.POLLERR )
+
+'''
+Block until the kernel module publishes the next sample for this core.
+The attribute is read right after waking, which arms the watcher for the
+following sample, so sample_ready() sees it as soon as it is published.
+'''
+def wait_for_sample(cpu):
+    watchers[cpu-4].poll()
+    watcher_files[cpu-4].read()
+    watcher_files[cpu-4].seek(0)
+
+'''
+True if the next sample for this core was published since the last wait.
+'''
+def sample_ready(cpu):
+    return len(watchers[cpu-4].poll(0)) > 0
+
+'''
+Latest temperatures from the sensor hub, or straight from sysfs if the hub
+is not running.
+'''
+def get_temps():
+    if sensors is not None:
+        return sensors.get_temps()
+    return [float(x) for x in dvfs.getTemps()]
+
 ###########################################################################
 
 
@@ -147,7 +403,9 @@ def get_raw_state(cpu):
     instructions = get_counter_value(cpu, "instructions_retired")
     l2misses = get_counter_value(cpu, "l2_data_refills")
     dmemaccesses = 0.0 #get_counter_value(cpu, "data_memory_accesses")
-    T = [float(x) for x in dvfs.getTemps()]
+    timer.mark(lt.COUNTERS)
+    T = get_temps()
+    timer.mark(lt.SENSORS)
     # Throughput stats:
     IPC_u = instructions / cycles_used
     IPC_p = instructions / cycles_possible
@@ -157,6 +415,10 @@ def get_raw_state(cpu):
     DAPKI = dmemaccesses / (instructions / 1000.0)
     # Collect all possible state:
     all_stats = {
+        'cycles':cycles_used,
+        'instructions':instructions,
+        'bmisses':bmisses,
+        'l2misses':l2misses,
         'BMPKI':BMPKI, 
         'IPC_u':IPC_u, 
         'IPC_p':IPC_p, 
@@ -170,6 +432,71 @@ def get_raw_state(cpu):
         }
     return all_stats
 
+'''
+Preallocated per-core record for the whole big cluster, one row per core 4-7.
+Field names match the keys of get_raw_state() so a row can be passed straight
+to bucket_state() and reward_func().
+'''
+CLUSTER_CPUS = [4, 5, 6, 7]
+cluster_stats_dtype = np.dtype([
+    ('cycles', np.double),
+    ('instructions', np.double),
+    ('bmisses', np.double),
+    ('l2misses', np.double),
+    ('freq', np.double),
+    ('volt', np.double),
+    ('temp', np.double),
+    ('IPC_u', np.double),
+    ('IPC_p', np.double),
+    ('IPS', np.double),
+    ('MPKI', np.double),
+    ('BMPKI', np.double),
+    ('DAPKI', np.double),
+    ('usage', np.double),
+    ])
+cluster_stats = np.zeros(len(CLUSTER_CPUS), dtype=cluster_stats_dtype)
+# Field views and scratch space are created once and reused every sample:
+cs = {name:cluster_stats[name] for name in cluster_stats_dtype.names}
+cs_kinstructions = np.zeros(len(CLUSTER_CPUS))
+snapshot_paths = [ [sfs.fn_perf_counter.format(cpu, attr) for attr in
+        ("cycles", "instructions_retired", "branch_mispredictions", "l2_data_refills")]
+        for cpu in CLUSTER_CPUS ]
+
+'''
+Sample counters, cluster frequency and temperatures for all big cores into the
+preallocated cluster_stats record and compute the derived features for all
+rows in one vectorized pass. Returns cluster_stats, which is overwritten by the
+next call.
+'''
+def snapshot_cluster():
+    cycles, instructions = cs['cycles'], cs['instructions']
+    bmisses, l2misses = cs['bmisses'], cs['l2misses']
+    for i, paths in enumerate(snapshot_paths):
+        cycles[i] = sfr.read_int(paths[0])
+        instructions[i] = sfr.read_int(paths[1])
+        bmisses[i] = sfr.read_int(paths[2])
+        l2misses[i] = sfr.read_int(paths[3])
+    # The big cluster shares one clock (and rail):
+    cpu_freq = dvfs.getClusterFreq(CLUSTER_CPUS[0])
+    cs['freq'][:] = cpu_freq
+    cs['volt'][:] = tm.big_f_to_v_MC1[float(cpu_freq) / 1000000]
+    timer.mark(lt.COUNTERS)
+    T = get_temps()
+    cs['temp'][:] = T[0:len(CLUSTER_CPUS)]
+    timer.mark(lt.SENSORS)
+    # Derived stats, same definitions as get_raw_state():
+    cycles_possible = float(cpu_freq * 1000 * PERIOD)
+    np.divide(instructions, cycles, out=cs['IPC_u'])
+    np.divide(instructions, cycles_possible, out=cs['IPC_p'])
+    np.divide(instructions, PERIOD, out=cs['IPS'])
+    np.divide(instructions, 1000.0, out=cs_kinstructions)
+    np.divide(l2misses, cs_kinstructions, out=cs['MPKI'])
+    np.divide(bmisses, cs_kinstructions, out=cs['BMPKI'])
+    # data_memory_accesses is reserved for sysfs_notify, see get_raw_state():
+    cs['DAPKI'][:] = 0.0
+    np.divide(cycles, cycles_possible, out=cs['usage'])
+    return cluster_stats
+
 '''
 Place state in 'bucket' given min/max values and number of buckets for each value.
 Use bucket width to determine index of each raw state value after scaling values on linear or log scale.
@@ -191,10 +518,47 @@ def bucket_state(raw):
     # Convert floats to integer bucket indices and return:
     return [int(x) for x in state]
 
-''' 
-Reward function: Performance, Power, and Thermal-aware.
 '''
-def reward_func(stats, new_freq):
+Vectorized bucket_state() for a batch of stats records (e.g. the rows of
+cluster_stats, or a dict of per-sample arrays). Returns an int array with one
+state per row, bucketed exactly as bucket_state() would. Scratch space is
+reused between calls of up to len(CLUSTER_CPUS) rows; the result is
+overwritten by the next call.
+'''
+def build_batch_tables():
+    global batch_raw, batch_states, freq_bucket_lut
+    batch_raw = np.zeros((len(CLUSTER_CPUS), len(LABELS)))
+    batch_states = np.zeros((len(CLUSTER_CPUS), VARS), dtype=np.intp)
+    # freq_to_bucket indexed by frequency in 100 MHz steps:
+    freq_bucket_lut = np.zeros(big_freqs_base[-1] // 100000 + 1, dtype=np.intp)
+    for f in big_freqs_base:
+        freq_bucket_lut[f // 100000] = int(freq_to_bucket[f])
+build_batch_tables()
+def bucket_states(rows):
+    n = len(rows['freq'])
+    if n <= len(batch_raw):
+        raw = batch_raw[:n]
+        states = batch_states[:n]
+    else:
+        raw = np.zeros((n, len(LABELS)))
+        states = np.zeros((n, VARS), dtype=np.intp)
+    for j, k in enumerate(LABELS):
+        raw[:, j] = rows[k]
+    np.clip(raw, all_mins, all_maxs, out=raw)
+    np.subtract(raw, all_mins, out=raw)
+    np.divide(raw, widths, out=raw)
+    np.clip(raw, 0, num_buckets-1, out=raw)
+    states[:, :len(LABELS)] = raw
+    if FREQ_IN_STATE:
+        states[:, -1] = freq_bucket_lut[ np.asarray(rows['freq']).astype(np.intp) // 100000 ]
+    return states
+
+'''
+Reward terms for one stats record or, elementwise, for arrays of stats (e.g.
+a whole trace). Returns vvf_n, throughput reward, power penalty, thermal
+penalty and the overall reward.
+'''
+def reward_terms(stats):
     global RHO, LAMBDA # <-- From state space params module.
     global IPS_max, VVF_min, VVF_max, vvf_dict
     global THERMAL_LIMIT
@@ -204,106 +568,212 @@ def reward_func(stats, new_freq):
     freq = stats['freq'] #new_freq
     volts = stats['volt'] #vvf_dict[new_freq / 1000000.0] 
     # VVF and power:
-    vvf = (volts ** 2) * float(freq)
+    vvf = (volts ** 2) * freq
     vvf_n = ( vvf - VVF_min) / VVF_min
     power_penalty = LAMBDA * vvf_n
-    # Thermal term:
-    thermal_v = max(temp - THERMAL_LIMIT, 0.0)
+    # Thermal term (max(temp - THERMAL_LIMIT, 0) that also works on arrays):
+    thermal_v = (temp - THERMAL_LIMIT) * (temp > THERMAL_LIMIT)
     thermal_penalty = RHO * thermal_v * ( vvf / VVF_max )
     # Throughput:
     thpt_reward = IPS / IPS_max
-    # Debug printouts:
-    print("VVFn:",vvf_n)
-    print("IPSn:",thpt_reward)
-    print("Power Penalty:",power_penalty)
-    print("Thermal Penalty:",thermal_penalty)
     # Return overall reward:
     reward = thpt_reward - power_penalty - thermal_penalty
+    return vvf_n, thpt_reward, power_penalty, thermal_penalty, reward
+
+''' 
+Reward function: Performance, Power, and Thermal-aware.
+'''
+def reward_func(stats, new_freq):
+    vvf_n, thpt_reward, power_penalty, thermal_penalty, reward = reward_terms(stats)
+    if rlog.on[ring_log.REWARD]:
+        rlog.record(ring_log.REWARD, vvf_n, thpt_reward, power_penalty, thermal_penalty, reward)
     return reward
 
 
+'''
+Fill row (a list of len(trace_columns), e.g. trace_buf) with one trace row, in
+trace_columns order, and return it. The reward (and updated Q value) on a row
+belong to the transition that ended at that row's state.
+'''
+def trace_row(row, stats, state, action, reward, q):
+    row[0] = lt.now_ns()
+    row[1] = stats['cycles']
+    row[2] = stats['instructions']
+    row[3] = stats['bmisses']
+    row[4] = stats['l2misses']
+    row[5] = stats['freq'] // 1000
+    row[6] = stats['temp']
+    row[7] = stats['IPC_u']
+    row[8] = stats['IPC_p']
+    row[9] = stats['MPKI']
+    row[10] = stats['BMPKI']
+    row[11] = stats['usage']
+    row[12] = stats['IPS']
+    i = 13
+    for v in state:
+        row[i] = v
+        i += 1
+    row[i] = action
+    row[i + 1] = reward
+    row[i + 2] = q
+    return row
+
+
 # Greedy Q-Learning Update
 # Given previous and last state, action and reward between them (one-step), update
-# based on greedy policy.
+# based on greedy policy. States are keys from qtable.encode().
 def update_Q_off_policy(last_state, last_action, reward, state):
-    global Q, GAMMA, ALPHA
+    global qtable, GAMMA, ALPHA
     # Follow greedy policy at new state to determine best action:
-    best_next_return = np.max(Q[ tuple(state) ] )
+    best_next_return = qtable.max(state)
     # Total return:
     total_return = reward + GAMMA*best_next_return
     # Update last_state estimate:
-    old_value = Q[ tuple(last_state + [last_action] ) ]
-    Q[ tuple(last_state + [last_action] ) ] = old_value + ALPHA*(total_return - old_value) 
-    return Q[ tuple(last_state + [last_action] ) ]
+    return qtable.update(last_state, last_action, total_return, ALPHA)
+
+'''
+Record in C that action a was taken in state s (dense Q only).
+'''
+def mark_visited(s, a):
+    if Cf is not None:
+        Cf[s, a] = 1
+
+'''
+Training setup shared by Q_learning() and Q_learning_async(). On the board:
+load the statespace, start periodic checkpoints (and a final one at exit),
+the control loop log and the trace recorder. Otherwise silence the log.
+'''
+def start_training(board):
+    global checkpointer, recorder
+    if board:
+        # Take care of statespace checkpoints:
+        try:
+            load_statespace()
+            print("Loaded statespace ({} steps)".format(trained_steps))
+        except Exception as e:
+            print("Could not load statespace; continue with fresh.", e)
+        checkpointer = Checkpointer(statespace_file(), visits_file(), meta_file(),
+                CHECKPOINT_STEPS, CHECKPOINT_S)
+        checkpointer.last_step = trained_steps
+        atexit.register(cleanup, checkpoint=True)
+        # Let kill/systemd stops run the final checkpoint too:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        rlog.start()
+        if TRACE:
+            recorder = TraceRecorder(TRACE_DIR.format(int(PERIOD*1000)), trace_columns)
+    else:
+        rlog.on = [False] * len(rlog.on)
 
 '''
 Q-learning driver function. Uses global state space LUTs (Q, C) to hold
 state-action value estimates and state-action counts. 
 On call tries to load previous state space value estimates and counts; 
 if unsuccessful starts from all 0s.
+Runs forever unless a number of steps is given. With board=False (trace
+replay, simulation) the statespace is neither loaded nor checkpointed and
+the loop is not logged or traced.
+followers: other cores whose transitions are learned from too (train all,
+see follow_core()). On the board each runs in its own process updating the
+shared Q; off the board they are stepped in this loop.
 '''
-def Q_learning(cpu):
+def Q_learning(cpu, steps=None, board=True, followers=()):
     global num_buckets
     global big_freqs
     global Q, EPSILON
+    global trained_steps
     
-    # Take care of statespace checkpoints:
-    try:
-        load_statespace()
-        print("Loaded statespace")
-    except:
-        print("Could not load statespace; continue with fresh.")
-    atexit.register(cleanup, checkpoint=True)
+    start_training(board)
+    if followers:
+        # Hogwild: every core updates the one shared Q without locks.
+        share_Q()
+        counts = al.SharedArray((len(followers),), np.int64).array
+        counted = 0
+        follower_states = [None] * len(followers)
+        if board:
+            for i, core in enumerate(followers):
+                runners[core-4] = al.fork_process(run_follower, (core, counts, i))
+    # Q(lambda) eligibility trace over the (loaded) dense table:
+    trace = None
+    if TRACE_LAMBDA:
+        if Qf is None:
+            raise Exception("Q(lambda) needs the dense Q backend.")
+        trace = EligibilityTrace(Qf, GAMMA*TRACE_LAMBDA, TRACE_LEN)
+    # Experience replay in the idle part of each period (dense Q only):
+    replay = ReplayBuffer(REPLAY_SIZE) if REPLAY_SIZE and Qf is not None else None
+    replay_window_ns = int((PERIOD - REPLAY_MARGIN) * 1000000000)
+    t_wake = lt.now_ns()
     
     # Init runtime vars:
     last_action = None
     last_state = None
     reward = None
+    q = 0.0
     bounded_freq_index=0
     cur_freq_index=0
     # Synchronize to kernel sampler:
     #synch_to_counter_update(cpu)
-    # Register inotify event with linux kernel:
-    watchers[cpu-4] = select.poll()
-    watcher_files[cpu-4] = open("/sys/kernel/performance_counters/cpu{}/data_memory_accesses".format(cpu), 'r')
-    watchers[cpu-4].register(watcher_files[cpu-4], select.POLLPRI | select.POLLERR )
+    register_watcher(cpu)
+    timer.install_signal()
+    timer.start()
+    step = 0
     # Learn forever:
-    while True:
-        start = time.time()
-        
+    while steps is None or step < steps:
+        step += 1
+        # Followers sample the period that just ended before this core acts:
+        if followers and not board:
+            for i, core in enumerate(followers):
+                follower_states[i] = follow_core(core, follower_states[i])
+                counts[i] += 1
         # get current state and reward from last iteration:
         stats = get_raw_state(cpu)
-        state = bucket_state(stats)
+        state = qtable.encode(stats)
+        timer.mark(lt.BUCKET)
         
         # Update state-action-reward trace:
         if last_action is not None:
-            print("Prev state and action taken:")
-            print([last_stats[k] for k in LABELS] + [last_stats['freq']])
-            print(last_state, last_action)
             reward = reward_func(stats, big_freqs[last_action]) 
-            print("Results (Reward):",reward)
-            update_Q_off_policy(last_state, last_action, reward, state)
-            print()
+            if trace is not None:
+                q = trace.update(last_state, last_action, reward, state, ALPHA, GAMMA)
+            else:
+                q = update_Q_off_policy(last_state, last_action, reward, state)
+            mark_visited(last_state, last_action)
+            if replay is not None:
+                replay.add(last_state, last_action, reward, state)
+            if rlog.on[ring_log.TRANSITION]:
+                rlog.record(ring_log.TRANSITION,
+                        *([last_stats[k] for k in LABELS] + [last_stats['freq']]
+                        + qtable.decode(last_stats, last_state) + [last_action, reward, q]))
         else:
             reward = reward_func(stats, big_freqs[0]) 
+        timer.mark(lt.UPDATE)
 
 
         # Apply EPSILON randomness to select a random frequency:
         if random.random() < EPSILON:
             best_action = random.randint(0, ACTIONS-1)
+            # Watkins Q(lambda): no credit across non-greedy actions.
+            if trace is not None and best_action != qtable.argmax(state):
+                trace.cut()
         # Or greedily select the best frequency to use given past experience:
         else:
-            best_action = np.argmax(Q[ tuple(state) ])
+            best_action = qtable.argmax(state)
             '''
             # Note: numpy's argmax sensibly returns the lowest value if all have the same
             # value. Therefore, when we have all the same, behavior should really be random.
             if C[ tuple(state + [best_action]) ] == 0:
                 best_action = random.randint(0, ACTIONS-1)
             '''
+        timer.mark(lt.ARGMAX)
         # Take action.
         # (note big_freqs is lookup table from state_space module).
         # Also counter increment is performed in Q off policy update function.
-        dvfs.setClusterFreq(cpu, big_freqs[best_action])
+        actuator.request(big_freqs[best_action])
+        timer.mark(lt.ACTUATE)
+        decision_ns = timer.decided()
+        if rlog.on[ring_log.TIMING]:
+            rlog.record(ring_log.TIMING, decision_ns / 1000.0)
+        if recorder is not None:
+            recorder.append(trace_row(trace_buf, stats, qtable.decode(stats, state), best_action, reward, q))
         '''     
         if ACTIONS == FREQS:
             dvfs.setClusterFreq(4, big_freqs[best_action])
@@ -318,20 +788,192 @@ def Q_learning(cpu):
         last_state = state
         last_action = best_action
         last_stats = stats
-        '''
-        C[ tuple(state + [best_action]) ] += 1 
-        '''
+        trained_steps += 1
+        if followers:
+            total = int(counts.sum())
+            trained_steps += total - counted
+            counted = total
+        if checkpointer is not None and checkpointer.due(trained_steps):
+            checkpoint_statespace(wait=False)
+
+        # Replay past transitions until shortly before the next sample:
+        if replay is not None:
+            if board:
+                replay.replay_until(Qf, REPLAY_BATCH, ALPHA, GAMMA, t_wake + replay_window_ns,
+                        lambda: sample_ready(cpu))
+            else:
+                for i in range(REPLAY_OFFBOARD):
+                    replay.replay(Qf, REPLAY_BATCH, ALPHA, GAMMA)
+            timer.mark(lt.REPLAY)
 
         # Wait for next period. Note that reward cannot be evaluated 
         # at least until the period has expired.
-        elapsed = time.time() - start
-        print("Elapsed:",elapsed)
-        #time.sleep(max(0, PERIOD - elapsed))
-        watcher_files[cpu-4].read()
-        watcher_files[cpu-4].seek(0)
-        res = watchers[cpu-4].poll()
-        end = time.time()
-        print("Total:",end-start)
+        wait_for_sample(cpu)
+        t_wake = lt.now_ns()
+        timer.mark(lt.WAIT)
+
+'''
+Move the dense Q and the visit table C into memory shared with processes
+forked afterwards.
+'''
+def share_Q():
+    global Q, Qf, C, Cf
+    if Qf is None:
+        raise Exception("Sharing Q between processes needs the dense Q backend.")
+    shared = al.SharedArray(Q.shape, Q.dtype)
+    shared.array[...] = Q
+    qtable.Q = Q = shared.array
+    qtable.Qf = Qf = Q.reshape(-1, ACTIONS)
+    shared = al.SharedArray(C.shape, C.dtype)
+    shared.array[...] = C
+    C = shared.array
+    Cf = C.reshape(-1, ACTIONS)
+
+'''
+Learn from one sample of a core that does not choose the frequency (a train
+all follower). Q-learning is off-policy, so the action of the transition is
+simply the cluster frequency that was in effect, read with the sample,
+whichever core chose it. Returns the state, the start of the next transition.
+'''
+def follow_core(cpu, last_state):
+    stats = get_raw_state(cpu)
+    state = qtable.encode(stats)
+    if last_state is not None:
+        action = int(freq_bucket_lut[int(stats['freq']) // 100000])
+        update_Q_off_policy(last_state, action, reward_func(stats, big_freqs[action]), state)
+        mark_visited(last_state, action)
+    return state
+
+'''
+Follower process of train all: learn from every sample of this core until
+terminated. Runs on LEARNER_CPU so it takes no time from the cores it
+watches; counts[i] is the number of samples learned from.
+'''
+def run_follower(cpu, counts, i):
+    global recorder, checkpointer
+    rlog.on = [False] * len(rlog.on)
+    recorder = None
+    checkpointer = None
+    if LEARNER_CPU is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [LEARNER_CPU])
+    register_watcher(cpu)
+    state = None
+    while True:
+        wait_for_sample(cpu)
+        state = follow_core(cpu, state)
+        counts[i] += 1
+
+'''
+Write the records waiting in unlogged (see Q_learning_async()), in order, up
+to the first whose transition the learner has not applied yet. Applied
+transitions get the updated Q the learner published in the ring. Written
+trace rows go back to free_rows for reuse.
+'''
+def flush_unlogged(ring, unlogged, free_rows):
+    tail = int(ring.ctr[1])
+    while unlogged:
+        seq, fields, row, q = unlogged[0]
+        if seq is not None:
+            if seq >= tail:
+                break
+            q = float(ring.q[seq % ring.capacity])
+        unlogged.popleft()
+        if fields is not None:
+            rlog.record(ring_log.TRANSITION, *(fields + [q]))
+        if row is not None:
+            row[-1] = q
+            recorder.append(row)
+            free_rows.append(row)
+
+'''
+Q_learning() split into an actor (this loop: encode, argmax, actuate) and a
+learner process on LEARNER_CPU that applies the updates (see actor_learner).
+The dense Q is moved into shared memory, where the learner writes and the
+actor reads it. The reward, log and trace of each period are handled after
+actuating, so the decision latency does not depend on the learning work.
+'''
+def Q_learning_async(cpu, steps=None, board=True):
+    global trained_steps
+    if Qf is None:
+        raise Exception("The actor/learner split needs the dense Q backend.")
+    start_training(board)
+    share_Q()
+    ring = al.TransitionRing(TRANSITION_RING)
+    learner = al.start_learner(ring, Qf, ALPHA, GAMMA, TRACE_LAMBDA, TRACE_LEN,
+            REPLAY_SIZE, REPLAY_BATCH, PERIOD - REPLAY_MARGIN, LEARNER_CPU)
+    # Registered after cleanup, so it runs first and the final checkpoint
+    # has the learner's last updates:
+    atexit.register(al.stop_learner, ring, learner)
+
+    last_action = None
+    last_state = None
+    # Log fields and trace rows waiting for the learner to apply their
+    # transition, as (ring sequence number, fields, row, Q); their Q column
+    # is the updated value it publishes, as in Q_learning(). Records without
+    # a pushed transition (None) keep the Q they were queued with. Trace rows
+    # are recycled through free_rows once written, so after the first few
+    # periods no row is allocated.
+    unlogged = collections.deque()
+    free_rows = []
+    register_watcher(cpu)
+    timer.install_signal()
+    timer.start()
+    step = 0
+    while steps is None or step < steps:
+        step += 1
+        stats = get_raw_state(cpu)
+        state = qtable.encode(stats)
+        timer.mark(lt.BUCKET)
+        best_action = qtable.argmax(state)
+        explore = False
+        if random.random() < EPSILON:
+            action = random.randint(0, ACTIONS-1)
+            explore = action != best_action
+            best_action = action
+        timer.mark(lt.ARGMAX)
+        actuator.request(big_freqs[best_action])
+        timer.mark(lt.ACTUATE)
+        decision_ns = timer.decided()
+
+        # Off the decision path: hand the last transition to the learner.
+        flush_unlogged(ring, unlogged, free_rows)
+        fields = row = None
+        if last_action is not None:
+            reward = reward_func(stats, big_freqs[last_action])
+            pushed = ring.push(last_state, last_action, reward, state, explore)
+            mark_visited(last_state, last_action)
+            if rlog.on[ring_log.TRANSITION]:
+                fields = [last_stats[k] for k in LABELS] + [last_stats['freq']] \
+                        + qtable.decode(last_stats, last_state) + [last_action, reward]
+        else:
+            reward = reward_func(stats, big_freqs[0])
+            pushed = False
+        if rlog.on[ring_log.TIMING]:
+            rlog.record(ring_log.TIMING, decision_ns / 1000.0)
+        if recorder is not None:
+            row = free_rows.pop() if free_rows else [0] * len(trace_columns)
+            trace_row(row, stats, qtable.decode(stats, state), best_action, reward, 0.0)
+        if pushed and (fields is not None or row is not None):
+            unlogged.append((ring.head - 1, fields, row, None))
+        elif fields is not None or row is not None:
+            # First step, or a dropped transition the learner never applies:
+            q = float(Qf[last_state, last_action]) if last_action is not None else 0.0
+            unlogged.append((None, fields, row, q))
+        last_state = state
+        last_action = best_action
+        last_stats = stats
+        trained_steps += 1
+        if checkpointer is not None and checkpointer.due(trained_steps):
+            checkpoint_statespace(wait=False)
+        timer.mark(lt.UPDATE)
+
+        wait_for_sample(cpu)
+        timer.mark(lt.WAIT)
+    if not board:
+        al.stop_learner(ring, learner)
+        flush_unlogged(ring, unlogged, free_rows)
+    if ring.dropped:
+        print("Transitions dropped (learner behind):", ring.dropped)
 
 
 ###########################################################################
@@ -343,117 +985,113 @@ def Q_learning(cpu):
 '''
 Use global lookup table (LUT) Q to select best action based on quantized state.
 This implementation applies learned Q 'function' to core 4 only.
+The greedy actions come from the compiled policy table loaded by try_load(),
+or from the sparse or tile-coded Q function.
 '''
-def run_offline(cpu, requested_freqs_array):
+def run_offline(cpu, arbiter=None):
     print("Started offline policy on core", cpu)
     global Q
     global big_freqs
-    global watchers, watcher_files,requested_freqs
-    global lock
+    global watchers, watcher_files
     # Synchronize to kernel sampler:
     #synch_to_counter_update(cpu)
-    # Register inotify event with linux kernel:
-    watchers[cpu-4] = select.poll()
-    watcher_files[cpu-4] = open("/sys/kernel/performance_counters/cpu{}/data_memory_accesses".format(cpu), 'r')
-    watchers[cpu-4].register(watcher_files[cpu-4], select.POLLPRI | select.POLLERR )
+    register_watcher(cpu)
+    timer.install_signal()
+    timer.start()
     # Run offline greedy policy:
     while True:
-        start = time.time()
-        
         # get current state:
         stats = get_raw_state(cpu)
-        state = bucket_state(stats)
+        state = qtable.encode(stats)
+        timer.mark(lt.BUCKET)
 
         # Greedily select the best frequency to use given past experience:
-        best_action = np.argmax(Q[ tuple(state) ])
+        best_action = policy[state] if policy is not None else qtable.argmax(state)
+        timer.mark(lt.ARGMAX)
 
         # Take action.
         # (note big_freqs is lookup table from state_space module).
-        if requested_freqs_array is not None:
-            with requested_freqs_array.get_lock():
-                requested_freqs_array[(cpu-4)*2] = int(big_freqs[best_action])
-                requested_freqs_array[(cpu-4)*2+1] = int(stats['temp'])
-            #print("Updated frquency ",cpu, big_freqs[best_action])
+        if arbiter is not None:
+            arbiter.publish(cpu-4, big_freqs[best_action], stats['temp'], stats['usage'])
         else:
-            dvfs.setClusterFreq(cpu, big_freqs[best_action])
-        ''' 
-        if ACTIONS == FREQS:
-            #dvfs.setClusterFreq(4, big_freqs[best_action])
-                requested_freqs[cpu-4] = (big_freqs[best_action], stats['temp'])
-        else:
-            stay = ACTIONS // 2
-            cur_freq_index = freq_to_bucket[ stats['freq'] ]
-            cur_freq_index += (best_action - stay)
-            bounded_freq_index = max( 0, min( cur_freq_index, FREQS-1))
-            #dvfs.setClusterFreq(4, big_freqs[bounded_freq_index])
-                requested_freqs[cpu-4] = (big_freqs[bounded_freq_index], stats['temp'])
-        '''     
+            actuator.request(big_freqs[best_action])
+        timer.mark(lt.ACTUATE)
+        timer.decided()
         # Print state and action:
         #print([stats[k] for k in LABELS])
         #print(state, best_action)
 
         # Wait for next period. 
-        elapsed = time.time() - start
-        #print("Elapsed:", elapsed)
-        #time.sleep(max(0, PERIOD - elapsed))
-        watcher_files[cpu-4].read()
-        watcher_files[cpu-4].seek(0)
-        res = watchers[cpu-4].poll()
-        end = time.time()
-        #print("Total:", end-start)
+        wait_for_sample(cpu)
+        timer.mark(lt.WAIT)
     
-'''
-Compare two requests:
-Could sort by recency, but the processes will be updating pretty quickly. 
-Instead, sort first by frequency requested (need) and then by temperature (risk)
-'''
-def request_sort(x, y):
-    freq_x = x[0]
-    freq_y = y[0]
-    t_x = x[1]
-    t_y = x[1]
-    if freq_x < freq_y:
-        return -1
-    elif freq_x > freq_y:
-        return 1
-    elif t_x < t_y:
-        return -1
-    elif t_x > t_y:
-        return 1
-    else:
-        return 0
-    
-
-
-def update_freqs(array):
-    with array.get_lock():
-        local_suggestions = [ x for x in requested_freqs]
-    things = []
-    for i in range(len(local_suggestions)/2):
-        things.append( [local_suggestions[i*2], local_suggestions[i*2+1] ] )
-    sorted_requests = sorted(things, cmp=request_sort)
-    dvfs.setClusterFreq(4, sorted_requests[-1][0])
-    print(things, sorted_requests[-1][0])
-
-
-
 '''
 Use global lookup table (LUT) Q to select best action based on quantized state.
 This implementation applies learned Q 'function' from core 4 to all big cores.
 '''
 def run_offline_multicore():
-    global runners
+    global runners, arbiter
+    arbiter = FreqArbiter(len(CLUSTER_CPUS), actuator, ARBITER_POLICY, THERMAL_LIMIT,
+            ARBITER_QUORUM, PERIOD)
     # Launch individual core policies:
-    global requested_freqs
     for core_num in range(4,8):
-        runners[core_num-4] = Process(target=run_offline, args=( core_num, requested_freqs) )
-        runners[core_num-4].start()
+        runners[core_num-4] = al.fork_process(run_offline, (core_num, arbiter), daemon=False)
 
-    # Continue to monitor 'suggested' frequencies and update as appropriate:
-    while True:
-        start = time.time()
-        update_freqs(requested_freqs)
-        time.sleep(max( 0, PERIOD - (time.time() - start)) )
+    # Apply the requests as the cores publish them (see freq_arbiter):
+    arbiter.run()
+
+'''
+Single-process alternative to run_offline_multicore(): one epoll set watches
+the sysfs_notify attribute of every big core. Each wakeup snapshots the whole
+cluster, looks up the greedy action of every ready core with one fancy-indexed
+load from the policy table and arbitrates the cluster frequency (ARBITER_POLICY,
+see freq_arbiter) before waiting again.
+'''
+def run_offline_epoll():
+    global Q
+    global big_freqs
+    print("Started single-process offline policy on cores", CLUSTER_CPUS)
+    freqs_arr = np.array(big_freqs)
+    # Latest request of every core; cores that were not ready keep theirs.
+    requests = np.zeros(len(CLUSTER_CPUS), dtype=freqs_arr.dtype)
+    requests[:] = freqs_arr[0]
+    ready = np.zeros(len(CLUSTER_CPUS), dtype=bool)
+    # Register every core's notifier in one epoll set. Reading an attribute
+    # at offset 0 acknowledges the pending notification.
+    ep = select.epoll()
+    notify_fds = {}
+    for cpu in CLUSTER_CPUS:
+        fd = os.open(sfs.fn_perf_counter.format(cpu, "data_memory_accesses"), os.O_RDONLY)
+        os.pread(fd, 64, 0)
+        ep.register(fd, select.EPOLLPRI | select.EPOLLERR)
+        notify_fds[fd] = cpu - CLUSTER_CPUS[0]
+    timer.install_signal()
+    timer.start()
+    try:
+        while True:
+            events = ep.poll()
+            timer.mark(lt.WAIT)
+            ready[:] = False
+            for fd, ev in events:
+                os.pread(fd, 64, 0)
+                ready[notify_fds[fd]] = True
+            # Encode all ready cores as one batch:
+            stats = snapshot_cluster()
+            states = qtable.encode_many(stats)[ready]
+            timer.mark(lt.BUCKET)
+            best_actions = policy[states] if policy is not None else qtable.argmax_many(states)
+            requests[ready] = freqs_arr[best_actions]
+            timer.mark(lt.ARGMAX)
+            # Arbitrate in the same wakeup:
+            actuator.request(arbitrate(ARBITER_POLICY, requests, stats['temp'], stats['usage'],
+                    THERMAL_LIMIT, ARBITER_QUORUM))
+            timer.mark(lt.ACTUATE)
+            timer.decided()
+    finally:
+        for fd in notify_fds:
+            ep.unregister(fd)
+            os.close(fd)
+        ep.close()
 
 
 
@@ -465,13 +1103,24 @@ def run_offline_multicore():
 # Main and usage:
 
 def usage():
-    print("USAGE: {} <train|run>".format(sys.argv[0]))
+    print("USAGE: {} <train [async|all]|run [all|epoll]>".format(sys.argv[0]))
     sys.exit(0)
 
 def cleanup(checkpoint=False):
     global watchers, runners, watcher_files
     if checkpoint:
         checkpoint_statespace()
+        checkpointer.close()
+        print("Checkpoints:", checkpointer.stats())
+    if arbiter is not None:
+        print("Frequency arbiter:", arbiter.stats())
+    if actuator is not None:
+        print("Frequency actuator:", actuator.stats())
+    timer.dump()
+    if rlog.running:
+        rlog.stop()
+    if recorder is not None:
+        recorder.close()
     for w, f in zip(watchers, watcher_files):
         if w is not None:
             w.unregister(f)
@@ -481,13 +1130,36 @@ def cleanup(checkpoint=False):
                 r.terminate()
 
 def try_load():
+    global policy
+    # Memory-map the compiled policy (see compile_policy.py) if there is one:
+    try:
+        if Q_BACKEND != 'dense':
+            raise Exception("{} Q backend".format(Q_BACKEND))
+        path = cp.POLICY_FILE.format(int(PERIOD*1000))
+        q_meta = ckpt.load_meta(meta_file()) if os.path.exists(meta_file()) else None
+        config = json.loads(json.dumps(state_config(), default=ckpt.to_json))
+        stale = cp.stale_reasons(path, statespace_file(), q_meta, config)
+        if stale:
+            raise Exception("; ".join(stale))
+        policy = cp.load_policy(path)
+        if len(policy) != encoder.num_states:
+            raise Exception("Mismatched policy table to desired statespace.")
+        print("Loaded compiled policy")
+        return
+    except Exception as e:
+        policy = None
+        print("No compiled policy ({}); using statespace.".format(e))
     # load state-action space values from Q file: 
     try:
-        load_statespace()
+        load_statespace('r')
         print("Loaded statespace")
     except:
         print("Could not load statespace. State space Q must be trained with Q learning function.")
         sys.exit(1)
+    # Sparse tables and tile coding are queried directly instead of compiled
+    # over every state:
+    if Q_BACKEND == 'dense':
+        policy = cp.compile_policy(Q)[0]
 
 if __name__ == "__main__":
     init()
@@ -497,11 +1169,21 @@ if __name__ == "__main__":
             if len(sys.argv) > 2 and sys.argv[2] == 'all':
                 print("Running on all 4 cores.")
                 run_offline_multicore() 
+            elif len(sys.argv) > 2 and sys.argv[2] == 'epoll':
+                print("Running on all 4 cores in one process.")
+                run_offline_epoll()
             else:
                 run_offline(4, None)
         
         elif sys.argv[1] == "train":
-            Q_learning(4)
+            if len(sys.argv) > 2 and sys.argv[2] == 'async':
+                print("Training with a separate learner process.")
+                Q_learning_async(4)
+            elif len(sys.argv) > 2 and sys.argv[2] == 'all':
+                print("Training from all 4 cores into one shared Q.")
+                Q_learning(4, followers=CLUSTER_CPUS[1:])
+            else:
+                Q_learning(4)
         else:
             usage()
     else:
@@ -0,0 +1,202 @@
+import numpy as np
+import multiprocessing
+import select
+import errno
+import fcntl
+import mmap
+import os
+
+from eligibility import EligibilityTrace
+from replay_buffer import ReplayBuffer
+from loop_timing import now_ns
+
+# Actor/learner split of online Q-learning (RL_gov.Q_learning_async()).
+# The actor (the control loop) only encodes the state, takes the argmax and
+# actuates; it then computes the reward and pushes the transition into a
+# shared-memory ring. A learner process pinned to a LITTLE core consumes the
+# ring and writes its updates into the dense Q, which lives in shared memory
+# (see SharedArray) and is read by the actor. The cost of learning (Q(lambda), replay) is thus
+# off the decision path entirely.
+#
+# The ring has a single producer and a single consumer and takes no locks.
+# It relies on two invariants:
+#   - Only the process that created the ring pushes (push() checks this), so
+#     head has a single writer and needs no atomic update.
+#   - A slot is published by advancing head, and head is advanced only after
+#     every field of the slot is written. The learner never reads head on
+#     its own: wait() samples it right after reading the pipe, and pending()
+#     hands out slots up to that sample only. The actor stores head before
+#     writing the pipe, and both pipe calls take the same kernel lock, so the
+#     slot stores are visible to the learner once it has that head, even on
+#     the weakly ordered ARM cores of the board.
+# The learner reads up to the sampled head and then advances tail. If the
+# learner falls a whole ring behind, new transitions are dropped rather than
+# blocking the actor. The learner sleeps on the pipe, so it uses no CPU
+# between periods.
+#
+# Q is updated by the learner while the actor reads it, without locking; a
+# row read in the middle of an update still holds valid values of the old or
+# the new estimate. The learner also writes the updated Q(s, a) of every
+# transition back into its slot (q) before releasing it, for the actor's
+# transition log. That direction has no system call between the stores and
+# the actor's loads, so it relies on program order only; a stale q can only
+# reach the log, never Q.
+
+'''
+Array in anonymous shared memory (MAP_SHARED), inherited by forked child
+processes. Unlike a multiprocessing.shared_memory segment it has no name to
+clean up in /dev/shm and stays mapped for as long as any NumPy view of it
+lives, however the governor exits.
+'''
+class SharedArray(object):
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        self.buf = mmap.mmap(-1, max(1, count * dtype.itemsize))
+        self.array = np.frombuffer(self.buf, dtype=dtype, count=count).reshape(shape)
+
+
+class TransitionRing(object):
+    '''
+    capacity: number of transitions the ring holds.
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ints = SharedArray((4, capacity), np.int64)
+        self.floats = SharedArray((2, capacity), np.float64)
+        # head (next slot to write) and tail (next slot to read):
+        self.counters = SharedArray((2,), np.int64)
+        self.s, self.a, self.s_next, self.explore = self.ints.array
+        self.r, self.q = self.floats.array
+        self.ctr = self.counters.array
+        self.head = 0
+        self.seen_head = 0
+        self.dropped = 0
+        self.owner = os.getpid()
+        self.bell_r, self.bell_w = os.pipe()
+        # A full pipe already means "wake up"; never block the actor on it:
+        fcntl.fcntl(self.bell_w, fcntl.F_SETFL, fcntl.fcntl(self.bell_w, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    '''
+    Actor side. explore: the action taken in s_next was exploratory.
+    Returns False if the ring was full and the transition was dropped; its
+    sequence number is head - 1 otherwise. Fills the slot first and publishes
+    it by advancing head last (see the ring invariants above).
+    '''
+    def push(self, s, a, r, s_next, explore):
+        if os.getpid() != self.owner:
+            raise Exception("TransitionRing.push() from a process other than the actor.")
+        head = self.head
+        if head - self.ctr[1] >= self.capacity:
+            self.dropped += 1
+            return False
+        i = head % self.capacity
+        self.s[i] = s
+        self.a[i] = a
+        self.r[i] = r
+        self.s_next[i] = s_next
+        self.explore[i] = explore
+        # Publish: nothing of the slot may be written after this store.
+        self.head = head + 1
+        self.ctr[0] = head + 1
+        try:
+            os.write(self.bell_w, b'\0')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return True
+
+    '''
+    Learner side: block until the actor rings (or timeout seconds pass) and
+    take the published head. Returns False once the actor has closed the ring.
+    '''
+    def wait(self, timeout=None):
+        if timeout is not None and not select.select([self.bell_r], [], [], timeout)[0]:
+            return True
+        alive = len(os.read(self.bell_r, 4096)) > 0
+        self.seen_head = int(self.ctr[0])
+        return alive
+
+    def ready(self):
+        return len(select.select([self.bell_r], [], [], 0)[0]) > 0
+
+    '''
+    Learner side: ring slots of the transitions published up to the last
+    wait() (in order); pass their number to release() when done with them.
+    '''
+    def pending(self):
+        tail = int(self.ctr[1])
+        return np.arange(tail, self.seen_head) % self.capacity
+
+    def release(self, n):
+        self.ctr[1] += n
+
+    '''
+    Actor side: no more transitions; the learner drains the ring and exits.
+    '''
+    def close(self):
+        os.close(self.bell_w)
+        self.bell_w = None
+
+
+'''
+Learner process: apply every transition from ring to the shared Q (flat view
+Qf), one-step or Q(lambda), and replay past transitions for up to a period
+after each batch until the actor rings again.
+'''
+def learner_main(ring, Qf, alpha, gamma, trace_lambda, trace_len, replay_size,
+        replay_batch, replay_window, cpu):
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [cpu])
+    # The actor keeps the write end:
+    os.close(ring.bell_w)
+    trace = EligibilityTrace(Qf, gamma*trace_lambda, trace_len) if trace_lambda else None
+    replay = ReplayBuffer(replay_size) if replay_size else None
+    window_ns = int(replay_window * 1000000000)
+    alive = True
+    while alive:
+        alive = ring.wait()
+        t_bell = now_ns()
+        slots = ring.pending()
+        for i in slots.tolist():
+            s, a, s_next = int(ring.s[i]), int(ring.a[i]), int(ring.s_next[i])
+            r = float(ring.r[i])
+            if trace is not None:
+                ring.q[i] = trace.update(s, a, r, s_next, alpha, gamma)
+                if ring.explore[i]:
+                    trace.cut()
+            else:
+                row = Qf[s]
+                old_value = float(row[a])
+                row[a] = old_value + alpha*(r + gamma*float(Qf[s_next].max()) - old_value)
+                ring.q[i] = row[a]
+            if replay is not None:
+                replay.add(s, a, r, s_next)
+        ring.release(len(slots))
+        if replay is not None and alive:
+            replay.replay_until(Qf, replay_batch, alpha, gamma, t_bell + window_ns, ring.ready)
+
+'''
+Start target(*args) in a forked process, which inherits the shared arrays
+(other start methods would pickle copies of them).
+'''
+def fork_process(target, args, daemon=True):
+    proc = multiprocessing.get_context('fork').Process(target=target, args=args)
+    proc.daemon = daemon
+    proc.start()
+    return proc
+
+def start_learner(ring, Qf, alpha, gamma, trace_lambda=0.0, trace_len=32, replay_size=0,
+        replay_batch=32, replay_window=0.0, cpu=None):
+    return fork_process(learner_main, (ring, Qf, alpha, gamma, trace_lambda,
+            trace_len, replay_size, replay_batch, replay_window, cpu))
+
+'''
+Close the ring and wait for the learner to apply what is left in it.
+'''
+def stop_learner(ring, learner, timeout=5.0):
+    if ring.bell_w is not None:
+        ring.close()
+    learner.join(timeout)
+    if learner.is_alive():
+        learner.terminate()
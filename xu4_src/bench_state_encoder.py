@@ -0,0 +1,87 @@
+import numpy as np
+import random
+import timeit
+import sys
+
+import RL_gov
+from state_space_params import *
+
+# Microbenchmark and equivalence check of the flat-index state encoder.
+# Checks that encoder.encode()/encode_many() pick the same state as
+# bucket_state() for random stats and for values on and next to every bucket
+# edge, then times one control step's worth of state handling (bucketing,
+# argmax, Q update) with list states against flat indices.
+#
+# Usage: python bench_state_encoder.py [samples]
+
+def random_stats(rng):
+    stats = {}
+    for k in LABELS:
+        lo, hi = MINS[k], MAXS[k]
+        stats[k] = rng.uniform(lo - 0.1 * (hi - lo), hi + 0.1 * (hi - lo))
+    stats['freq'] = rng.choice(big_freqs_base)
+    return stats
+
+'''
+Values exactly on every bucket edge of every label and one ulp either side.
+'''
+def edge_stats():
+    for j, k in enumerate(LABELS):
+        for b in range(BUCKETS[k] + 1):
+            edge = RL_gov.all_mins[j] + b * RL_gov.widths[j]
+            for v in (np.nextafter(edge, -np.inf), edge, np.nextafter(edge, np.inf)):
+                stats = {l: (MINS[l] + MAXS[l]) / 2.0 for l in LABELS}
+                stats[k] = float(v)
+                stats['freq'] = big_freqs_base[b % len(big_freqs_base)]
+                yield stats
+
+def check(samples):
+    rng = random.Random(1)
+    records = [random_stats(rng) for _ in range(samples)] + list(edge_stats())
+    enc = RL_gov.encoder
+    flat = np.ravel_multi_index
+    dims = RL_gov.dims[:-1]
+    mismatches = 0
+    for stats in records:
+        expected = flat(tuple(RL_gov.bucket_state(stats)), dims)
+        if enc.encode(stats) != expected or enc.decode(expected) != RL_gov.bucket_state(stats):
+            mismatches += 1
+    batch = {k: np.array([s[k] for s in records]) for k in LABELS + ['freq']}
+    expected = flat(tuple(RL_gov.bucket_states(batch).T), dims)
+    mismatches += int(np.sum(enc.encode_many(batch) != expected))
+    return len(records), mismatches
+
+'''
+One step of state handling as Q_learning did it with list states.
+'''
+def list_step(stats, last):
+    Q = RL_gov.Q
+    state = RL_gov.bucket_state(stats)
+    best_next = np.max(Q[ tuple(state) ])
+    old = Q[ tuple(last + [3]) ]
+    Q[ tuple(last + [3]) ] = old + ALPHA*(1.0 + GAMMA*best_next - old)
+    return state, np.argmax(Q[ tuple(state) ])
+
+'''
+The same with flat indices.
+'''
+def flat_step(stats, last):
+    state = RL_gov.encoder.encode(stats)
+    RL_gov.update_Q_off_policy(last, 3, 1.0, state)
+    return state, RL_gov.Qf[state].argmax()
+
+
+if __name__ == "__main__":
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n, mismatches = check(samples)
+    print("{} records checked, {} mismatches".format(n, mismatches))
+    stats = random_stats(random.Random(2))
+    number = 100000
+    for name, stmt in [
+            ("bucket_state", lambda: RL_gov.bucket_state(stats)),
+            ("encoder.encode", lambda: RL_gov.encoder.encode(stats)),
+            ("list step", lambda: list_step(stats, [0] * VARS)),
+            ("flat step", lambda: flat_step(stats, 0)),
+            ]:
+        t = min(timeit.repeat(stmt, number=number, repeat=3)) / number
+        print("{:>16}: {:.2f} us".format(name, t * 1e6))
@@ -0,0 +1,397 @@
+import numpy as np
+import sys
+import time
+
+from state_space_params import PERIOD, big_freqs_base
+import therm_params as tm
+import trace_replay
+
+# Simulated Exynos 5422 big cluster.
+# A backend for RL_gov.use_backend() that closes the loop trace replay leaves
+# open: the frequency the governor picks changes throughput, power and,
+# through an RC thermal network, the temperatures it sees next.
+#
+#     sim = board_sim.BoardSim(trace_replay.load("blackscholes/raw.npy"))
+#     RL_gov.use_backend(sim)
+#     RL_gov.Q_learning(4, steps=1000000, board=False)
+#
+# Model, per core and period:
+#   - Workload phases come from a recorded trace, one sample per trace
+#     period; each core plays the trace from its own offset. A sample gives
+#     the core's compute CPI (1/IPC_u minus the memory stall cycles implied by
+#     its MPKI at the recorded frequency) and whether it was CPU bound.
+#   - IPC_u(f) = 1 / (CPI_core + MPKI/1000 * MEM_LATENCY * f): memory stalls
+#     take a fixed time, so memory-bound phases gain little from frequency.
+#     CPU-bound phases stay busy; other phases keep their recorded instruction
+#     rate, so their utilization drops as frequency goes up.
+#   - Dynamic power V^2 * f * (C_EFF * usage + C_IPC * IPC_p) with V from
+#     big_f_to_v_MC1, plus leakage from therm_params (c1, c2, Igate) as in
+#     power_model.leakagePower, scaled by LEAK_SCALE.
+#   - Thermal RC network: four core nodes coupled to each other and to a
+#     heat sink node, a GPU node (the fifth sensor) on the heat sink, and the
+#     heat sink to ambient. The network is linear, so it is discretized once
+#     per period (matrix exponential) and each step is one matrix product.
+#
+# The power and thermal constants are least-squares fits to the power and
+# temp columns of the blackscholes, bodytrack and single_core_tests dumps
+# (fit_board_sim.py). The power model is off by 0.25 W rms. Replaying the
+# recorded frequencies (replay_temps()), the simulated core temperature is
+# off by 2.4 to 3.6 K rms, its median is within 2 K of the recorded one, and
+# the two distributions overlap by 0.43 to 0.65 (temperature_overlap()).
+# The runs idle up to 3 K apart, which one ambient temperature cannot match.
+# At a fixed 200 MHz a board settles near 50 C, at 2 GHz above 100 C (the
+# real board throttles at 95 C; the simulator does not).
+#
+# All state is kept as arrays over (boards, cores); boards > 1 steps several
+# independent boards at once (set_freqs()/stats), board 0 backs the RL_gov
+# interface.
+#
+# Speed: without noise, the per-core stats of every (trace sample, frequency)
+# pair are tabulated when the simulator is built (up to TABLE_BYTES), so a
+# step is one gather, the leakage lookup (leak_lut) and the thermal product,
+# 23 to 29 us. Training with Q_learning (50 ms period, one-step updates, no
+# replay, python board_sim.py blackscholes/raw.npy) measured 975x to 1070x
+# real time over three runs on the development machine and 919x on another,
+# so 1000x is not reached everywhere. With noise, or a trace too long to
+# tabulate, the stats are computed every step (core_model(), about 64 us
+# per step) and training measured about 540x.
+#
+# Usage: python board_sim.py <raw.npy | trace directory> [steps] [Q out.npy]
+# trains with Q_learning on the simulator and reports simulated time per
+# wall-clock second.
+
+NUM_CORES = 4
+NUM_SENSORS = 5
+# Ambient temperature and start temperature in C:
+T_AMB = 25.0
+T_START = 45.0
+# Time of one L2 miss in seconds:
+MEM_LATENCY = 100e-9
+IPC_MAX = 4.0
+# Phases with higher utilization than this are treated as CPU bound:
+CPU_BOUND = 0.95
+# Effective switched capacitance per core in F: busy cycles, and the extra
+# per instruction per cycle (~0.24 W stalled, ~0.51 W at IPC 0.8, at 2 GHz):
+C_EFF = 7.29e-11
+C_IPC = 1.00e-10
+# Scale of the therm_params leakage model:
+LEAK_SCALE = 0.756
+# Constant power into the GPU node and into the heat sink (LITTLE cluster,
+# memory, board) in W:
+GPU_POWER = 0.2
+BASE_POWER = 2.38
+# Thermal network: capacitances in J/K, resistances in K/W. R_LAT, C_GPU and
+# R_GPU are not fitted (with equal core powers no heat flows between cores).
+C_CORE = 0.0279
+R_CORE = 35.6    # core to heat sink
+R_LAT = 8.0      # core to neighbouring core
+C_GPU = 0.5
+R_GPU = 4.0      # GPU to heat sink
+C_HS = 18.7
+R_HS = 7.58      # heat sink to ambient
+# Per-core stats of a period, in the order of the blocks core_model() returns;
+# the blocks end with the busy dynamic power (P_DYN), which is not a stat:
+STAT_NAMES = ['cycles', 'instructions', 'l2misses', 'bmisses', 'MPKI', 'BMPKI', 'IPC_u',
+        'IPC_p', 'IPS', 'usage']
+CYCLES, INSTRUCTIONS, L2MISSES, BMISSES, MPKI, BMPKI, IPC_U, IPC_P, IPS, USAGE, P_DYN = \
+        range(len(STAT_NAMES) + 1)
+# Largest (trace sample, frequency) table of core stats BoardSim precomputes:
+TABLE_BYTES = 256 * 1024 * 1024
+# Node order of the network:
+GPU, HS = NUM_CORES, NUM_CORES + 1
+NUM_NODES = NUM_CORES + 2
+
+# Core voltage and V^2 * f by frequency in 100 MHz steps:
+volt_lut = np.zeros(big_freqs_base[-1] // 100000 + 1)
+for f in big_freqs_base:
+    volt_lut[f // 100000] = tm.big_f_to_v_MC1[float(f) / 1000000]
+v2f_lut = volt_lut ** 2 * np.arange(len(volt_lut)) * 1e8
+
+# Leakage current by core temperature above ambient, tabulated every
+# LEAK_STEP K for interpolation in step():
+LEAK_STEP = 0.01
+
+'''
+Leakage power of a core at voltage v and temperature t (Kelvin); works on
+arrays. Same formula as power_model.leakagePower.
+'''
+def leakage_power(v, t):
+    return v * (tm.c1 * t ** 2 * np.exp(tm.c2 / t) + tm.Igate)
+
+leak_x = np.arange(-T_AMB, 200.0, LEAK_STEP)
+leak_lut = LEAK_SCALE * leakage_power(1.0, leak_x + T_AMB + 273.15)
+
+'''
+Stats of one period (a block indexed by CYCLES..P_DYN) of cores running the
+workload phases phase (rows of BoardSim.phase) at frequencies freq (KHz).
+Broadcasts over the leading axes of phase and freq. noise: factors applied
+to IPC_u, or None.
+'''
+def core_model(phase, freq, period, noise=None):
+    cpi, stall, demand = phase[..., 0], phase[..., 1], phase[..., 2]
+    f = freq * 1000.0
+    S = np.empty((P_DYN + 1,) + np.broadcast(cpi, f).shape)
+    ipc_u = S[IPC_U]
+    np.reciprocal(cpi + stall * f, out=ipc_u)
+    if noise is not None:
+        ipc_u *= noise
+    capacity = f * ipc_u
+    usage = S[USAGE]
+    np.minimum(1.0, demand / capacity, out=usage)
+    ips = S[IPS]
+    np.multiply(usage, capacity, out=ips)
+    np.multiply(f * period, usage, out=S[CYCLES])
+    np.multiply(ips, period, out=S[INSTRUCTIONS])
+    S[MPKI] = phase[..., 3]
+    S[BMPKI] = phase[..., 4]
+    np.multiply(S[MPKI:BMPKI+1], S[INSTRUCTIONS] / 1000.0, out=S[L2MISSES:BMISSES+1])
+    np.divide(ips, f, out=S[IPC_P])
+    p_dyn = S[P_DYN]
+    np.multiply(C_EFF, usage, out=p_dyn)
+    p_dyn += C_IPC * S[IPC_P]
+    p_dyn *= v2f_lut[freq // 100000]
+    return S
+
+'''
+Matrix exponential by scaling and squaring of a Taylor series.
+'''
+def expm(M, order=12, squarings=12):
+    M = M / float(1 << squarings)
+    E = np.eye(len(M))
+    term = np.eye(len(M))
+    for k in range(1, order + 1):
+        term = term.dot(M) / k
+        E = E + term
+    for _ in range(squarings):
+        E = E.dot(E)
+    return E
+
+'''
+Discretize the thermal network over one period. With x the node temperatures
+above ambient and p the node powers, x' = x Ad^T + p Bd^T. The network
+constants default to the module's (fit_board_sim.py passes its own).
+'''
+def thermal_matrices(period, c_core=C_CORE, r_core=R_CORE, r_lat=R_LAT,
+        c_gpu=C_GPU, r_gpu=R_GPU, c_hs=C_HS, r_hs=R_HS):
+    caps = np.array([c_core] * NUM_CORES + [c_gpu, c_hs])
+    G = np.zeros((NUM_NODES, NUM_NODES))
+    def couple(i, j, r):
+        G[i, i] -= 1.0 / r
+        G[j, j] -= 1.0 / r
+        G[i, j] += 1.0 / r
+        G[j, i] += 1.0 / r
+    for i in range(NUM_CORES):
+        couple(i, HS, r_core)
+        for j in range(i + 1, NUM_CORES):
+            couple(i, j, r_lat)
+    couple(GPU, HS, r_gpu)
+    G[HS, HS] -= 1.0 / r_hs
+    A = G / caps[:, None]
+    # Augmented system [[A, C^-1], [0, 0]] gives both matrices at once:
+    M = np.zeros((2 * NUM_NODES, 2 * NUM_NODES))
+    M[:NUM_NODES, :NUM_NODES] = A
+    M[:NUM_NODES, NUM_NODES:] = np.diag(1.0 / caps)
+    E = expm(M * period)
+    return E[:NUM_NODES, :NUM_NODES], E[:NUM_NODES, NUM_NODES:]
+
+
+class BoardSim(object):
+    '''
+    trace: trace_replay.TraceReplay (see trace_replay.load()) whose samples
+           drive the workload phases.
+    period: control period in seconds.
+    boards: number of independent boards simulated side by side.
+    noise: relative standard deviation of the simulated instruction counts.
+    seed: seed for the phase offsets of boards > 0 and for the noise.
+    '''
+    def __init__(self, trace, period=PERIOD, boards=1, noise=0.0, seed=None):
+        self.period = period
+        self.trace_period = trace.period
+        self.boards = boards
+        self.noise = noise
+        self.rng = np.random.RandomState(seed)
+        stats = trace.stats
+        f0 = np.asarray(trace.freq, dtype=np.double) * 1000
+        ipc_u0 = np.asarray(stats['IPC_u'])
+        usage0 = np.asarray(stats['usage'])
+        stall = np.asarray(stats['MPKI']) / 1000.0 * MEM_LATENCY
+        cpi = np.divide(1.0, ipc_u0, out=np.ones(len(f0)), where=ipc_u0 > 0) - stall * f0
+        # CPU-bound phases demand an unbounded instruction rate:
+        demand = np.where(usage0 >= CPU_BOUND, np.inf, usage0 * f0 * ipc_u0)
+        # Per-sample phase table, gathered with one index per step:
+        self.phase = np.column_stack([np.maximum(cpi, 1.0 / IPC_MAX), stall, demand,
+                stats['MPKI'], stats['BMPKI']])
+        self.n = len(f0)
+        # Without noise the stats of a core depend only on its phase and the
+        # frequency: tabulate them for every (sample, frequency) once, as
+        # (samples, frequencies, block), so a step is a single gather.
+        freqs = np.array(big_freqs_base)
+        self.freq_index = np.zeros(len(volt_lut), dtype=np.intp)
+        self.freq_index[freqs // 100000] = np.arange(len(freqs))
+        self.table = None
+        if noise == 0 and self.n * len(freqs) * (P_DYN + 1) * 8 <= TABLE_BYTES:
+            self.table = np.ascontiguousarray(np.moveaxis(
+                    core_model(self.phase[:, None, :], freqs, period), 0, -1))
+        # Trace position of every core: cores of a board are spread over the
+        # trace, other boards start at random offsets.
+        self.offsets = (np.arange(NUM_CORES) * self.n // NUM_CORES)[None, :] \
+                + np.concatenate([[0], self.rng.randint(0, self.n, boards - 1)])[:, None]
+        self.Ad, self.Bd = thermal_matrices(period)
+        # Node temperatures above ambient and node powers side by side, so
+        # one product with [Ad^T; Bd^T] advances the network:
+        self.xp = np.zeros((boards, 2 * NUM_NODES))
+        self.x = self.xp[:, :NUM_NODES]
+        self.p = self.xp[:, NUM_NODES:]
+        self.x[:] = T_START - T_AMB
+        self.p[:, GPU] = GPU_POWER
+        self.p[:, HS] = BASE_POWER
+        self.AB = np.vstack([self.Ad.T, self.Bd.T])
+        self.freq = np.full(boards, big_freqs_base[-1], dtype=np.intp)
+        self.freq_changed()
+        self.t = 0.0
+        self.steps = 0
+        self.freq_writes = 0
+        self.stats = {}
+        self.step()
+
+    '''
+    Run every board for one period at its current frequency. Afterwards
+    stats holds the counters and derived stats of that period as
+    (boards, cores) arrays and temps the sensor readings at its end.
+    '''
+    def step(self):
+        idx = (self.offsets + int(self.t / self.trace_period)) % self.n
+        if self.table is not None:
+            S = self.table[idx, self.freq_col].transpose(2, 0, 1)
+        else:
+            noise = None
+            if self.noise > 0:
+                noise = np.maximum(0.0, 1.0 + self.noise * self.rng.standard_normal(idx.shape))
+            S = core_model(self.phase[idx], self.freq[:, None], self.period, noise)
+        # Power over the period, leakage at the temperature it started at
+        # (tabulated, see leak_lut):
+        p_core = S[P_DYN] + self.volt * np.interp(self.x[:, :NUM_CORES], leak_x, leak_lut)
+        self.p[:, :NUM_CORES] = p_core
+        self.x[:] = self.xp.dot(self.AB)
+        s = self.stats
+        for k, name in enumerate(STAT_NAMES):
+            s[name] = S[k]
+        s['power'] = np.add.reduce(p_core, axis=1)
+        self.temps = self.x[:, :NUM_SENSORS] + T_AMB
+        self.t += self.period
+        self.steps += 1
+        # Board 0 as Python scalars for get_raw_state():
+        self.row = list(zip(STAT_NAMES, S[:P_DYN, 0].tolist()))
+        self.temps0 = self.temps[0].tolist()
+
+    '''
+    Set every board's cluster frequency (KHz) at once.
+    '''
+    def set_freqs(self, freqs):
+        self.freq[:] = freqs
+        self.freq_writes += 1
+        self.freq_changed()
+
+    '''
+    Update what step() derives from the frequencies: the voltages and the
+    frequency index into the stats table, as (boards, 1) columns.
+    '''
+    def freq_changed(self):
+        fi = self.freq // 100000
+        self.volt = volt_lut[fi][:, None]
+        self.freq_col = self.freq_index[fi][:, None]
+
+    ###########################################################################
+    # Stand-ins for RL_gov:
+
+    def get_raw_state(self, cpu):
+        c = cpu - 4
+        all_stats = {k: v[c] for k, v in self.row}
+        freq = int(self.freq[0])
+        all_stats['DAPKI'] = 0.0
+        all_stats['temp'] = self.temps0[c]
+        all_stats['freq'] = freq
+        all_stats['volt'] = tm.big_f_to_v_MC1[float(freq) / 1000000]
+        all_stats['power'] = float(self.stats['power'][0])
+        return all_stats
+
+    def register_watcher(self, cpu):
+        pass
+
+    def wait_for_sample(self, cpu):
+        self.step()
+
+    ###########################################################################
+    # Stand-ins for devfreq_utils:
+
+    def getClusterFreq(self, cpu_num):
+        return int(self.freq[0])
+
+    def setClusterFreq(self, cpu_num, frequency):
+        self.freq[0] = int(frequency)
+        self.freq_writes += 1
+        self.freq_changed()
+
+    def getAvailFreqs(self, cpu_num):
+        return list(big_freqs_base)
+
+    def getTemps(self):
+        return list(self.temps0)
+
+    def setUserSpace(self, clusters=None):
+        pass
+
+    def unsetUserSpace(self, clusters=None):
+        pass
+
+
+'''
+Core temperatures (core 0, one per sample) of a board that runs the trace at
+the frequencies it was recorded at, with every core on the recorded phase,
+starting from the first recorded temperature.
+'''
+def replay_temps(trace):
+    freq = np.asarray(trace.freq, dtype=np.intp)
+    sim = BoardSim(trace, period=trace.period)
+    sim.offsets[:] = 0
+    sim.x[:] = trace.stats['temp'][0] - T_AMB
+    sim.t = 0.0
+    temps = np.empty(len(freq))
+    for k in range(len(freq)):
+        sim.freq[0] = freq[k]
+        sim.freq_changed()
+        sim.step()
+        temps[k] = sim.temps[0, 0]
+    return temps
+
+'''
+Overlap (0 to 1) of two temperature distributions: the shared area of their
+histograms over bins of width degrees, centered on whole degrees like the
+recorded sensor values.
+'''
+def temperature_overlap(simulated, recorded, width=1.0):
+    lo = np.floor(min(simulated.min(), recorded.min())) - width / 2
+    edges = np.arange(lo, max(simulated.max(), recorded.max()) + width, width)
+    p = np.histogram(simulated, edges)[0] / float(len(simulated))
+    q = np.histogram(recorded, edges)[0] / float(len(recorded))
+    return np.minimum(p, q).sum()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("USAGE: {} <raw.npy|trace dir> [steps] [Q out.npy]".format(sys.argv[0]))
+        sys.exit(0)
+    import RL_gov
+    sim = BoardSim(trace_replay.load(sys.argv[1]))
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    RL_gov.use_backend(sim)
+    start = time.time()
+    RL_gov.Q_learning(4, steps=steps, board=False)
+    elapsed = time.time() - start
+    print("{} steps, {:.0f} s simulated in {:.2f} s ({:.0f}x real time), {} frequency writes".format(
+            steps, sim.t, elapsed, sim.t / elapsed, sim.freq_writes))
+    print("Final temperatures:", ["{:.1f}".format(t) for t in sim.temps0])
+    RL_gov.timer.dump()
+    if len(sys.argv) > 3:
+        np.save(sys.argv[3], RL_gov.Q)
+        print("Saved", sys.argv[3])
@@ -0,0 +1,141 @@
+import numpy as np
+import threading
+import random
+import json
+import time
+
+from q_backends import replace_file
+
+# Periodic background checkpoints of the Q function.
+# The control loop asks due() every step; every CHECKPOINT_STEPS steps or
+# CHECKPOINT_S seconds it calls save(), which copies the tables (a memcpy on
+# the control thread) and hands the copies to a writer thread. All file I/O
+# happens on the writer thread, so the control period never waits on the disk.
+# If a checkpoint is requested while the previous one is still being
+# written, the newer one replaces the pending one.
+#
+# A checkpoint is up to three files, each written to a temporary file and
+# renamed over the old one (q_backends.replace_file):
+#   Q_<ms>ms.npy (.npz)   Q backend, in the backend's save() format
+#   C_<ms>ms.npy          visit table (dense backend)
+#   Q_<ms>ms.json         metadata: step count, RNG states and the
+#                         configuration the tables were built with
+# The metadata goes last, so its step count never runs ahead of the tables.
+
+class Checkpointer(object):
+    '''
+    path, visits_path, meta_path: the three checkpoint files.
+    every_steps, every_s: checkpoint interval in steps and in seconds
+                          (0 disables either).
+    '''
+    def __init__(self, path, visits_path, meta_path, every_steps=0, every_s=0):
+        self.path = path
+        self.visits_path = visits_path
+        self.meta_path = meta_path
+        self.every_steps = every_steps
+        self.every_s = every_s
+        self.last_step = 0
+        self.last_time = time.time()
+        self.pending = None
+        self.busy = False
+        self.closing = False
+        self.written = 0
+        self.superseded = 0
+        self.write_s = 0.0
+        self.cond = threading.Condition()
+        self.writer = threading.Thread(target=self._run)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def due(self, step):
+        if self.every_steps and step - self.last_step >= self.every_steps:
+            return True
+        return bool(self.every_s) and time.time() - self.last_time >= self.every_s
+
+    '''
+    Copy qtable (a q_backends table) and visits (array or None) and queue them
+    for writing with the metadata dict meta.
+    '''
+    def save(self, qtable, visits, meta, step):
+        job = (qtable.snapshot(), None if visits is None else visits.copy(), meta)
+        with self.cond:
+            if self.pending is not None:
+                self.superseded += 1
+            self.pending = job
+            self.cond.notify_all()
+        self.last_step = step
+        self.last_time = time.time()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closing:
+                    self.cond.wait()
+                if self.pending is None:
+                    return
+                job = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                self._write(*job)
+            except Exception as e:
+                print("Checkpoint failed:", e)
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+    def _write(self, write_q, visits, meta):
+        start = time.time()
+        replace_file(self.path, write_q)
+        if visits is not None:
+            replace_file(self.visits_path, lambda f: np.save(f, visits))
+        text = json.dumps(meta, default=to_json, sort_keys=True, indent=1)
+        replace_file(self.meta_path, lambda f: f.write(text.encode()))
+        self.write_s = time.time() - start
+        self.written += 1
+
+    '''
+    Wait until every queued checkpoint is on disk.
+    '''
+    def flush(self):
+        with self.cond:
+            while self.pending is not None or self.busy:
+                self.cond.wait()
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.writer.join()
+
+    def stats(self):
+        return {'written': self.written, 'superseded': self.superseded,
+                'last_write_s': self.write_s}
+
+
+'''
+json.dumps default for numpy values.
+'''
+def to_json(o):
+    if hasattr(o, 'tolist'):
+        return o.tolist()
+    raise TypeError("{!r} is not JSON serializable".format(o))
+
+def load_meta(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+'''
+States of the random and np.random generators, as JSON-friendly lists.
+'''
+def rng_state():
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    return {'random': random.getstate(),
+            'numpy': [name, keys.tolist(), pos, has_gauss, cached]}
+
+def set_rng_state(state):
+    version, internal, gauss = state['random']
+    random.setstate((version, tuple(internal), gauss))
+    name, keys, pos, has_gauss, cached = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached))
@@ -0,0 +1,116 @@
+import numpy as np
+import json
+import sys
+import os
+
+from state_space_params import PERIOD
+
+# Compiled greedy policy.
+# Run mode only needs the greedy action of every state, not the Q values.
+# compile_policy() reduces a trained Q to one uint8 action per flat state
+# (the row order of Q.reshape(-1, ACTIONS), see state_encoder) and the margin
+# between the best and second best action values as a confidence measure.
+#
+# The table is saved as a plain .npy file and memory-mapped read-only by run
+# mode, so a decision is one indexed load and the runner processes share the
+# same physical pages.
+#
+# Next to the table, policy_<period>ms.json records the Q checkpoint it was
+# compiled from: its path, modification time, step count and state space
+# configuration (from the checkpoint metadata, Q_<period>ms.json). Run mode
+# only uses the table while that still describes the current checkpoint and
+# configuration (stale_reasons()) and compiles from Q otherwise.
+#
+# Usage: python compile_policy.py [Q file] [policy file] [margin file]
+# defaults to Q_<period>ms.npy, policy_<period>ms.npy and margin_<period>ms.npy.
+
+POLICY_FILE = "policy_{}ms.npy"
+MARGIN_FILE = "margin_{}ms.npy"
+
+'''
+Greedy action per state (uint8) and the margin of its value over the second
+best action (float32; 0 where the best action is tied).
+'''
+def compile_policy(Q):
+    Qf = np.asarray(Q).reshape(-1, Q.shape[-1])
+    if Qf.shape[1] > 256:
+        raise Exception("Too many actions for a uint8 policy table.")
+    policy = Qf.argmax(axis=1).astype(np.uint8)
+    if Qf.shape[1] > 1:
+        top2 = np.partition(Qf, Qf.shape[1] - 2, axis=1)[:, -2:]
+        margin = (top2[:, 1] - top2[:, 0]).astype(np.float32)
+    else:
+        margin = np.zeros(len(Qf), dtype=np.float32)
+    return policy, margin
+
+'''
+Memory-map a compiled policy read-only. Returns a plain ndarray backed by the
+mapping (cheaper to index than the memmap subclass).
+'''
+def load_policy(path=None):
+    if path is None:
+        path = POLICY_FILE.format(int(PERIOD*1000))
+    return np.asarray(np.load(path, mmap_mode='r'))
+
+'''
+Metadata file of the policy table at path.
+'''
+def meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+'''
+Source record of a policy compiled from q_file, whose checkpoint metadata
+(dict or None) is q_meta.
+'''
+def source_meta(q_file, q_meta):
+    return {'source': q_file, 'mtime': os.path.getmtime(q_file),
+            'step': None if q_meta is None else q_meta['step'],
+            'config': None if q_meta is None else q_meta['config']}
+
+'''
+Why the policy table at path does not match the Q checkpoint q_file (with
+metadata q_meta, or None) and the state space configuration config (as in
+the checkpoint metadata). Returns a list of reasons, empty if it matches.
+'''
+def stale_reasons(path, q_file, q_meta, config):
+    if not os.path.exists(path):
+        return ["no {}".format(path)]
+    if not os.path.exists(meta_path(path)):
+        return ["no {}".format(meta_path(path))]
+    with open(meta_path(path), 'r') as f:
+        meta = json.load(f)
+    reasons = []
+    if meta['config'] is None:
+        reasons.append("no state space configuration recorded")
+    else:
+        changed = [k for k, v in config.items() if meta['config'].get(k, v) != v]
+        if changed:
+            reasons.append("compiled for another state space ({})".format(", ".join(changed)))
+    if os.path.exists(q_file):
+        if os.path.getmtime(q_file) != meta['mtime'] \
+                or (q_meta is not None and q_meta['step'] != meta['step']):
+            reasons.append("{} changed since it was compiled".format(q_file))
+    return reasons
+
+
+if __name__ == "__main__":
+    ms_period = int(PERIOD*1000)
+    q_file = sys.argv[1] if len(sys.argv) > 1 else "Q_{}ms.npy".format(ms_period)
+    policy_file = sys.argv[2] if len(sys.argv) > 2 else POLICY_FILE.format(ms_period)
+    margin_file = sys.argv[3] if len(sys.argv) > 3 else MARGIN_FILE.format(ms_period)
+    q_meta_file = os.path.splitext(q_file)[0] + ".json"
+    q_meta = None
+    if os.path.exists(q_meta_file):
+        with open(q_meta_file, 'r') as f:
+            q_meta = json.load(f)
+    else:
+        print("No {}; run mode cannot check the policy against the state space.".format(q_meta_file))
+    Q = np.load(q_file, mmap_mode='r')
+    policy, margin = compile_policy(Q)
+    np.save(policy_file, policy)
+    np.save(margin_file, margin)
+    with open(meta_path(policy_file), 'w') as f:
+        json.dump(source_meta(q_file, q_meta), f, sort_keys=True, indent=1)
+    print("{}: {} states x {} actions ({} bytes) -> {} ({} bytes)".format(
+            q_file, len(policy), Q.shape[-1], Q.nbytes, policy_file, policy.nbytes))
+    print("States with a tied best action: {}".format(int(np.sum(margin == 0))))
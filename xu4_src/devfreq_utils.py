@@ -1,5 +1,6 @@
 import sys, os
 import sysfs_paths as sysfs
+import sysfs_reader as sfr
 
 # Userspace cpu frequency governor and utilities for XU3
 # Based on:
@@ -16,14 +17,12 @@ prev_govs = None
 # Return list of ints of available frequencies, sorted from least to greatest.
 def getAvailFreqs(cpu_num):
 	cluster = (cpu_num//4)
-	if cluster == 0:
-		freqs = open(sysfs.little_cluster_freq_range, 'r').read().strip().split(' ')
-	elif cluster == 1:
-		freqs = open(sysfs.big_cluster_freq_range, 'r').read().strip().split(' ')
-	else:
+	if cluster != 0 and cluster != 1:
 		print("This cluster ({}) doesn't exist!".format(cluster))
 		return None
-	return list(reversed([int(f.strip()) for f in freqs]))
+	with open(sysfs.fn_cluster_freq_range.format(cluster*4), 'r') as f:
+		freqs = f.read().split()
+	return sorted([int(f) for f in freqs])
 
 # As with note at top of this file, clusters should be selected using CORE numbers.
 def setUserSpace(clusters=None):
@@ -69,9 +68,10 @@ def unsetUserSpace(clusters=None):
 			f.write(prev_govs[i])
 
 # As with note at top of this file, clusters should be selected using CORE numbers.
+# Reads go through the persistent sysfs reader (one descriptor per file).
+freq_read_paths = [sysfs.fn_cpu_freq_read.format(i) for i in range(8)]
 def getClusterFreq(cpu_num):
-	with open(sysfs.fn_cpu_freq_read.format(cpu_num), 'r') as f:
-		return int(f.read().strip())
+	return sfr.read_int(freq_read_paths[cpu_num])
 	
 # Accepts frequency in khz as int or string
 # As with note at top of this file, clusters should be selected using CORE numbers.
@@ -81,18 +81,18 @@ def setClusterFreq(cpu_num, frequency):
 	
 
 def getGPUFreq():
-	with open(sysfs.gpu_freq, 'r') as f:
-		return int(f.read().strip()) * 1000 
+	return sfr.read_int(sysfs.gpu_freq) * 1000 
 
 def getMemFreq():
 	#with open(sysfs.mem_freq, 'r') as f:
 	#return int(f.read().strip()) 
 	return int(750000)
 
+thermal_paths = [sysfs.fn_thermal_sensor.format(i) for i in range(5)]
 def getTemps():
 	templ = []
-	for i in range(5):
-		temp = float(file(sysfs.fn_thermal_sensor.format(i),'r').readline().strip())/1000
+	for path in thermal_paths:
+		temp = sfr.read_int(path)/1000.0
 		templ.append(temp)
 	# Note: on the 5422, cpu temperatures 5 and 7 (big cores 1 and 3, counting from 0)
 	# appear to be swapped.
@@ -108,15 +108,15 @@ def cpuVoltage(n):
 	# 0 is little cluster
 	# 4 is big cluster
 	if n == 0:
-		temp = float(file(sysfs.little_micro_volts, 'r').readline().strip())/1000000
+		temp = sfr.read_int(sysfs.little_micro_volts)/1000000.0
 	elif n == 4:
-		temp = float(file(sysfs.big_micro_volts, 'r').readline().strip())/1000000
+		temp = sfr.read_int(sysfs.big_micro_volts)/1000000.0
 	else:
 		raise Exception('Error: {} is not a supported resource ID for voltage.'.format(n))
 	return temp
 
 def GPUVoltage():
-	return float(file(sysfs.gpu_micro_volts, 'r').readline().strip())/1000000
+	return sfr.read_int(sysfs.gpu_micro_volts)/1000000.0
 
 def memVoltage():
-	return float(file(sysfs.mem_micro_volts, 'r').readline().strip())/1000000
+	return sfr.read_int(sysfs.mem_micro_volts)/1000000.0
@@ -0,0 +1,64 @@
+import numpy as np
+
+# Watkins Q(lambda) eligibility trace for the dense Q table.
+# The trace is a bounded list of the most recently visited (state, action)
+# cells, as flat indices into Q.reshape(-1), with their eligibilities, most
+# recent first. Each step the TD error of the newest transition updates every
+# cell in the trace at once, scaled by its eligibility, and the eligibilities
+# decay by GAMMA * lambda. So a reward such as a thermal penalty reaches the
+# actions of several periods back in one step instead of one step per visit.
+#
+# Traces are replacing: a revisited cell moves to the front with eligibility 1,
+# so cells in the trace are unique and the update is one fancy-indexed add.
+# Past `length` entries the oldest one is dropped, which bounds the work per
+# step ((GAMMA * lambda)^length is negligible for any useful length).
+# Watkins' rule: after an exploratory (non-greedy) action the trace is cut,
+# since the following rewards say nothing about the greedy policy before it.
+
+class EligibilityTrace(object):
+    '''
+    Qf: dense Q as (states, actions); updated in place.
+    decay: GAMMA * lambda.
+    length: maximum number of cells in the trace.
+    '''
+    def __init__(self, Qf, decay, length):
+        self.Qv = Qf.reshape(-1)
+        self.actions = Qf.shape[1]
+        self.decay = decay
+        self.cells = np.zeros(length, dtype=np.intp)
+        self.e = np.zeros(length)
+        self.n = 0
+
+    '''
+    Q(lambda) update for the transition (s, a, r, s_next), flat states.
+    Returns the new Q[s, a].
+    '''
+    def update(self, s, a, r, s_next, alpha, gamma):
+        Qv = self.Qv
+        cells = self.cells
+        e = self.e
+        n = self.n
+        c = s * self.actions + a
+        # Move c to the front, dropping its old entry or the oldest one:
+        hit = np.flatnonzero(cells[:n] == c)
+        if len(hit):
+            j = hit[0]
+        else:
+            j = min(n, len(cells) - 1)
+            n = min(n + 1, len(cells))
+        cells[1:j+1] = cells[:j]
+        e[1:j+1] = e[:j]
+        cells[0] = c
+        e[0] = 1.0
+        first = s_next * self.actions
+        delta = r + gamma * float(Qv[first:first + self.actions].max()) - float(Qv[c])
+        Qv[cells[:n]] += alpha * delta * e[:n]
+        e[:n] *= self.decay
+        self.n = n
+        return Qv[c]
+
+    '''
+    Clear the trace (after an exploratory action).
+    '''
+    def cut(self):
+        self.n = 0
@@ -0,0 +1,144 @@
+import numpy as np
+import argparse
+import time
+
+import board_sim as bs
+import trace_replay
+
+# Least-squares fit of the board_sim power and thermal constants to the
+# power and temp columns of recorded raw.npy dumps.
+#
+# Power: the recorded cluster power is modelled as every core running the
+# recorded phase,
+#     P = NUM_CORES * (V^2 f (C_EFF * usage + C_IPC * IPC_p) + LEAK_SCALE * leak(V, T))
+# which is linear in the three constants: ordinary least squares, with the
+# columns scaled to unit range first.
+#
+# Thermal: the network of thermal_matrices() is driven with the power the
+# simulator itself would compute (the fitted power model, leakage at the
+# simulated core temperature) and its core temperature is compared with the
+# recorded one. R_CORE, C_CORE, R_HS, C_HS and BASE_POWER, plus the initial
+# heat sink temperature of every trace, are fitted by Levenberg-Marquardt on
+# the logarithms of the constants (so they stay positive), with a forward
+# difference Jacobian. T_AMB trades off against BASE_POWER and is kept; so
+# are R_LAT and the GPU node, which the core temperatures do not constrain.
+#
+# Usage: python fit_board_sim.py <raw.npy> [...] [--iterations N]
+# prints the fitted constants and, with them, the overlap of the temperature
+# distributions of board_sim.replay_temps() and each recording (run it again
+# after copying the constants into board_sim.py).
+
+THERMAL_NAMES = ['R_CORE', 'C_CORE', 'R_HS', 'C_HS', 'BASE_POWER']
+
+'''
+Per-sample arrays of a trace the fit needs: V^2 f, usage, IPC_p, voltage,
+recorded power and temperature.
+'''
+def columns(trace):
+    stats = trace.stats
+    fi = np.asarray(trace.freq, dtype=np.intp) // 100000
+    return {'v2f': bs.v2f_lut[fi], 'usage': np.asarray(stats['usage'], dtype=np.double),
+            'ipc_p': np.asarray(stats['IPC_p'], dtype=np.double), 'volt': bs.volt_lut[fi],
+            'power': np.asarray(stats['power'], dtype=np.double),
+            'temp': np.asarray(stats['temp'], dtype=np.double)}
+
+'''
+C_EFF, C_IPC and LEAK_SCALE for the column dicts cols; also returns the RMS
+power error in W.
+'''
+def fit_power(cols):
+    X = np.vstack([bs.NUM_CORES * np.column_stack([c['v2f'] * c['usage'], c['v2f'] * c['ipc_p'],
+            bs.leakage_power(c['volt'], c['temp'] + 273.15)]) for c in cols])
+    y = np.concatenate([c['power'] for c in cols])
+    scale = np.abs(X).max(axis=0)
+    coef = np.linalg.lstsq(X / scale, y, rcond=None)[0] / scale
+    return coef, np.sqrt(np.mean((y - X.dot(coef)) ** 2))
+
+'''
+Simulated core temperatures of one trace (column dict c) for the thermal
+constants theta (THERMAL_NAMES order), the power constants coef and the
+initial heat sink temperature hs0.
+'''
+def simulate(c, period, theta, coef, hs0):
+    r_core, c_core, r_hs, c_hs, base = theta
+    c_eff, c_ipc, leak_scale = coef
+    Ad, Bd = bs.thermal_matrices(period, c_core=c_core, r_core=r_core, c_hs=c_hs, r_hs=r_hs)
+    # Every core runs the same phase, so the cores stay at one temperature:
+    AdT, BdT = Ad.T, Bd.T
+    p_dyn = c['v2f'] * (c_eff * c['usage'] + c_ipc * c['ipc_p'])
+    leak_v = leak_scale * c['volt']
+    x = np.full(bs.NUM_NODES, hs0 - bs.T_AMB)
+    x[:bs.NUM_CORES] = c['temp'][0] - bs.T_AMB
+    p = np.zeros(bs.NUM_NODES)
+    p[bs.GPU] = bs.GPU_POWER
+    p[bs.HS] = base
+    temps = np.empty(len(p_dyn))
+    leak = bs.leakage_power
+    for k in range(len(p_dyn)):
+        p[:bs.NUM_CORES] = p_dyn[k] + leak_v[k] * leak(1.0, x[0] + bs.T_AMB + 273.15)
+        x = x.dot(AdT) + p.dot(BdT)
+        temps[k] = x[0]
+    return temps + bs.T_AMB
+
+'''
+Levenberg-Marquardt fit of the thermal constants (see the top of the file)
+for the column dicts cols recorded at the given periods. Returns the
+constants, the initial heat sink temperatures and the RMS error in K.
+'''
+def fit_thermal(cols, periods, coef, iterations=50, verbose=False):
+    q = np.concatenate([np.log([bs.R_CORE, bs.C_CORE, bs.R_HS, bs.C_HS, bs.BASE_POWER]),
+            [c['temp'][0] for c in cols]])
+    n = len(THERMAL_NAMES)
+    def residuals(q):
+        theta = np.exp(q[:n])
+        return np.concatenate([simulate(c, period, theta, coef, q[n + j]) - c['temp']
+                for j, (c, period) in enumerate(zip(cols, periods))])
+    r = residuals(q)
+    damping = 1e-2
+    for it in range(iterations):
+        J = np.empty((len(r), len(q)))
+        for i in range(len(q)):
+            h = 1e-4 if i < n else 1e-3
+            dq = np.zeros(len(q))
+            dq[i] = h
+            J[:, i] = (residuals(q + dq) - r) / h
+        A = J.T.dot(J)
+        g = J.T.dot(r)
+        while damping < 1e8:
+            step = np.linalg.solve(A + damping * np.diag(np.diag(A)), -g)
+            r_new = residuals(q + step)
+            if r_new.dot(r_new) < r.dot(r):
+                q, r = q + step, r_new
+                damping = max(damping / 3, 1e-7)
+                break
+            damping *= 4
+        if verbose:
+            print("iteration {}: RMS {:.3f} K".format(it, np.sqrt(np.mean(r ** 2))))
+        if damping >= 1e8 or np.abs(step).max() < 1e-5:
+            break
+    return np.exp(q[:n]), q[n:], np.sqrt(np.mean(r ** 2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the board_sim power and thermal constants to recorded traces.")
+    parser.add_argument('paths', nargs='+', help="raw.npy dumps (with power and temp columns)")
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    traces = [trace_replay.load(p) for p in args.paths]
+    cols = [columns(t) for t in traces]
+    coef, power_rms = fit_power(cols)
+    print("C_EFF = {:.3g}\nC_IPC = {:.3g}\nLEAK_SCALE = {:.3g}".format(*coef))
+    print("power RMS error {:.3f} W".format(power_rms))
+    start = time.time()
+    theta, hs0, temp_rms = fit_thermal(cols, [t.period for t in traces], coef,
+            args.iterations, verbose=True)
+    for name, value in zip(THERMAL_NAMES, theta):
+        print("{} = {:.3g}".format(name, value))
+    print("temperature RMS error {:.2f} K ({:.0f} s)".format(temp_rms, time.time() - start))
+    print("Overlap with board_sim's current constants:")
+    for path, t in zip(args.paths, traces):
+        recorded = np.asarray(t.stats['temp'])
+        simulated = bs.replay_temps(t)
+        print("  {}: {:.2f} (median {:.1f} vs {:.1f} recorded)".format(path,
+                bs.temperature_overlap(simulated, recorded), np.median(simulated), np.median(recorded)))
@@ -0,0 +1,234 @@
+from multiprocessing import RawArray
+import numpy as np
+import errno
+import fcntl
+import os
+import threading
+import time
+
+import loop_timing as lt
+
+# Event-driven cluster frequency arbiter.
+# Each per-core runner process publishes its requested frequency, with the
+# core's temperature and utilization, into its own slot of a shared memory
+# block and writes one byte to a pipe. The arbiter sleeps on the pipe, so it
+# wakes as soon as any core publishes (instead of on a timer), reads every
+# slot, combines the requests with the configured policy and actuates only
+# when the result differs from the frequency it last applied.
+#
+# Slots are guarded by a sequence counter each (seqlock, as in sensor_hub):
+# the publisher makes the counter odd while it writes and even again when
+# done; the arbiter retries a slot whose counter was odd or changed while it
+# copied the values. Publishers never wait for the arbiter.
+#
+# Policies (arbitrate()):
+#   max      highest request (no core gets less than it asked for)
+#   thermal  average of the requests weighted by 1 / (degrees below the
+#            thermal limit), so cores close to the limit dominate
+#   util     average of the requests weighted by core utilization
+#   quorum   highest frequency requested by at least `quorum` cores
+#
+# For every request the arbiter records the time from publishing to the
+# completion of the cpufreq write that applied the arbitrated frequency (the
+# actuator reports completed writes through on_applied), or to the
+# arbitration itself when the cluster already runs at that frequency. The
+# latencies go into a log-linear histogram (loop_timing), reported by
+# stats().
+#
+# A reader that finds a slot mid-update yields the CPU (the publisher may be
+# waiting for it) and gives up after READ_RETRIES attempts, keeping that
+# slot's previous copy, so a publisher that died mid-write cannot hang the
+# arbiter.
+#
+# Slot layout (doubles):
+#   [0] sequence counter
+#   [1] requested frequency (KHz); 0 until the core first publishes
+#   [2] temperature
+#   [3] utilization
+#   [4] publish time (loop_timing.now_ns())
+SEQ = 0
+FREQ = 1
+TEMP = 2
+UTIL = 3
+STAMP = 4
+SLOT = 5
+
+READ_RETRIES = 100
+
+POLICIES = ['max', 'thermal', 'util', 'quorum']
+
+# Histograms recorded by the arbiter:
+REQUEST, ARBITRATE = range(2)
+STAGE_NAMES = ['request', 'arbitrate']
+
+'''
+Combine the requests of the cores (arrays) into one cluster frequency.
+limit: thermal limit in degrees C for 'thermal'; quorum: cores for 'quorum'.
+'''
+def arbitrate(policy, freqs, temps, utils, limit=None, quorum=2):
+    if policy == 'max':
+        return freqs.max()
+    if policy == 'thermal':
+        if limit is None:
+            raise Exception("The thermal arbitration policy needs a thermal limit.")
+        weights = 1.0 / np.maximum(limit - temps, 1.0)
+        return np.dot(weights, freqs) / weights.sum()
+    if policy == 'util':
+        weights = np.maximum(utils, 1e-3)
+        return np.dot(weights, freqs) / weights.sum()
+    if policy == 'quorum':
+        ranked = np.sort(freqs)[::-1]
+        return ranked[min(quorum, len(ranked)) - 1]
+    raise Exception("Unknown arbitration policy {}".format(policy))
+
+
+class FreqArbiter(object):
+    '''
+    cores: number of publishing cores (slots).
+    actuator: freq_actuator.FreqActuator of the cluster (snap() and request()).
+    policy, limit, quorum: see arbitrate().
+    Create it before forking the publishers, which inherit the slots and pipe.
+    '''
+    def __init__(self, cores, actuator, policy='max', limit=None, quorum=2, period=0.05):
+        if policy not in POLICIES:
+            raise Exception("Unknown arbitration policy {}".format(policy))
+        if policy == 'thermal' and limit is None:
+            raise Exception("The thermal arbitration policy needs a thermal limit.")
+        self.cores = cores
+        self.actuator = actuator
+        self.policy = policy
+        self.limit = limit
+        self.quorum = quorum
+        self.shm = RawArray('d', SLOT * cores)
+        self.bell_r, self.bell_w = os.pipe()
+        fcntl.fcntl(self.bell_w, fcntl.F_SETFL, fcntl.fcntl(self.bell_w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.slots = np.zeros((cores, SLOT))
+        self.seen = [0.0] * cores
+        # Publish stamps of requests waiting for the write of self.target,
+        # shared with the actuator's writer thread:
+        self.waiting = []
+        self.lock = threading.Lock()
+        actuator.on_applied = self._applied
+        self.target = None
+        self.wakeups = 0
+        self.actuations = 0
+        self.unchanged = 0
+        self.torn_reads = 0
+        self.timer = lt.LoopTimer(period, STAGE_NAMES)
+
+    '''
+    Publisher side (one process per slot): publish a request and wake the
+    arbiter.
+    '''
+    def publish(self, i, freq, temp, util):
+        shm = self.shm
+        base = i * SLOT
+        shm[base + SEQ] += 1
+        shm[base + FREQ] = freq
+        shm[base + TEMP] = temp
+        shm[base + UTIL] = util
+        shm[base + STAMP] = lt.now_ns()
+        shm[base + SEQ] += 1
+        try:
+            os.write(self.bell_w, b'\0')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    '''
+    Consistent copy of every slot, as a (cores, SLOT) array. A slot that stays
+    mid-update for READ_RETRIES attempts keeps its previous copy.
+    '''
+    def read(self):
+        shm = self.shm
+        slots = self.slots
+        for i in range(self.cores):
+            base = i * SLOT
+            for _ in range(READ_RETRIES):
+                seq = shm[base + SEQ]
+                if not int(seq) & 1:
+                    vals = shm[base:base + SLOT]
+                    if shm[base + SEQ] == seq:
+                        slots[i] = vals
+                        break
+                time.sleep(0)
+            else:
+                self.torn_reads += 1
+        return slots
+
+    '''
+    One arbitration: combine the published requests and actuate if the
+    cluster frequency changes. Returns the target frequency (None before any
+    core published).
+    '''
+    def arbitrate_once(self):
+        t = lt.now_ns()
+        slots = self.read()
+        published = slots[:, FREQ] > 0
+        if not published.any():
+            return None
+        p = slots[published]
+        target = self.actuator.snap(arbitrate(self.policy, p[:, FREQ], p[:, TEMP], p[:, UTIL],
+                self.limit, self.quorum))
+        # Requests published since the last arbitration:
+        stamps = []
+        for i in range(self.cores):
+            stamp = slots[i, STAMP]
+            if stamp != self.seen[i] and published[i]:
+                self.seen[i] = stamp
+                stamps.append(int(stamp))
+        changed = target != self.target
+        with self.lock:
+            self.target = target
+            if not changed and self.actuator.applied == target:
+                done = lt.now_ns()
+                for stamp in stamps:
+                    self.timer.record(REQUEST, done - stamp)
+            else:
+                self.waiting.extend(stamps)
+        # Outside the lock: a synchronous actuator calls _applied() from here.
+        if changed:
+            self.actuator.request(target)
+            self.actuations += 1
+        else:
+            self.unchanged += 1
+        self.timer.record(ARBITRATE, lt.now_ns() - t)
+        return target
+
+    '''
+    Actuator callback: a write of frequency completed at t_ns. Requests waiting
+    for the current target are complete; a superseded target keeps them
+    waiting for the next write.
+    '''
+    def _applied(self, frequency, t_ns):
+        with self.lock:
+            if frequency != self.target:
+                return
+            for stamp in self.waiting:
+                self.timer.record(REQUEST, t_ns - stamp)
+            del self.waiting[:]
+
+    '''
+    Arbitrate on every wakeup until the publishers close the pipe (forever
+    while this process holds its write end).
+    '''
+    def run(self):
+        while True:
+            if len(os.read(self.bell_r, 4096)) == 0:
+                return
+            self.wakeups += 1
+            self.arbitrate_once()
+
+    def stats(self):
+        timer = self.timer
+        return {
+            'policy': self.policy,
+            'wakeups': self.wakeups,
+            'actuations': self.actuations,
+            'unchanged': self.unchanged,
+            'torn_reads': self.torn_reads,
+            'request_to_apply_p50_us': timer.percentile(REQUEST, 50) / 1000.0,
+            'request_to_apply_p99_us': timer.percentile(REQUEST, 99) / 1000.0,
+            'request_to_apply_max_us': timer.maxs[REQUEST] / 1000.0,
+            'arbitrate_p50_us': timer.percentile(ARBITRATE, 50) / 1000.0,
+            }
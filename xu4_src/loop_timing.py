@@ -0,0 +1,156 @@
+import signal
+import sys
+import time
+
+# Control loop stage timing.
+# Each stage of a control period is timestamped with a nanosecond clock and
+# its duration goes into a fixed-size log-linear (HDR style) histogram:
+# values below 16 ns get their own bin, above that every power of two is
+# split into 8 sub-bins, i.e. ~12% resolution from nanoseconds to hours with
+# a few hundred integer bins per stage and no allocation per sample.
+#
+# A decision that lands more than one period after the wakeup that triggered
+# it arrives after the kernel module's next sample; those are counted as
+# overruns.
+#
+# Histograms are dumped by dump(), on SIGUSR1 once install_signal() was
+# called (kill -USR1 <pid>), and at cleanup.
+
+# Stages of a control period:
+COUNTERS, SENSORS, BUCKET, UPDATE, ARGMAX, ACTUATE, WAIT, DECISION, REPLAY = range(9)
+STAGE_NAMES = ['counters', 'sensors', 'bucket', 'Q update', 'argmax', 'actuate', 'wait', 'decision',
+        'replay']
+
+SUB_BITS = 3
+SUB_BINS = 1 << SUB_BITS
+# 2**43 ns is over two hours:
+NUM_BINS = (43 - SUB_BITS) * SUB_BINS + 2 * SUB_BINS
+
+if hasattr(time, 'perf_counter_ns'):
+    now_ns = time.perf_counter_ns
+else:
+    def now_ns():
+        return int(time.time() * 1000000000)
+
+'''
+Histogram bin of a duration in ns.
+'''
+def bin_index(ns):
+    if ns < 2 * SUB_BINS:
+        return ns if ns > 0 else 0
+    shift = ns.bit_length() - SUB_BITS - 1
+    idx = shift * SUB_BINS + (ns >> shift)
+    return idx if idx < NUM_BINS else NUM_BINS - 1
+
+'''
+Smallest duration in ns that falls in bin idx.
+'''
+def bin_value(idx):
+    if idx < 2 * SUB_BINS:
+        return idx
+    shift = idx // SUB_BINS - 1
+    return (idx - shift * SUB_BINS) << shift
+
+
+class LoopTimer(object):
+    def __init__(self, period, stage_names=STAGE_NAMES):
+        self.period_ns = int(period * 1000000000)
+        self.stage_names = stage_names
+        self.hists = [[0] * NUM_BINS for _ in stage_names]
+        self.maxs = [0] * len(stage_names)
+        self.overruns = 0
+        self.start()
+
+    '''
+    Start timing from now. Call just before entering the control loop, so the
+    first period does not include the setup before it.
+    '''
+    def start(self):
+        self.t = now_ns()
+        self.t_wake = self.t
+
+    '''
+    End the current stage: record the time since the previous mark.
+    Marking WAIT also starts a new period.
+    '''
+    def mark(self, stage):
+        t = now_ns()
+        ns = t - self.t
+        self.t = t
+        self.record(stage, ns)
+        if stage == WAIT:
+            self.t_wake = t
+
+    '''
+    Add a duration measured elsewhere to a stage's histogram.
+    '''
+    def record(self, stage, ns):
+        self.hists[stage][bin_index(ns)] += 1
+        if ns > self.maxs[stage]:
+            self.maxs[stage] = ns
+
+    '''
+    The action for this period has been applied: record the wakeup to
+    decision latency and count an overrun if it took more than a period.
+    Returns the latency in ns.
+    '''
+    def decided(self):
+        ns = now_ns() - self.t_wake
+        self.hists[DECISION][bin_index(ns)] += 1
+        if ns > self.maxs[DECISION]:
+            self.maxs[DECISION] = ns
+        if ns > self.period_ns:
+            self.overruns += 1
+        return ns
+
+    def percentile(self, stage, p):
+        hist = self.hists[stage]
+        total = sum(hist)
+        if total == 0:
+            return 0
+        target = total * p / 100.0
+        seen = 0
+        for idx, count in enumerate(hist):
+            seen += count
+            if seen >= target:
+                return bin_value(idx)
+        return self.maxs[stage]
+
+    def dump(self, out=None):
+        out = out if out is not None else sys.stderr
+        out.write("{:>10} {:>8} {:>10} {:>10} {:>10} {:>10}\n".format(
+                "stage", "count", "p50 us", "p90 us", "p99 us", "max us"))
+        for stage, name in enumerate(self.stage_names):
+            count = sum(self.hists[stage])
+            if count == 0:
+                continue
+            out.write("{:>10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}\n".format(
+                    name, count,
+                    self.percentile(stage, 50) / 1000.0,
+                    self.percentile(stage, 90) / 1000.0,
+                    self.percentile(stage, 99) / 1000.0,
+                    self.maxs[stage] / 1000.0))
+        out.write("Overruns (decision after next sample): {}\n".format(self.overruns))
+        out.flush()
+
+    def install_signal(self, signum=signal.SIGUSR1):
+        signal.signal(signum, lambda s, f: self.dump())
+
+
+class NullTimer(object):
+    '''
+    Stand-in used when timing is disabled.
+    '''
+    overruns = 0
+    def start(self):
+        pass
+    def mark(self, stage):
+        pass
+    def record(self, stage, ns):
+        pass
+    def decided(self):
+        return 0
+    def dump(self, out=None):
+        pass
+    def install_signal(self, signum=signal.SIGUSR1):
+        pass
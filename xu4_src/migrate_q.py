@@ -0,0 +1,152 @@
+import numpy as np
+import argparse
+import os
+
+import checkpoint as ckpt
+
+# Q table migration between state space configurations.
+# A dense Q trained with one set of BUCKETS, MINS/MAXS, LABELS or FREQ_STEP is
+# remapped onto the grid of another, using the configuration stored in the
+# checkpoint metadata (see RL_gov.checkpoint_meta()):
+#
+# - label axes: every new bucket takes the average of the old buckets it
+#   overlaps, weighted by the overlap length. The outer buckets of both grids
+#   reach past their limits (bucket_state() clips values into them).
+# - frequency axis of the state: overlap in base frequencies (a state index
+#   covers the base frequencies from its action frequency up to the next).
+# - labels only in the new configuration: old values repeated along the axis.
+#   Labels only in the old one: averaged out.
+# - actions: linear interpolation in frequency between the old actions.
+#
+# Averages only count states that were visited (a nonzero Q row, or a row
+# marked in the visit table C), so the zeros of unvisited states do not
+# dilute the learned values. New states overlapping no visited state start
+# at zero; the others are marked visited in the new C.
+#
+# RL_gov.load_statespace() migrates automatically when the stored
+# configuration differs. Standalone:
+#   python migrate_q.py <old Q.npy> <old Q.json> [--visits C.npy]
+# writes the migrated table as the checkpoint of the current
+# state_space_params (an old checkpoint at the same path is kept as .bak).
+
+'''
+Bucket edges of label k in a stored configuration.
+'''
+def label_edges(config, k):
+    if 'edges' in config and k in config['edges']:
+        return np.array(config['edges'][k], dtype=np.double)
+    return np.linspace(config['MINS'][k], config['MAXS'][k], int(config['BUCKETS'][k]) + 1)
+
+'''
+Overlap length of new buckets (rows) with old buckets (columns).
+'''
+def overlap(old_edges, new_edges):
+    lo = min(old_edges[0], new_edges[0])
+    hi = max(old_edges[-1], new_edges[-1])
+    old_edges = old_edges.copy()
+    new_edges = new_edges.copy()
+    old_edges[0] = new_edges[0] = lo
+    old_edges[-1] = new_edges[-1] = hi
+    left = np.maximum(new_edges[:-1, None], old_edges[None, :-1])
+    right = np.minimum(new_edges[1:, None], old_edges[None, 1:])
+    return np.clip(right - left, 0.0, None)
+
+'''
+State frequency index of each base frequency: the last action frequency at
+or below it (i // FREQ_STEP for big_freqs = big_freqs_base[0::FREQ_STEP]).
+'''
+def freq_states(big_freqs, base_freqs):
+    return np.clip(np.searchsorted(big_freqs, base_freqs, side='right') - 1, 0, None)
+
+'''
+Number of base frequencies shared by new (rows) and old (columns) frequency
+state indices.
+'''
+def freq_overlap(old_freqs, new_freqs, base_freqs):
+    W = np.zeros((len(new_freqs), len(old_freqs)))
+    np.add.at(W, (freq_states(new_freqs, base_freqs), freq_states(old_freqs, base_freqs)), 1.0)
+    return W
+
+'''
+Linear interpolation weights of the new action frequencies (rows) over the
+old ones (columns); frequencies outside the old range take the end action.
+'''
+def action_weights(old_freqs, new_freqs):
+    eye = np.eye(len(old_freqs))
+    return np.array([np.interp(new_freqs, old_freqs, eye[a]) for a in range(len(old_freqs))]).T
+
+'''
+Contract axis of A with the columns of W.
+'''
+def apply(W, A, axis):
+    return np.moveaxis(np.tensordot(W, A, axes=([1], [axis])), 0, axis)
+
+'''
+Remap the dense table Q of configuration old onto configuration new (both
+dicts with LABELS, BUCKETS, MINS, MAXS, FREQ_IN_STATE and big_freqs, as in the
+checkpoint metadata). base_freqs: all frequencies of the cluster. visits: old
+visit table (same shape as Q), counted as visited in addition to nonzero rows.
+Returns the new table (float64) and the mask of new states that got values.
+'''
+def migrate(Q, old, new, base_freqs, visits=None):
+    Q = np.asarray(Q, dtype=np.double)
+    visited = np.any(Q != 0, axis=-1)
+    if visits is not None:
+        visited |= np.any(visits != 0, axis=-1)
+    A = Q * visited[..., None]
+    M = visited.astype(np.double)
+    old_axes = list(old['LABELS']) + (['freq'] if old['FREQ_IN_STATE'] else [])
+    new_axes = list(new['LABELS']) + (['freq'] if new['FREQ_IN_STATE'] else [])
+    # Average out the axes the new configuration drops:
+    drop = tuple(j for j, k in enumerate(old_axes) if k not in new_axes)
+    A = A.sum(axis=drop)
+    M = M.sum(axis=drop)
+    kept = [k for k in old_axes if k in new_axes]
+    order = [kept.index(k) for k in new_axes if k in kept]
+    A = A.transpose(order + [len(kept)])
+    M = M.transpose(order)
+    for j, k in enumerate(new_axes):
+        if k not in kept:
+            A = np.expand_dims(A, j)
+            M = np.expand_dims(M, j)
+            n = len(new['big_freqs']) if k == 'freq' else int(new['BUCKETS'][k])
+            W = np.ones((n, 1))
+        elif k == 'freq':
+            W = freq_overlap(old['big_freqs'], new['big_freqs'], base_freqs)
+        else:
+            W = overlap(label_edges(old, k), label_edges(new, k))
+        A = apply(W, A, j)
+        M = apply(W, M, j)
+    covered = M > 0
+    Q_states = np.zeros(A.shape)
+    np.divide(A, M[..., None], out=Q_states, where=covered[..., None])
+    W = action_weights(np.array(old['big_freqs'], dtype=np.double),
+            np.array(new['big_freqs'], dtype=np.double))
+    return apply(W, Q_states, Q_states.ndim - 1), covered
+
+
+if __name__ == "__main__":
+    import RL_gov
+    parser = argparse.ArgumentParser(description="Remap a dense Q onto the current state space configuration.")
+    parser.add_argument('q', help="old Q checkpoint (.npy)")
+    parser.add_argument('meta', help="metadata of the old checkpoint (.json)")
+    parser.add_argument('--visits', default=None, help="old visit table (.npy)")
+    args = parser.parse_args()
+
+    if RL_gov.Q is None:
+        parser.error("migration needs the dense Q backend")
+    meta = ckpt.load_meta(args.meta)
+    visits = np.load(args.visits) if args.visits is not None else None
+    Q_new, covered = migrate(np.load(args.q, mmap_mode='r'), meta['config'],
+            RL_gov.state_config(), RL_gov.big_freqs_base, visits)
+    print("{} -> {}: {} of {} states covered".format(
+            meta['config'].get('dims'), list(Q_new.shape), int(covered.sum()), covered.size))
+    for path in (RL_gov.statespace_file(), RL_gov.visits_file(), RL_gov.meta_file()):
+        if os.path.exists(path):
+            os.replace(path, path + ".bak")
+    RL_gov.Q[...] = Q_new
+    RL_gov.C[...] = covered[..., None]
+    RL_gov.trained_steps = meta['step']
+    RL_gov.checkpoint_statespace()
+    RL_gov.checkpointer.close()
+    print("Saved", RL_gov.statespace_file())
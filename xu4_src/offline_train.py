@@ -0,0 +1,180 @@
+import numpy as np
+import argparse
+import time
+import os
+
+import RL_gov
+import checkpoint
+from state_space_params import *
+import therm_params as tm
+import trace_recorder
+import trace_replay
+
+# Batched offline Q-learning.
+# Trains Q from arrays of logged transitions (state, action, reward, next
+# state) instead of one update_Q_off_policy() call per step. States are flat
+# indices into Q viewed as a (num_states, ACTIONS) table, so one batch of
+# transitions is a handful of whole-array operations:
+#
+#     targets = r + GAMMA * Qf[s_next].max(axis=1)
+#     Qf[s, a] += ALPHA * (targets - Qf[s, a])
+#
+# All targets of a batch are computed from Q as it was before the batch.
+# Transitions that hit the same (state, action) cell within one batch are
+# reduced to one update: by default their deltas are averaged (a segment
+# reduction over the cell index), with reduce='sum' they are added with
+# np.add.at like sequential updates with a frozen target would be.
+#
+# Usage: python offline_train.py <trace dir | raw.npy> [...] [--sweeps N]
+#                                [--alpha A] [--batch B] [--init] [--out Q.npy]
+# writes a checkpoint (Q_<period>ms.npy, C_<period>ms.npy and the
+# Q_<period>ms.json metadata), which load_statespace() picks up. With --out,
+# Q goes to the given file and its metadata next to it (<out>.json).
+
+BATCH = 65536
+
+'''
+Flat state indices for an (n, VARS) array of bucketed states, for the state
+space RL_gov is currently configured with.
+'''
+def flat_states(states):
+    return np.ravel_multi_index(tuple(np.asarray(states, dtype=np.intp).T), RL_gov.dims[:-1])
+
+'''
+One batched Q-learning update of the flat table Qf (num_states x ACTIONS),
+in place. s, a, s_next are int arrays of flat states and actions, r the
+rewards. Returns the TD errors of the batch.
+'''
+def batch_update(Qf, s, a, r, s_next, alpha=ALPHA, gamma=GAMMA, reduce='mean'):
+    cells = s * Qf.shape[1] + a
+    Qv = Qf.reshape(-1)
+    td = r + gamma * Qf[s_next].max(axis=1) - Qv[cells]
+    if reduce == 'sum':
+        np.add.at(Qv, cells, alpha * td)
+    elif Qv.size <= 4 * len(cells):
+        # Small table: dense per-cell sums, no sorting.
+        sums = np.bincount(cells, weights=td, minlength=Qv.size)
+        counts = np.bincount(cells, minlength=Qv.size)
+        hit = counts > 0
+        Qv[hit] += alpha * sums[hit] / counts[hit]
+    else:
+        # Sorted-segment reduction over the cells the batch touches:
+        uniq, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        sums = np.bincount(inverse, weights=td, minlength=len(uniq))
+        Qv[uniq] += alpha * sums / counts
+    return td
+
+'''
+Run sweeps over the transitions in batches of the given size. Batches are
+taken in a new random order every sweep when shuffle is set.
+Q (shape RL_gov.dims) is updated in place and returned.
+'''
+def train(Q, s, a, r, s_next, sweeps=10, alpha=ALPHA, gamma=GAMMA,
+        batch=BATCH, shuffle=True, reduce='mean', seed=None, verbose=False):
+    Qf = Q.reshape(-1, Q.shape[-1])
+    n = len(s)
+    rng = np.random.RandomState(seed)
+    for sweep in range(sweeps):
+        if shuffle:
+            order = rng.permutation(n)
+            s_, a_, r_, sn_ = s[order], a[order], r[order], s_next[order]
+        else:
+            s_, a_, r_, sn_ = s, a, r, s_next
+        sq_err = 0.0
+        for i in range(0, n, batch):
+            td = batch_update(Qf, s_[i:i+batch], a_[i:i+batch], r_[i:i+batch],
+                    sn_[i:i+batch], alpha, gamma, reduce)
+            sq_err += np.dot(td, td)
+        if verbose:
+            print("sweep {}: RMS TD error {:.6f}".format(sweep, np.sqrt(sq_err / max(n, 1))))
+    return Q
+
+###########################################################################
+# Building transitions:
+
+'''
+Transitions from a trace written by Q_learning() (see RL_gov.trace_row()).
+Row t holds the state seen and the action taken at step t; the reward on row
+t+1 is the reward of that action. Pairs of rows further apart than
+max_gap periods (restarts, lost samples) are dropped.
+'''
+def transitions_from_trace(trace, period=PERIOD, max_gap=1.5):
+    names = ['s_' + k for k in RL_gov.LABELS] + (['s_freq'] if RL_gov.FREQ_IN_STATE else [])
+    states = flat_states(np.column_stack([trace[k] for k in names]))
+    t_ns = np.asarray(trace['t_ns'], dtype=np.int64)
+    keep = np.diff(t_ns) <= max_gap * period * 1e9
+    s = states[:-1][keep]
+    a = np.asarray(trace['action'], dtype=np.intp)[:-1][keep]
+    r = np.asarray(trace['reward'], dtype=np.double)[1:][keep]
+    s_next = states[1:][keep]
+    return s, a, r, s_next
+
+'''
+Transitions from per-sample stats (e.g. a raw.npy dump loaded through
+trace_replay). The action of step t is the frequency the core ran at in step
+t+1, and its reward is computed from the stats of step t+1 with the
+governor's reward function.
+'''
+def transitions_from_stats(columns):
+    stats = {k: np.asarray(v, dtype=np.double) for k, v in columns.items()}
+    freq = stats['freq']
+    stats['volt'] = np.array([tm.big_f_to_v_MC1[f / 1000000] for f in freq])
+    states = RL_gov.encoder.encode_many(stats)
+    actions = RL_gov.freq_bucket_lut[freq.astype(np.intp) // 100000]
+    rewards = RL_gov.reward_terms(stats)[-1]
+    return states[:-1], actions[1:], rewards[1:], states[1:]
+
+'''
+Transitions from a trace directory or a raw.npy dump.
+'''
+def load_transitions(path):
+    if os.path.isdir(path):
+        return transitions_from_trace(trace_recorder.load_trace(path))
+    env = trace_replay.load(path)
+    columns = dict(env.stats)
+    columns['freq'] = env.freq
+    return transitions_from_stats(columns)
+
+###########################################################################
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched offline Q-learning from logged transitions.")
+    parser.add_argument('paths', nargs='+', help="trace directories or raw.npy dumps")
+    parser.add_argument('--sweeps', type=int, default=10)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--batch', type=int, default=BATCH)
+    parser.add_argument('--reduce', choices=['mean', 'sum'], default='mean')
+    parser.add_argument('--init', action='store_true', help="start from the saved statespace")
+    parser.add_argument('--out', default=None, help="save Q here instead of the checkpoint files")
+    args = parser.parse_args()
+
+    parts = [load_transitions(p) for p in args.paths]
+    s, a, r, s_next = [np.concatenate(x) for x in zip(*parts)]
+    print("{} transitions".format(len(s)))
+    if RL_gov.Q is None:
+        parser.error("offline training needs the dense Q backend")
+    Q = np.zeros(RL_gov.dims, dtype=RL_gov.Q_DTYPE)
+    if args.init:
+        RL_gov.load_statespace()
+        Q[...] = RL_gov.Q
+    start = time.time()
+    train(Q, s, a, r, s_next, args.sweeps, args.alpha, args.gamma, args.batch,
+            reduce=args.reduce, verbose=True)
+    elapsed = time.time() - start
+    print("{} updates in {:.2f} s ({:.0f} transitions/s)".format(
+            len(s) * args.sweeps, elapsed, len(s) * args.sweeps / elapsed))
+    # Saved through the checkpoint writer, so the visit table and metadata
+    # always describe the Q next to them:
+    RL_gov.Q[...] = Q
+    RL_gov.Cf[s, a] = 1
+    RL_gov.trained_steps += len(s) * args.sweeps
+    if args.out is None:
+        RL_gov.checkpoint_statespace()
+        print("Saved", RL_gov.statespace_file())
+    else:
+        writer = checkpoint.Checkpointer(args.out, None, os.path.splitext(args.out)[0] + ".json")
+        writer.save(RL_gov.qtable, None, RL_gov.checkpoint_meta(), RL_gov.trained_steps)
+        writer.close()
+        print("Saved", args.out)
@@ -0,0 +1,422 @@
+import numpy as np
+import os
+
+# Q function backends.
+# Every backend encodes stats records into its own state keys and is queried
+# and updated with them:
+#
+#   encode(stats)              state key of one stats record
+#   encode_many(rows)          state keys of a batch of records
+#   decode(stats, s)           per-label buckets of the state, for logs/traces
+#   row(s)                     action values of state s (read only)
+#   max(s), argmax(s)          best value / greedy action of state s
+#   argmax_many(states)        greedy actions of an array of states
+#   update(s, a, target, alpha)  move Q[s, a] toward target, returns the new value
+#   snapshot()                 copy of the table as a write(f) function, so a
+#                              checkpoint can be written from another thread
+#   save(path), load(path, mmap_mode)  checkpoints
+#
+# Values are stored as dtype (float64, float32 or float16) to save memory;
+# updates are computed in float64 and sums over several rows in at least
+# float32, so float16 only rounds what is stored.
+#
+# DenseQ is the np.zeros(dims) table. SparseQ only stores states that were
+# visited, so the state space can be far larger than memory. Both key states
+# by the flat index from state_encoder (a packed state integer). TileQ is a
+# linear function over tile-coded raw features, see below.
+
+class DenseQ(object):
+    '''
+    dims: state dimensions followed by the number of actions.
+    encoder: state_encoder.StateEncoder for the state dimensions.
+    dtype: storage type of the values.
+    '''
+    def __init__(self, dims, encoder, dtype=np.float64):
+        self.dims = list(dims)
+        self.Q = np.zeros(self.dims, dtype=dtype)
+        # Q as (states, actions):
+        self.Qf = self.Q.reshape(-1, self.dims[-1])
+        self.encoder = encoder
+        self.encode = encoder.encode
+        self.encode_many = encoder.encode_many
+
+    def decode(self, stats, s):
+        return self.encoder.decode(s)
+
+    def row(self, s):
+        return self.Qf[s]
+
+    def max(self, s):
+        return self.Qf[s].max()
+
+    def argmax(self, s):
+        return self.Qf[s].argmax()
+
+    def argmax_many(self, states):
+        return self.Qf[states].argmax(axis=1)
+
+    def update(self, s, a, target, alpha):
+        row = self.Qf[s]
+        old_value = float(row[a])
+        row[a] = old_value + alpha*(target - old_value)
+        return row[a]
+
+    def nbytes(self):
+        return self.Q.nbytes
+
+    def snapshot(self):
+        Q = self.Q.copy()
+        return lambda f: np.save(f, Q)
+
+    def save(self, path):
+        replace_file(path, self.snapshot())
+
+    '''
+    mmap_mode as for np.load: 'r' maps the checkpoint read-only (run mode,
+    pages shared between processes and only read in when touched), 'c' maps
+    it copy-on-write (training; only updated pages are copied, the file is
+    never written). A checkpoint of another dtype is converted in memory.
+    '''
+    def load(self, path, mmap_mode=None):
+        Q_t = np.load(path, mmap_mode=mmap_mode)
+        if Q_t.shape != self.Q.shape:
+            raise Exception("Mismatched loaded state space to desired statespace.")
+        if Q_t.dtype != self.Q.dtype:
+            Q_t = Q_t.astype(self.Q.dtype)
+        self.Q = np.asarray(Q_t)
+        self.Qf = self.Q.reshape(-1, self.dims[-1])
+
+
+'''
+Write a checkpoint to a temporary file with write(f) and rename it over path.
+A reader never sees a partial file, and a table memory-mapped from the old
+checkpoint keeps its pages (truncating the mapped file in place would not).
+The data is synced before the rename, so a power cut leaves the old or the
+new file.
+'''
+def replace_file(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# Open addressing (linear probing) with Fibonacci hashing of the state key:
+EMPTY = -1
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+class SparseQ(object):
+    '''
+    Visited-only Q table: an open-addressing hash of packed state integers to
+    rows of a preallocated (capacity, actions) array. Unvisited states read
+    as all zeros, like a fresh dense table.
+
+    actions: number of actions per state.
+    budget: memory budget in bytes; fixes the capacity (a power of two).
+    encoder: state_encoder.StateEncoder producing the state keys.
+    dtype: storage type of the values.
+    When the table is MAX_LOAD full, an eviction round drops about the
+    EVICT_FRACTION least recently used states: their cutoff tick is estimated
+    from EVICT_SAMPLE sampled slots, and a clock hand sweeps the table
+    EVICT_SCAN slots per insert, deleting the slots at or below it (with
+    backward-shift deletion, so no tombstones are left). No insert pays for
+    more than its share of the sweep, unless the table reaches HARD_LOAD.
+    '''
+    MAX_LOAD = 0.75
+    HARD_LOAD = 0.9
+    EVICT_FRACTION = 0.125
+    EVICT_SAMPLE = 1024
+    EVICT_SCAN = 64
+
+    def __init__(self, actions, budget, encoder, dtype=np.float64):
+        self.actions = actions
+        self.encoder = encoder
+        self.encode = encoder.encode
+        self.encode_many = encoder.encode_many
+        slot_bytes = 8 + np.dtype(dtype).itemsize * actions + 8
+        bits = 4
+        while (2 << bits) * slot_bytes <= budget:
+            bits += 1
+        self.capacity = 1 << bits
+        self.mask = self.capacity - 1
+        self.shift = 64 - bits
+        self.keys = np.full(self.capacity, EMPTY, dtype=np.int64)
+        self.rows = np.zeros((self.capacity, actions), dtype=dtype)
+        # Tick of the last access, for LRU eviction:
+        self.used = np.zeros(self.capacity, dtype=np.int64)
+        self.count = 0
+        self.max_count = int(self.capacity * self.MAX_LOAD)
+        self.hard_count = int(self.capacity * self.HARD_LOAD)
+        self.tick = 0
+        self.evictions = 0
+        # Eviction round in progress: clock hand, LRU cutoff tick, states
+        # still to evict and slots still to sweep:
+        self.hand = 0
+        self.cutoff = 0
+        self.evict_left = 0
+        self.sweep_left = 0
+        self.zero_row = np.zeros(actions, dtype=dtype)
+        self.zero_row.flags.writeable = False
+
+    '''
+    Slot holding key, or -1 - (the empty slot where it would go).
+    '''
+    def _slot(self, key):
+        i = ((key * GOLDEN) & MASK64) >> self.shift
+        keys = self.keys
+        mask = self.mask
+        while True:
+            k = keys[i]
+            if k == key:
+                return i
+            if k == EMPTY:
+                return -1 - i
+            i = (i + 1) & mask
+
+    def _find(self, s):
+        i = self._slot(s)
+        if i >= 0:
+            self.tick += 1
+            self.used[i] = self.tick
+        return i
+
+    def _insert(self, s):
+        if self.count >= self.max_count and self.evict_left <= 0:
+            self._start_eviction()
+        if self.evict_left > 0:
+            self._evict_step()
+        i = -1 - self._slot(s)
+        self.keys[i] = s
+        self.rows[i] = 0.0
+        self.tick += 1
+        self.used[i] = self.tick
+        self.count += 1
+        return i
+
+    def _start_eviction(self):
+        step = max(1, self.capacity // self.EVICT_SAMPLE)
+        sample = self.used[::step][self.keys[::step] != EMPTY]
+        k = int(len(sample) * self.EVICT_FRACTION)
+        self.cutoff = int(np.partition(sample, k)[k]) if len(sample) else self.tick
+        self.evict_left = max(1, int(self.count * self.EVICT_FRACTION))
+        self.sweep_left = self.capacity
+
+    '''
+    Advance the eviction round by EVICT_SCAN slots (further while the table
+    is HARD_LOAD full).
+    '''
+    def _evict_step(self):
+        keys = self.keys
+        used = self.used
+        mask = self.mask
+        cutoff = self.cutoff
+        i = self.hand
+        budget = self.EVICT_SCAN
+        while self.evict_left > 0 and (budget > 0 or self.count >= self.hard_count):
+            budget -= 1
+            if keys[i] != EMPTY and used[i] <= cutoff:
+                # Slot i now holds the next state of its run; look again:
+                self._delete(i)
+                self.evict_left -= 1
+                self.evictions += 1
+                continue
+            i = (i + 1) & mask
+            self.sweep_left -= 1
+            if self.sweep_left <= 0:
+                self.evict_left = 0
+        self.hand = i
+
+    '''
+    Empty slot i and shift later entries of its probe run back into the gap.
+    '''
+    def _delete(self, i):
+        keys = self.keys
+        rows = self.rows
+        used = self.used
+        mask = self.mask
+        shift = self.shift
+        j = i
+        while True:
+            j = (j + 1) & mask
+            k = keys[j]
+            if k == EMPTY:
+                break
+            home = ((int(k) * GOLDEN) & MASK64) >> shift
+            # Movable if the gap lies between its home slot and j:
+            if (j - home) & mask >= (j - i) & mask:
+                keys[i] = k
+                rows[i] = rows[j]
+                used[i] = used[j]
+                i = j
+        keys[i] = EMPTY
+        self.count -= 1
+
+    def decode(self, stats, s):
+        return self.encoder.decode(s)
+
+    def row(self, s):
+        i = self._find(s)
+        return self.rows[i] if i >= 0 else self.zero_row
+
+    def max(self, s):
+        i = self._find(s)
+        return self.rows[i].max() if i >= 0 else 0.0
+
+    def argmax(self, s):
+        i = self._find(s)
+        return self.rows[i].argmax() if i >= 0 else 0
+
+    def argmax_many(self, states):
+        return np.array([self.argmax(s) for s in states.tolist()], dtype=np.intp)
+
+    def update(self, s, a, target, alpha):
+        i = self._find(s)
+        if i < 0:
+            i = self._insert(s)
+        row = self.rows[i]
+        old_value = float(row[a])
+        row[a] = old_value + alpha*(target - old_value)
+        return row[a]
+
+    def nbytes(self):
+        return self.keys.nbytes + self.rows.nbytes + self.used.nbytes
+
+    def snapshot(self):
+        live = np.nonzero(self.keys != EMPTY)[0]
+        keys, rows, used = self.keys[live], self.rows[live], self.used[live]
+        return lambda f: np.savez(f, keys=keys, rows=rows, used=used)
+
+    def save(self, path):
+        replace_file(path, self.snapshot())
+
+    '''
+    The table is rebuilt in memory; mmap_mode is not used.
+    '''
+    def load(self, path, mmap_mode=None):
+        data = np.load(path)
+        keys, rows, used = data['keys'], data['rows'], data['used']
+        if rows.shape[1] != self.actions:
+            raise Exception("Mismatched loaded state space to desired statespace.")
+        # Keep the most recently used states that fit:
+        order = np.argsort(used, kind='stable')[-self.max_count:]
+        self.keys[:] = EMPTY
+        self.count = 0
+        for j in order.tolist():
+            i = -1 - self._slot(int(keys[j]))
+            self.keys[i] = keys[j]
+            self.rows[i] = rows[j]
+            self.used[i] = used[j]
+            self.count += 1
+        self.tick = int(used.max()) if len(used) else 0
+        self.evict_left = 0
+
+
+class TileQ(object):
+    '''
+    Linear Q function over tile coding of the raw features: Q(s, a) is the
+    sum of one weight per tiling, w[s[t], a]. Each tiling is a grid over the
+    features shifted by a different fraction of a tile; the tile coordinates
+    of every tiling are hashed into a fixed-size weight array, so memory does
+    not depend on the number of features. Updates are semi-gradient
+    Q-learning steps shared equally by the tilings.
+
+    features: names of the raw stats used (e.g. LABELS + ['freq']).
+    mins, maxs: feature ranges (dicts); values outside are clipped.
+    tiles: number of tiles per feature and tiling (dict).
+    tilings: number of offset tilings.
+    size: number of weight rows, a power of two.
+    actions: number of actions.
+    grid: state_encoder.StateEncoder, only used to report per-label buckets
+          in logs and traces.
+    dtype: storage type of the weights.
+    '''
+    def __init__(self, features, mins, maxs, tiles, tilings, size, actions, grid=None,
+            dtype=np.float64):
+        self.features = list(features)
+        self.tilings = tilings
+        self.size = size
+        self.actions = actions
+        self.grid = grid
+        self.mins = np.array([mins[k] for k in features], dtype=np.double)
+        self.maxs = np.array([maxs[k] for k in features], dtype=np.double)
+        self.tiles = np.array([tiles[k] for k in features], dtype=np.int64)
+        self.inv_widths = self.tiles / (self.maxs - self.mins)
+        # Tiling t is shifted by t * (1, 3, 5, ...) / tilings of a tile:
+        odd = 2 * np.arange(len(features)) + 1
+        self.offsets = (np.arange(tilings)[:, None] * odd[None, :] % tilings) / float(tilings)
+        # Hash multipliers for the tiling number and each feature coordinate:
+        rng = np.random.RandomState(0x7115)
+        self.mults = (rng.randint(1, 1 << 62, size=len(features) + 1).astype(np.uint64)
+                << np.uint64(1)) | np.uint64(1)
+        self.shift = np.uint64(64 - int(np.log2(size)))
+        self.tiling_hash = np.arange(tilings, dtype=np.uint64) * self.mults[-1]
+        self.w = np.zeros((size, actions), dtype=dtype)
+        # Sums over the tilings are taken in at least float32:
+        self.sum_dtype = np.result_type(dtype, np.float32)
+
+    '''
+    Weight rows of one stats record, one per tiling.
+    '''
+    def encode(self, stats):
+        x = np.array([stats[k] for k in self.features], dtype=np.double)
+        return self._index(x[None, :])[0]
+
+    def encode_many(self, rows):
+        x = np.column_stack([np.asarray(rows[k], dtype=np.double) for k in self.features])
+        return self._index(x)
+
+    '''
+    (n, features) raw values to (n, tilings) weight rows.
+    '''
+    def _index(self, x):
+        x = (np.clip(x, self.mins, self.maxs) - self.mins) * self.inv_widths
+        coords = np.floor(x[:, None, :] + self.offsets[None, :, :]).astype(np.uint64)
+        h = (coords * self.mults[:-1]).sum(axis=2, dtype=np.uint64) + self.tiling_hash
+        return (h >> self.shift).astype(np.intp)
+
+    def decode(self, stats, s):
+        if self.grid is None:
+            return []
+        return self.grid.decode(self.grid.encode(stats))
+
+    def row(self, s):
+        return self.w[s].sum(axis=0, dtype=self.sum_dtype)
+
+    def max(self, s):
+        return self.row(s).max()
+
+    def argmax(self, s):
+        return self.row(s).argmax()
+
+    def argmax_many(self, states):
+        return self.w[states].sum(axis=1, dtype=self.sum_dtype).argmax(axis=1)
+
+    def update(self, s, a, target, alpha):
+        delta = target - float(self.w[s, a].sum(dtype=self.sum_dtype))
+        # Hash collisions can repeat a row within s:
+        np.add.at(self.w[:, a], s, alpha * delta / self.tilings)
+        return self.w[s, a].sum(dtype=self.sum_dtype)
+
+    def nbytes(self):
+        return self.w.nbytes
+
+    def snapshot(self):
+        w = self.w.copy()
+        tilings, features = self.tilings, np.array(self.features)
+        return lambda f: np.savez(f, w=w, tilings=tilings, features=features)
+
+    def save(self, path):
+        replace_file(path, self.snapshot())
+
+    '''
+    The weights are read into memory; mmap_mode is not used.
+    '''
+    def load(self, path, mmap_mode=None):
+        data = np.load(path)
+        if data['w'].shape != self.w.shape or int(data['tilings']) != self.tilings \
+                or list(data['features']) != self.features:
+            raise Exception("Mismatched loaded state space to desired statespace.")
+        self.w = data['w'].astype(self.w.dtype)
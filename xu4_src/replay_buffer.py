@@ -0,0 +1,78 @@
+import numpy as np
+
+from loop_timing import now_ns
+
+# Experience replay for the online learner.
+# A fixed-capacity ring of past transitions (flat state, action, reward, next
+# flat state) in preallocated arrays; adding one overwrites the oldest once
+# the ring is full. Replaying a minibatch is a batched one-step Q-learning
+# update of uniformly sampled transitions with targets taken from Q before
+# the batch (np.add.at, so repeated cells add up as sequential updates would).
+#
+# replay_until() fills the idle part of a control period: it keeps replaying
+# minibatches while the next one is expected to finish before a deadline and
+# the next sample has not arrived, so replay never delays a decision. The
+# expected cost of a minibatch follows the slowest recent one.
+
+class ReplayBuffer(object):
+    '''
+    capacity: number of transitions kept.
+    seed: seed of the minibatch sampler.
+    '''
+    def __init__(self, capacity, seed=None):
+        self.s = np.zeros(capacity, dtype=np.intp)
+        self.a = np.zeros(capacity, dtype=np.intp)
+        self.r = np.zeros(capacity)
+        self.s_next = np.zeros(capacity, dtype=np.intp)
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+        self.rng = np.random.RandomState(seed)
+        self.batch_ns = 0
+        self.replayed = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, s, a, r, s_next):
+        i = self.head
+        self.s[i] = s
+        self.a[i] = a
+        self.r[i] = r
+        self.s_next[i] = s_next
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.size < self.capacity:
+            self.size += 1
+
+    '''
+    One minibatch update of Qf (states x actions) from batch sampled transitions.
+    '''
+    def replay(self, Qf, batch, alpha, gamma):
+        if self.size == 0:
+            return
+        idx = self.rng.randint(0, self.size, batch)
+        s = self.s[idx]
+        a = self.a[idx]
+        td = self.r[idx] + gamma * Qf[self.s_next[idx]].max(axis=1) - Qf[s, a]
+        np.add.at(Qf, (s, a), alpha * td)
+        self.replayed += batch
+
+    '''
+    Replay minibatches until the next one would end past deadline_ns (now_ns()
+    clock) or ready() returns True. Returns the number of minibatches.
+    '''
+    def replay_until(self, Qf, batch, alpha, gamma, deadline_ns, ready):
+        if self.size == 0:
+            return 0
+        n = 0
+        cost = self.batch_ns
+        t = now_ns()
+        while t + cost < deadline_ns and not ready():
+            self.replay(Qf, batch, alpha, gamma)
+            t_end = now_ns()
+            # Jump to a slower batch at once, forget a slow one gradually:
+            cost = max(t_end - t, cost - (cost >> 3))
+            t = t_end
+            n += 1
+        self.batch_ns = cost
+        return n
@@ -0,0 +1,131 @@
+import numpy as np
+import threading
+import time
+import os
+
+# Buffered, level-gated logging for the control loop.
+# Records are stored as rows of floats in a preallocated in-memory ring and a
+# background thread appends them to one CSV file per category. The control
+# loop only copies a few numbers per record; nothing is formatted or written
+# on its thread.
+#
+# Each category can be switched on or off at runtime, either with
+# set_enabled() or by listing the enabled category names (one per line) in
+# the control file, which the flusher rereads on every flush. Callers test
+# the flag before building a record, so a disabled category costs one list
+# lookup:
+#     if log.on[ring_log.REWARD]:
+#         log.record(ring_log.REWARD, vvf_n, ips_n, ...)
+
+# Categories:
+REWARD, TRANSITION, TIMING = range(3)
+CATEGORY_NAMES = ['reward', 'transition', 'timing']
+
+# Widest record supported (columns after category and timestamp):
+MAX_FIELDS = 32
+
+class RingLog(object):
+    '''
+    prefix: CSV files are written to <prefix>_<category>.csv
+    fields: list with the column names of each category.
+    enabled: names of the categories enabled at start.
+    capacity: number of records the ring holds between flushes. When the
+              flusher falls behind, new records are dropped and counted.
+    ctl_file: control file listing enabled categories (optional).
+    '''
+    def __init__(self, prefix, fields, enabled=(), capacity=4096,
+            flush_interval=1.0, ctl_file=None):
+        self.prefix = prefix
+        self.fields = fields
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.ctl_file = ctl_file
+        self.on = [name in enabled for name in CATEGORY_NAMES]
+        # Row layout: category, timestamp, number of fields, fields...
+        self.ring = np.zeros((capacity, 3 + MAX_FIELDS))
+        # Records written by the control thread / consumed by the flusher:
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.files = [None] * len(CATEGORY_NAMES)
+        self.running = False
+        self.thread = None
+
+    def set_enabled(self, category, on):
+        self.on[category] = bool(on)
+
+    '''
+    Append one record. Only the control thread may call this.
+    '''
+    def record(self, category, *values):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        row = self.ring[head % self.capacity]
+        row[0] = category
+        row[1] = time.time()
+        row[2] = len(values)
+        row[3:3 + len(values)] = values
+        self.head = head + 1
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._flusher, name="ring-log")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        for f in self.files:
+            if f is not None:
+                f.close()
+        self.files = [None] * len(CATEGORY_NAMES)
+
+    def _file(self, category):
+        f = self.files[category]
+        if f is None:
+            path = "{}_{}.csv".format(self.prefix, CATEGORY_NAMES[category])
+            new = not os.path.exists(path)
+            f = open(path, 'a')
+            if new:
+                f.write(",".join(["time"] + list(self.fields[category])) + "\n")
+            self.files[category] = f
+        return f
+
+    '''
+    Write all pending records to their CSV files.
+    '''
+    def flush(self):
+        head = self.head
+        for i in range(self.tail, head):
+            row = self.ring[i % self.capacity]
+            category = int(row[0])
+            n = int(row[2])
+            f = self._file(category)
+            f.write("{:.6f},".format(row[1]))
+            f.write(",".join(repr(float(x)) for x in row[3:3 + n]))
+            f.write("\n")
+        self.tail = head
+        for f in self.files:
+            if f is not None:
+                f.flush()
+
+    def _read_ctl(self):
+        try:
+            with open(self.ctl_file, 'r') as f:
+                names = [line.strip() for line in f]
+        except (IOError, OSError):
+            return
+        self.on = [name in names for name in CATEGORY_NAMES]
+
+    def _flusher(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            if self.ctl_file is not None:
+                self._read_ctl()
+            self.flush()
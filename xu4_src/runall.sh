@@ -1,2 +1,2 @@
 #!/bin/bash
-sudo taskset 0x0f python RL_gov.py run all
+sudo taskset 0x0f python3 RL_gov.py run all
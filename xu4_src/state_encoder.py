@@ -0,0 +1,116 @@
+import numpy as np
+
+# Flat-index state encoder.
+# Maps a stats record straight to one integer: the row of its state in Q
+# viewed as a (num_states, ACTIONS) table, i.e. Q.reshape(-1, ACTIONS)[index]
+# is Q[tuple(bucket_state(stats))]. Everything that does not change between
+# samples is precomputed: row-major strides, the reciprocal of every bucket
+# width and a frequency-to-index array replacing the freq_to_bucket dict, so
+# encoding one sample is a few float operations per label and no allocation.
+#
+# Results are bit-identical to bucket_state(). Multiplying by the reciprocal
+# width can round differently from dividing by the width right at a bucket
+# edge, so the bucket found by the multiplication is checked against the exact
+# edges: edges[j] is the smallest offset from the minimum that bucket_state()
+# places in bucket j or above.
+
+'''
+Smallest d >= 0 with d / width >= j, in double precision.
+'''
+def exact_edge(j, width):
+    d = j * width
+    while d > 0 and np.nextafter(d, -np.inf) / width >= j:
+        d = float(np.nextafter(d, -np.inf))
+    while d / width < j:
+        d = float(np.nextafter(d, np.inf))
+    return d
+
+class StateEncoder(object):
+    '''
+    labels, mins, maxs, buckets: as LABELS, MINS, MAXS, BUCKETS in
+        state_space_params (mins/maxs/buckets are dicts keyed by label).
+    freq_to_bucket: dict of frequency (KHz) to frequency index, or None if
+        the frequency is not part of the state.
+    freqs: number of frequency indices.
+    '''
+    def __init__(self, labels, mins, maxs, buckets, freq_to_bucket=None, freqs=0):
+        dims = [int(buckets[k]) for k in labels]
+        if freq_to_bucket is not None:
+            dims.append(int(freqs))
+        self.dims = dims
+        self.num_states = int(np.prod(dims))
+        strides = [int(np.prod(dims[j+1:])) for j in range(len(dims))]
+        self.strides = strides
+        self.spec = []
+        for j, k in enumerate(labels):
+            lo = float(mins[k])
+            hi = float(maxs[k])
+            nb = dims[j]
+            # Same width computation as RL_gov's widths array:
+            width = float(np.divide(np.double(hi) - np.double(lo), np.double(nb)))
+            edges = [exact_edge(b, width) for b in range(nb + 1)]
+            self.spec.append((k, lo, hi, 1.0 / width, nb - 1, edges, strides[j]))
+        self.edge_table = [np.array(s[5]) for s in self.spec]
+        self.freq_stride = strides[-1] if freq_to_bucket is not None else 0
+        self.freq_index = None
+        if freq_to_bucket is not None:
+            # Frequency index by frequency in 100 MHz steps:
+            top = max(freq_to_bucket.keys()) // 100000
+            self.freq_index = np.zeros(top + 1, dtype=np.intp)
+            for f, i in freq_to_bucket.items():
+                self.freq_index[f // 100000] = int(i)
+            self.freq_list = self.freq_index.tolist()
+
+    '''
+    Flat state index of one stats record.
+    '''
+    def encode(self, stats):
+        idx = 0
+        for k, lo, hi, inv, top, edges, stride in self.spec:
+            v = stats[k]
+            if v <= lo:
+                continue
+            if v >= hi:
+                b = top
+            else:
+                d = v - lo
+                b = int(d * inv)
+                if b > top:
+                    b = top
+                elif d < edges[b]:
+                    b -= 1
+                elif b < top and d >= edges[b + 1]:
+                    b += 1
+            idx += b * stride
+        if self.freq_stride:
+            idx += self.freq_list[int(stats['freq']) // 100000] * self.freq_stride
+        return idx
+
+    '''
+    Flat state indices of a batch of stats records (structured array rows or
+    a dict of per-sample arrays).
+    '''
+    def encode_many(self, rows):
+        idx = None
+        for j, (k, lo, hi, inv, top, edges, stride) in enumerate(self.spec):
+            d = np.clip(np.asarray(rows[k], dtype=np.double), lo, hi) - lo
+            b = np.minimum((d * inv).astype(np.intp), top)
+            e = self.edge_table[j]
+            b -= d < e[b]
+            b += (b < top) & (d >= e[b + 1])
+            idx = b * stride if idx is None else idx + b * stride
+        if self.freq_stride:
+            f = np.asarray(rows['freq']).astype(np.intp) // 100000
+            idx = idx + self.freq_index[f] * self.freq_stride
+        return idx
+
+    '''
+    Per-dimension bucket indices of a flat state index, as bucket_state()
+    returns them.
+    '''
+    def decode(self, idx):
+        state = []
+        for stride in self.strides:
+            b, idx = divmod(idx, stride)
+            state.append(b)
+        return state
@@ -55,15 +55,36 @@ big_freqs = big_freqs_base[0::FREQ_STEP]
 print(big_freqs_base)
 print(big_freqs)
 # freq to bin indices:
-freq_to_bucket = {big_freqs_base[i]:i/FREQ_STEP for i in range(len(big_freqs_base))}
+freq_to_bucket = {big_freqs_base[i]:i//FREQ_STEP for i in range(len(big_freqs_base))}
 from pprint import pprint
 pprint(freq_to_bucket)
 
 EPSILON = 0.20
 # Discounting factor:
 GAMMA = 0.90
-# Lambda for multistep Q-learning updates:
-#LAMBDA = 0.6
+# Lambda for multistep (Watkins Q(lambda)) updates, 0 for one-step
+# Q-learning (TRACE_LAMBDA since LAMBDA is the power coefficient below), and
+# the most state-action pairs kept in the eligibility trace:
+TRACE_LAMBDA = 0.0
+TRACE_LEN = 32
+# Experience replay (dense Q): the last REPLAY_SIZE transitions are kept and
+# minibatches of REPLAY_BATCH are replayed in each period until REPLAY_MARGIN
+# seconds before the next sample is due. Simulation and trace replay have no
+# idle time and replay REPLAY_OFFBOARD minibatches per step. 0 disables (the
+# default, plain one-step Q-learning); e.g. 1 << 16 to enable.
+REPLAY_SIZE = 0
+REPLAY_BATCH = 32
+REPLAY_MARGIN = 0.005
+REPLAY_OFFBOARD = 0
+# 'train async': capacity of the actor to learner transition ring and the
+# (LITTLE) core the learner process runs on:
+TRANSITION_RING = 4096
+LEARNER_CPU = 0
+# 'run all': how the per-core frequency requests are combined ('max',
+# 'thermal', 'util' or 'quorum', see freq_arbiter) and the number of cores
+# that must request a frequency for 'quorum':
+ARBITER_POLICY = 'max'
+ARBITER_QUORUM = 2
 ALPHA = 0.1
 # Update period in seconds
 PERIOD = 0.050
@@ -73,3 +94,29 @@ THERMAL_LIMIT = 50
 RHO = 5
 # Power coefficient:
 LAMBDA = 0.1
+# Record per-stage control loop timings (dump with kill -USR1 <pid>):
+TIMING = 1
+# Control loop log categories enabled at start ('reward', 'transition', 'timing').
+# List category names in LOG_CTL_FILE to change them while running:
+LOG_CATEGORIES = ['reward', 'transition']
+LOG_CTL_FILE = "log_categories"
+# Record every training step to a memory-mapped trace ({} is the period in ms).
+# Segments of 64 MB are added for as long as training runs, so it is off
+# unless a run needs the trace (trace_replay.py):
+TRACE = 0
+TRACE_DIR = "trace_{}ms"
+# Q function: 'dense' (np.zeros over the whole state space), 'sparse'
+# (visited states only, LRU eviction past Q_MEMORY_BUDGET bytes) or 'tile'
+# (linear over TILINGS offset tilings of the raw LABELS and frequency, hashed
+# into TILE_SIZE weight rows; BUCKETS gives the tiles per label):
+Q_BACKEND = 'dense'
+Q_MEMORY_BUDGET = 64*1024*1024
+TILINGS = 8
+TILE_SIZE = 1 << 16
+# Storage type of Q values ('float64', 'float32' or 'float16'; updates are
+# computed in float64 either way):
+Q_DTYPE = 'float32'
+# Background checkpoint of Q every CHECKPOINT_STEPS steps or CHECKPOINT_S
+# seconds, whichever comes first (0 disables either):
+CHECKPOINT_STEPS = 6000
+CHECKPOINT_S = 300
@@ -0,0 +1,185 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import random
+import time
+import os
+
+# Parallel hyperparameter sweeps.
+# Every configuration is trained in its own worker process against the board
+# simulator (or open-loop trace replay), then its greedy policy is evaluated
+# on a fresh environment. Workers configure their own copy of RL_gov with
+# RL_gov.configure(), so nothing in state_space_params is edited.
+#
+# Parameters are given as NAME=values. Per-label bucket counts are
+# BUCKETS.<label> (likewise MINS.<label>, MAXS.<label>):
+#
+#   grid search, every combination:
+#     python sweep.py blackscholes/raw.npy ALPHA=0.05,0.1,0.2 BUCKETS.temp=4,6,8
+#   random search, values drawn from lists or lo:hi ranges:
+#     python sweep.py blackscholes/raw.npy --random 32 ALPHA=0.01:0.5 FREQ_STEP=1,2,3
+#
+# Results are ranked by mean reward of the greedy policy and written to a CSV
+# table together with throughput, energy and thermal violation metrics.
+
+RESULT_COLUMNS = ['reward', 'ips', 'energy_j', 'violations', 'mean_temp', 'max_temp', 'train_s']
+
+'''
+Parse one value: int, float or string.
+'''
+def parse_value(s):
+    for conv in (int, float):
+        try:
+            return conv(s)
+        except ValueError:
+            pass
+    return s
+
+'''
+Parse NAME=v1,v2,... or NAME=lo:hi into (name, list or (lo, hi)).
+'''
+def parse_param(spec):
+    name, values = spec.split('=', 1)
+    if ':' in values:
+        lo, hi = values.split(':')
+        return name, (parse_value(lo), parse_value(hi))
+    return name, [parse_value(v) for v in values.split(',')]
+
+def grid(params):
+    names = [name for name, values in params]
+    for combo in itertools.product(*[values for name, values in params]):
+        yield dict(zip(names, combo))
+
+def random_search(params, n, rng):
+    for _ in range(n):
+        config = {}
+        for name, values in params:
+            if isinstance(values, tuple):
+                lo, hi = values
+                if isinstance(lo, int) and isinstance(hi, int):
+                    config[name] = rng.randint(lo, hi)
+                else:
+                    config[name] = rng.uniform(lo, hi)
+            else:
+                config[name] = rng.choice(values)
+        yield config
+
+'''
+Turn flat sweep names (BUCKETS.temp) into RL_gov.configure() parameters.
+'''
+def to_params(config):
+    params = {}
+    for name, value in config.items():
+        if '.' in name:
+            table, label = name.split('.', 1)
+            params.setdefault(table, {})[label] = value
+        else:
+            params[name] = value
+    return params
+
+def make_env(kind, trace_path, seed):
+    import trace_replay
+    trace = trace_replay.load(trace_path)
+    if kind == 'replay':
+        return trace
+    import board_sim
+    import RL_gov
+    return board_sim.BoardSim(trace, period=RL_gov.PERIOD, seed=seed)
+
+'''
+Run the greedy policy in Q for the given number of steps and collect metrics.
+Thermal violations are counted against limit (degrees C), energy uses the
+environment's power estimate.
+'''
+def evaluate(env, steps, limit):
+    import RL_gov
+    cpu = 4
+    rewards = np.zeros(steps)
+    ips = np.zeros(steps)
+    power = np.zeros(steps)
+    temps = np.zeros(steps)
+    for i in range(steps):
+        stats = env.get_raw_state(cpu)
+        state = RL_gov.qtable.encode(stats)
+        rewards[i] = RL_gov.reward_terms(stats)[-1]
+        ips[i] = stats['IPS']
+        power[i] = stats.get('power', 0.0)
+        temps[i] = stats['temp']
+        env.setClusterFreq(cpu, RL_gov.big_freqs[RL_gov.qtable.argmax(state)])
+        env.wait_for_sample(cpu)
+    period = getattr(env, 'period', RL_gov.PERIOD)
+    return {
+        'reward': rewards.mean(),
+        'ips': ips.mean(),
+        'energy_j': power.sum() * period,
+        'violations': np.mean(temps > limit),
+        'mean_temp': temps.mean(),
+        'max_temp': temps.max(),
+        }
+
+'''
+Worker: train and evaluate one configuration. Runs in a pool process.
+'''
+def run_config(config, env_kind, trace_path, steps, eval_steps, limit, seed):
+    import RL_gov
+    random.seed(seed)
+    np.random.seed(seed)
+    RL_gov.configure(to_params(config))
+    RL_gov.use_backend(make_env(env_kind, trace_path, seed))
+    start = time.time()
+    RL_gov.Q_learning(4, steps=steps, board=False)
+    train_s = time.time() - start
+    result = evaluate(make_env(env_kind, trace_path, seed + 1), eval_steps, limit)
+    result['train_s'] = train_s
+    return config, result
+
+def write_table(path, names, results):
+    with open(path, 'w') as f:
+        f.write(",".join(['rank'] + names + RESULT_COLUMNS) + "\n")
+        for rank, (config, result) in enumerate(results):
+            f.write(",".join([str(rank + 1)] + [str(config[n]) for n in names]
+                    + ["{:.6g}".format(result[c]) for c in RESULT_COLUMNS]) + "\n")
+
+
+if __name__ == "__main__":
+    from state_space_params import THERMAL_LIMIT
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep on the board simulator.")
+    parser.add_argument('trace', help="raw.npy dump or trace directory driving the environment")
+    parser.add_argument('params', nargs='+', help="NAME=v1,v2,... or NAME=lo:hi")
+    parser.add_argument('--env', choices=['sim', 'replay'], default='sim')
+    parser.add_argument('--random', type=int, default=0, metavar='N',
+            help="draw N random configurations instead of the full grid")
+    parser.add_argument('--steps', type=int, default=100000, help="training steps per configuration")
+    parser.add_argument('--eval-steps', type=int, default=20000)
+    parser.add_argument('--limit', type=float, default=THERMAL_LIMIT,
+            help="temperature counted as a thermal violation")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default="sweep_results.csv")
+    args = parser.parse_args()
+
+    params = [parse_param(p) for p in args.params]
+    names = [name for name, values in params]
+    if args.random:
+        configs = list(random_search(params, args.random, random.Random(args.seed)))
+    else:
+        if any(isinstance(values, tuple) for name, values in params):
+            parser.error("lo:hi ranges need --random")
+        configs = list(grid(params))
+    print("{} configurations on {} workers".format(len(configs), args.workers))
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_config, config, args.env, args.trace, args.steps,
+                args.eval_steps, args.limit, args.seed + 2 * i) for i, config in enumerate(configs)]
+        for fut in futures:
+            config, result = fut.result()
+            results.append((config, result))
+            print(config, "reward {:.4f}".format(result['reward']))
+    results.sort(key=lambda cr: cr[1]['reward'], reverse=True)
+    write_table(args.out, names, results)
+    print("Wrote", args.out)
+    for rank, (config, result) in enumerate(results[:10]):
+        print("{:>3} {} reward {:.4f} IPS {:.3g} energy {:.1f} J violations {:.1%}".format(
+                rank + 1, config, result['reward'], result['ips'], result['energy_j'],
+                result['violations']))
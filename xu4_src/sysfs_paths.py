@@ -61,3 +61,8 @@ gpu_micro_volts = gpu_voltage_base + 'microvolts'
 # mem_freq = mem_freq_base + 
 mem_voltage_base="/sys/devices/platform/pwrseq/subsystem/devices/s2mps11-regulator/regulator/regulator.43/"
 mem_micro_volts = gpu_voltage_base + 'microvolts'
+
+# Paths for the performance counter kernel module (perfmod):
+perf_counters_base="/sys/kernel/performance_counters/cpu{}/"
+fn_perf_counter=perf_counters_base+"{}"
+fn_perf_sample_period=perf_counters_base+"sample_period_ms"
@@ -0,0 +1,30 @@
+import os
+import sys
+
+# The governor modules import each other as top level modules (run from
+# xu4_src); make them importable from the tests too.
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+import copy
+import pytest
+
+# State space parameters tests may change through RL_gov.configure():
+CONFIG_NAMES = ['BUCKETS', 'MINS', 'MAXS', 'LABELS', 'FREQ_STEP', 'FREQ_IN_STATE', 'PERIOD',
+        'Q_BACKEND', 'Q_DTYPE']
+
+'''
+RL_gov, restored to its configuration, step count and checkpointer from
+before the test afterwards.
+'''
+@pytest.fixture
+def rl_gov():
+    import RL_gov
+    saved = {k: copy.deepcopy(getattr(RL_gov, k)) for k in CONFIG_NAMES}
+    checkpointer, trained_steps = RL_gov.checkpointer, RL_gov.trained_steps
+    yield RL_gov
+    if RL_gov.checkpointer is not checkpointer:
+        RL_gov.checkpointer.close()
+    RL_gov.checkpointer, RL_gov.trained_steps = checkpointer, trained_steps
+    RL_gov.configure(saved)
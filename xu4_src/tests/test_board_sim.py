@@ -0,0 +1,36 @@
+import os
+import numpy as np
+
+import board_sim as bs
+import trace_replay
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_replayed_temperatures_overlap_recording():
+    trace = trace_replay.load(os.path.join(SRC, "blackscholes", "raw.npy"))
+    recorded = np.asarray(trace.stats['temp'])
+    simulated = bs.replay_temps(trace)
+    assert bs.temperature_overlap(simulated, recorded) >= 0.4
+    assert abs(np.median(simulated) - np.median(recorded)) <= 3.0
+    # Idle and loaded ends of the range both land near the recording:
+    lo, hi = np.percentile(simulated, [5, 95])
+    rec_lo, rec_hi = np.percentile(recorded, [5, 95])
+    assert abs(lo - rec_lo) <= 5.0
+    assert abs(hi - rec_hi) <= 6.0
+
+def test_overlap_of_identical_and_disjoint_distributions():
+    a = np.array([45.0, 46.0, 47.0, 47.0])
+    assert abs(bs.temperature_overlap(a, a) - 1.0) < 1e-12
+    assert bs.temperature_overlap(a, a + 10.0) == 0.0
+
+def test_power_fit_recovers_constants():
+    import fit_board_sim
+    trace = trace_replay.load(os.path.join(SRC, "blackscholes", "raw.npy"))
+    cols = fit_board_sim.columns(trace)
+    c_eff, c_ipc, leak_scale = 8e-11, 1.1e-10, 0.7
+    cols['power'] = bs.NUM_CORES * (cols['v2f'] * (c_eff * cols['usage'] + c_ipc * cols['ipc_p'])
+            + leak_scale * bs.leakage_power(cols['volt'], cols['temp'] + 273.15))
+    coef, rms = fit_board_sim.fit_power([cols])
+    assert np.allclose(coef, [c_eff, c_ipc, leak_scale], rtol=1e-6)
+    assert rms < 1e-9
@@ -0,0 +1,62 @@
+import numpy as np
+import random
+
+import checkpoint as ckpt
+
+def draws():
+    return [random.random(), np.random.rand(), np.random.randint(1 << 30)]
+
+def test_rng_state_round_trip():
+    state = ckpt.rng_state()
+    expected = draws()
+    ckpt.set_rng_state(state)
+    assert draws() == expected
+
+def test_statespace_round_trip(rl_gov, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rl_gov.configure({})
+    rng = np.random.RandomState(3)
+    rl_gov.Q[...] = rng.standard_normal(rl_gov.Q.shape)
+    rl_gov.C[...] = rng.randint(0, 2, rl_gov.C.shape)
+    rl_gov.trained_steps = 1234
+    Q, C = rl_gov.Q.copy(), rl_gov.C.copy()
+    random.seed(5)
+    np.random.seed(5)
+    rl_gov.checkpoint_statespace()
+    expected = draws()
+
+    # Fresh tables and generators, then load the checkpoint back:
+    rl_gov.configure({})
+    rl_gov.trained_steps = 0
+    random.seed(6)
+    np.random.seed(6)
+    assert not rl_gov.Q.any()
+    rl_gov.load_statespace('c')
+    assert np.array_equal(rl_gov.Q, Q)
+    assert np.array_equal(rl_gov.C, C)
+    assert rl_gov.trained_steps == 1234
+    assert draws() == expected
+    # The copy-on-write mapping takes updates without touching the file:
+    rl_gov.Qf[0, 0] += 1.0
+    assert np.load(rl_gov.statespace_file())[(0,) * rl_gov.Q.ndim] == Q[(0,) * Q.ndim]
+
+'''
+The latest of several queued checkpoints is the one left on disk.
+'''
+def test_checkpoint_replaces_pending(tmp_path):
+    class Table(object):
+        def __init__(self, v):
+            self.v = v
+        def snapshot(self):
+            v = self.v
+            return lambda f: np.save(f, np.array([v]))
+    paths = [str(tmp_path / n) for n in ("Q.npy", "C.npy", "Q.json")]
+    writer = ckpt.Checkpointer(*paths)
+    for step in range(20):
+        writer.save(Table(step), np.array([step]), {'step': step}, step)
+    writer.close()
+    assert np.load(paths[0]).tolist() == [19]
+    assert np.load(paths[1]).tolist() == [19]
+    assert ckpt.load_meta(paths[2]) == {'step': 19}
+    stats = writer.stats()
+    assert stats['written'] + stats['superseded'] == 20
@@ -0,0 +1,63 @@
+import numpy as np
+import json
+import os
+
+import compile_policy as cp
+
+CONFIG = {'BUCKETS': {'usage': 4, 'temp': 5}, 'FREQ_STEP': 2, 'LABELS': ['usage', 'temp']}
+
+'''
+Write a Q checkpoint and a policy compiled from it under tmp_path, as the
+compile_policy script does. Returns the Q file and policy file paths.
+'''
+def save_compiled(tmp_path, q_meta):
+    q_file = str(tmp_path / "Q_50ms.npy")
+    policy_file = str(tmp_path / "policy_50ms.npy")
+    Q = np.random.RandomState(0).rand(6, 4, 3)
+    np.save(q_file, Q)
+    np.save(policy_file, cp.compile_policy(Q)[0])
+    with open(cp.meta_path(policy_file), 'w') as f:
+        json.dump(cp.source_meta(q_file, q_meta), f)
+    return q_file, policy_file
+
+def test_compile_policy():
+    Q = np.array([[[1., 3., 2.], [5., 5., 0.]]])
+    policy, margin = cp.compile_policy(Q)
+    assert policy.dtype == np.uint8 and policy.tolist() == [1, 0]
+    assert margin.tolist() == [1., 0.]
+
+def test_fresh_policy(tmp_path):
+    q_meta = {'step': 10, 'config': CONFIG}
+    q_file, policy_file = save_compiled(tmp_path, q_meta)
+    assert cp.stale_reasons(policy_file, q_file, q_meta, CONFIG) == []
+
+def test_missing_files(tmp_path):
+    q_meta = {'step': 10, 'config': CONFIG}
+    q_file, policy_file = save_compiled(tmp_path, q_meta)
+    os.remove(cp.meta_path(policy_file))
+    assert cp.stale_reasons(policy_file, q_file, q_meta, CONFIG) == ["no " + cp.meta_path(policy_file)]
+    os.remove(policy_file)
+    assert cp.stale_reasons(policy_file, q_file, q_meta, CONFIG) == ["no " + policy_file]
+
+def test_config_changed(tmp_path):
+    q_meta = {'step': 10, 'config': CONFIG}
+    q_file, policy_file = save_compiled(tmp_path, q_meta)
+    config = dict(CONFIG, FREQ_STEP=3)
+    reasons = cp.stale_reasons(policy_file, q_file, q_meta, config)
+    assert len(reasons) == 1 and "FREQ_STEP" in reasons[0]
+
+def test_no_recorded_config(tmp_path):
+    q_file, policy_file = save_compiled(tmp_path, None)
+    reasons = cp.stale_reasons(policy_file, q_file, None, CONFIG)
+    assert reasons == ["no state space configuration recorded"]
+
+def test_checkpoint_changed(tmp_path):
+    q_meta = {'step': 10, 'config': CONFIG}
+    q_file, policy_file = save_compiled(tmp_path, q_meta)
+    # A later checkpoint at the same mtime is caught by its step count:
+    reasons = cp.stale_reasons(policy_file, q_file, dict(q_meta, step=20), CONFIG)
+    assert reasons == ["{} changed since it was compiled".format(q_file)]
+    mtime = os.path.getmtime(q_file)
+    os.utime(q_file, (mtime + 5, mtime + 5))
+    reasons = cp.stale_reasons(policy_file, q_file, q_meta, CONFIG)
+    assert reasons == ["{} changed since it was compiled".format(q_file)]
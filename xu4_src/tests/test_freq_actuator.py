@@ -0,0 +1,88 @@
+import threading
+import time
+
+from freq_actuator import FreqActuator
+
+OPPS = [200000, 800000, 1400000, 2000000]
+
+
+class Writer(object):
+    '''
+    Records cpufreq writes; with a gate, every write blocks until released.
+    '''
+    def __init__(self, gated=False):
+        self.writes = []
+        self.gate = threading.Semaphore(0) if gated else None
+        self.started = threading.Event()
+
+    def __call__(self, cpu, khz):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.acquire()
+        self.writes.append((cpu, khz))
+
+def wait_idle(act):
+    for _ in range(1000):
+        with act.cond:
+            if act.pending is None and act.inflight is None:
+                return
+        time.sleep(0.001)
+    raise AssertionError("actuator did not finish writing")
+
+def test_snaps_to_the_opp_table():
+    act = FreqActuator(4, Writer(), reversed(OPPS), threaded=False)
+    assert act.snap(100000) == 200000
+    assert act.snap(1399999) == 800000
+    assert act.snap(1400000) == 1400000
+    assert act.snap(5000000) == 2000000
+
+def test_synchronous_writes_are_suppressed():
+    writer = Writer()
+    act = FreqActuator(4, writer, OPPS, threaded=False)
+    for f in [1400000, 1450000, 1400000, 2000000, 2000000]:
+        act.request(f)
+    assert writer.writes == [(4, 1400000), (4, 2000000)]
+    assert act.writes_issued == 2
+    assert act.writes_suppressed == 3
+    act.invalidate()
+    act.request(2000000)
+    assert writer.writes[-1] == (4, 2000000)
+
+def test_threaded_requests_coalesce_while_writing():
+    writer = Writer(gated=True)
+    act = FreqActuator(4, writer, OPPS)
+    try:
+        act.request(800000)
+        assert writer.started.wait(1.0)
+        # The first write is in flight; later requests replace each other:
+        act.request(1400000)
+        act.request(2000000)
+        act.request(200000)
+        # Same as the value in flight, drops the pending one:
+        act.request(800000)
+        assert act.writes_coalesced == 3
+        assert act.writes_suppressed == 1
+        writer.gate.release()
+        wait_idle(act)
+        assert writer.writes == [(4, 800000)]
+        act.request(2000000)
+        act.request(2000000)
+        writer.gate.release()
+        wait_idle(act)
+        assert writer.writes == [(4, 800000), (4, 2000000)]
+        assert act.applied == 2000000
+        assert act.stats()['writes_issued'] == 2
+    finally:
+        writer.gate.release()
+        act.stop()
+
+def test_reports_completed_writes():
+    applied = []
+    act = FreqActuator(4, Writer(), OPPS)
+    act.on_applied = lambda khz, t_ns: applied.append(khz)
+    try:
+        act.request(1400000)
+        wait_idle(act)
+    finally:
+        act.stop()
+    assert applied == [1400000]
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import freq_arbiter as fa
+import loop_timing as lt
+
+FREQS = np.array([800000., 1400000., 2000000.])
+TEMPS = np.array([60., 75., 89.])
+UTILS = np.array([0.5, 0.0, 1.0])
+
+def test_max():
+    assert fa.arbitrate('max', FREQS, TEMPS, UTILS) == 2000000.
+
+def test_thermal():
+    weights = 1.0 / np.array([30., 15., 1.])
+    expected = np.dot(weights, FREQS) / weights.sum()
+    assert fa.arbitrate('thermal', FREQS, TEMPS, UTILS, limit=90.) == pytest.approx(expected)
+    # At or over the limit a core weighs as much as one degree below it:
+    hot = fa.arbitrate('thermal', FREQS, np.array([60., 95., 90.]), UTILS, limit=90.)
+    weights = 1.0 / np.array([30., 1., 1.])
+    assert hot == pytest.approx(np.dot(weights, FREQS) / weights.sum())
+    with pytest.raises(Exception):
+        fa.arbitrate('thermal', FREQS, TEMPS, UTILS)
+
+def test_util():
+    weights = np.array([0.5, 1e-3, 1.0])
+    expected = np.dot(weights, FREQS) / weights.sum()
+    assert fa.arbitrate('util', FREQS, TEMPS, UTILS) == pytest.approx(expected)
+
+def test_quorum():
+    assert fa.arbitrate('quorum', FREQS, TEMPS, UTILS, quorum=1) == 2000000.
+    assert fa.arbitrate('quorum', FREQS, TEMPS, UTILS, quorum=2) == 1400000.
+    assert fa.arbitrate('quorum', FREQS, TEMPS, UTILS, quorum=3) == 800000.
+    # More cores than published: the lowest request.
+    assert fa.arbitrate('quorum', FREQS, TEMPS, UTILS, quorum=5) == 800000.
+
+def test_unknown_policy():
+    with pytest.raises(Exception):
+        fa.arbitrate('min', FREQS, TEMPS, UTILS)
+
+
+class Actuator(object):
+    '''
+    Synchronous stand-in for freq_actuator.FreqActuator: snaps to 100 MHz
+    steps and completes every request at once.
+    '''
+    def __init__(self):
+        self.applied = None
+        self.on_applied = None
+        self.requests = []
+
+    def snap(self, khz):
+        return int(round(khz / 100000.0)) * 100000
+
+    def request(self, khz):
+        self.requests.append(khz)
+        self.applied = khz
+        self.on_applied(khz, lt.now_ns())
+
+def test_arbiter_policy_checks():
+    with pytest.raises(Exception):
+        fa.FreqArbiter(2, Actuator(), policy='min')
+    with pytest.raises(Exception):
+        fa.FreqArbiter(2, Actuator(), policy='thermal')
+
+def test_arbitrate_once():
+    actuator = Actuator()
+    arbiter = fa.FreqArbiter(3, actuator, policy='quorum', quorum=2)
+    assert arbiter.arbitrate_once() is None
+    arbiter.publish(0, 2000000, 60., 1.)
+    assert arbiter.arbitrate_once() == 2000000
+    arbiter.publish(1, 1420000, 60., 1.)
+    arbiter.publish(2, 900000, 60., 1.)
+    assert arbiter.arbitrate_once() == 1400000
+    # Unchanged target: no write.
+    arbiter.publish(2, 1000000, 60., 1.)
+    assert arbiter.arbitrate_once() == 1400000
+    assert actuator.requests == [2000000, 1400000]
+    stats = arbiter.stats()
+    assert stats['actuations'] == 2 and stats['unchanged'] == 1
+    assert sum(arbiter.timer.hists[fa.REQUEST]) == 4 and not arbiter.waiting
+
+def test_torn_slot_keeps_previous_copy():
+    arbiter = fa.FreqArbiter(2, Actuator())
+    arbiter.publish(0, 1000000, 60., 1.)
+    arbiter.publish(1, 1200000, 60., 1.)
+    assert arbiter.arbitrate_once() == 1200000
+    # A publisher that died mid-write leaves its counter odd:
+    base = 1 * fa.SLOT
+    arbiter.shm[base + fa.SEQ] += 1
+    arbiter.shm[base + fa.FREQ] = 2000000
+    assert arbiter.arbitrate_once() == 1200000
+    assert arbiter.torn_reads == 1
@@ -0,0 +1,99 @@
+import numpy as np
+
+import migrate_q
+
+BASE = [200000, 300000, 400000, 500000, 600000, 700000]
+
+'''
+Stored configuration with labels (name, buckets) over [0, 10].
+'''
+def config(labels, freq_step=1, freq_in_state=1):
+    return {'LABELS': [k for k, _ in labels], 'BUCKETS': dict(labels),
+            'MINS': {k: 0.0 for k, _ in labels}, 'MAXS': {k: 10.0 for k, _ in labels},
+            'FREQ_IN_STATE': freq_in_state, 'big_freqs': BASE[0::freq_step]}
+
+def random_q(old, seed=0):
+    dims = [old['BUCKETS'][k] for k in old['LABELS']]
+    if old['FREQ_IN_STATE']:
+        dims.append(len(old['big_freqs']))
+    return np.random.RandomState(seed).uniform(1, 2, dims + [len(old['big_freqs'])])
+
+def test_same_config_is_identity():
+    old = config([('a', 3), ('b', 2)])
+    Q = random_q(old)
+    Q[1, 0, 2] = 0.0
+    Q_new, covered = migrate_q.migrate(Q, old, old, BASE)
+    assert np.allclose(Q_new, Q)
+    assert covered.sum() == covered.size - 1 and not covered[1, 0, 2]
+
+def test_bucket_changes():
+    old = config([('a', 2)], freq_in_state=0)
+    Q = random_q(old)
+    # Split buckets inherit their parent's values:
+    Q_new, covered = migrate_q.migrate(Q, old, config([('a', 4)], freq_in_state=0), BASE)
+    assert np.allclose(Q_new, Q[[0, 0, 1, 1]]) and covered.all()
+    # Merged buckets average the visited ones only:
+    fine = config([('a', 4)], freq_in_state=0)
+    Q = random_q(fine)
+    Q[1] = 0.0
+    Q_new, covered = migrate_q.migrate(Q, fine, old, BASE)
+    assert np.allclose(Q_new[0], Q[0]) and np.allclose(Q_new[1], (Q[2] + Q[3]) / 2)
+    # ... unless the visit table says it was visited:
+    visits = np.ones(Q.shape, dtype=np.uint8)
+    Q_new, covered = migrate_q.migrate(Q, fine, old, BASE, visits)
+    assert np.allclose(Q_new[0], Q[0] / 2)
+
+def test_freq_step_change():
+    old = config([('a', 2)], freq_step=2)
+    new = config([('a', 2)], freq_step=1)
+    Q = random_q(old)
+    Q_new, covered = migrate_q.migrate(Q, old, new, BASE)
+    assert Q_new.shape == (2, 6, 6) and covered.all()
+    # Frequency state i of the new grid lies in state i // 2 of the old one;
+    # actions between two old action frequencies are interpolated:
+    for i in range(6):
+        expected = Q[:, i // 2]
+        assert np.allclose(Q_new[:, i, 0::2], expected)
+        assert np.allclose(Q_new[:, i, 1], (expected[:, 0] + expected[:, 1]) / 2)
+        assert np.allclose(Q_new[:, i, 5], expected[:, 2])
+    # And back: the coarse grid averages the fine states it covers.
+    Q_back, covered = migrate_q.migrate(Q_new, new, old, BASE)
+    assert np.allclose(Q_back, Q)
+
+def test_label_changes():
+    old = config([('a', 2), ('b', 3)])
+    Q = random_q(old)
+    # A dropped label is averaged out, an added one repeats the values:
+    new = config([('c', 4), ('a', 2)])
+    Q_new, covered = migrate_q.migrate(Q, old, new, BASE)
+    assert Q_new.shape == (4, 2, 6, 6) and covered.all()
+    for c in range(4):
+        assert np.allclose(Q_new[c], Q.mean(axis=1))
+    # Reordered labels are transposed:
+    Q_new, covered = migrate_q.migrate(Q, old, config([('b', 3), ('a', 2)]), BASE)
+    assert np.allclose(Q_new, Q.transpose(1, 0, 2, 3))
+
+def test_unvisited_states_stay_uncovered():
+    old = config([('a', 2)], freq_in_state=0)
+    Q = random_q(old)
+    Q[1] = 0.0
+    Q_new, covered = migrate_q.migrate(Q, old, config([('a', 4)], freq_in_state=0), BASE)
+    assert covered.tolist() == [True, True, False, False]
+    assert not Q_new[2:].any()
+
+def test_load_statespace_migrates(rl_gov, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rl_gov.configure({'FREQ_STEP': 2})
+    rl_gov.Q[...] = np.random.RandomState(4).uniform(1, 2, rl_gov.Q.shape)
+    Q = rl_gov.Q.copy()
+    rl_gov.checkpoint_statespace()
+    k = rl_gov.LABELS[0]
+    rl_gov.configure({'FREQ_STEP': 1, 'BUCKETS': {k: 2 * rl_gov.BUCKETS[k]}})
+    rl_gov.load_statespace()
+    assert rl_gov.Q.shape[-1] == len(rl_gov.big_freqs_base)
+    assert rl_gov.C.all()
+    # Split buckets and the old action frequencies keep their values:
+    if rl_gov.FREQ_IN_STATE:
+        assert np.allclose(rl_gov.Q[0::2, ..., 0::2, 0::2], Q)
+    else:
+        assert np.allclose(rl_gov.Q[0::2, ..., 0::2], Q)
@@ -0,0 +1,70 @@
+import numpy as np
+
+import q_backends
+from state_encoder import StateEncoder
+
+ACTIONS = 3
+
+def make_table(budget=64 * 1024):
+    encoder = StateEncoder(['x'], {'x': 0}, {'x': 1}, {'x': 10})
+    return q_backends.SparseQ(ACTIONS, budget, encoder)
+
+'''
+n distinct scattered state keys above 2^40 (an odd multiplier is a
+bijection modulo 2^40).
+'''
+def distinct_states(n):
+    return (((np.arange(n, dtype=np.int64) * 0x5DEECE66D) & ((1 << 40) - 1)) + (1 << 40)).tolist()
+
+'''
+Every live state is reachable from its home slot and holds its value;
+count matches the occupied slots.
+'''
+def check_consistent(table, values):
+    live = table.keys[table.keys != q_backends.EMPTY].tolist()
+    assert table.count == len(live) == len(set(live))
+    for s in live:
+        assert table._slot(s) >= 0
+        assert table.row(s)[s % ACTIONS] == values[s]
+
+def test_eviction_is_incremental():
+    table = make_table()
+    values = {}
+    for s in distinct_states(4 * table.capacity):
+        before = table.evictions
+        values[s] = table.update(s, s % ACTIONS, 1.0 + s % 7, 1.0)
+        # No insert evicts more than its share of the sweep below HARD_LOAD:
+        if table.count < table.hard_count:
+            assert table.evictions - before <= table.EVICT_SCAN
+        assert table.count <= table.hard_count
+    assert table.evictions > 0
+    assert table.count > table.max_count * (1 - 2 * table.EVICT_FRACTION)
+    check_consistent(table, values)
+
+def test_recently_used_states_survive():
+    table = make_table()
+    hot = list(range(1, 33))
+    for s in hot:
+        table.update(s, 0, 5.0, 1.0)
+    for n, s in enumerate(distinct_states(4 * table.capacity)):
+        table.update(s, 0, 1.0, 1.0)
+        if n % 64 == 0:
+            for h in hot:
+                table.row(h)
+    for h in hot:
+        assert table._slot(h) >= 0 and table.row(h)[0] == 5.0
+    # Evicted states read as zeros, as in a fresh table:
+    assert table.row(1 << 41).tolist() == [0.0] * ACTIONS
+
+def test_save_load(tmp_path):
+    table = make_table()
+    values = {}
+    for s in range(2 * table.capacity):
+        values[s] = table.update(s, s % ACTIONS, float(s), 0.5)
+    path = str(tmp_path / "Q.npz")
+    table.save(path)
+    loaded = make_table()
+    loaded.load(path)
+    assert loaded.count == table.count
+    assert loaded.tick == table.tick
+    check_consistent(loaded, values)
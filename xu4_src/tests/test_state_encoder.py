@@ -0,0 +1,42 @@
+import numpy as np
+
+
+'''
+n stats records spread over (and beyond) every label's range, with values
+exactly on and one ulp around every bucket edge.
+'''
+def sample_stats(RL_gov, n, seed=0):
+    rng = np.random.RandomState(seed)
+    cols = {}
+    for j, k in enumerate(RL_gov.LABELS):
+        lo, hi, width = RL_gov.all_mins[j], RL_gov.all_maxs[j], RL_gov.widths[j]
+        edges = lo + width * np.arange(int(RL_gov.num_buckets[j]) + 1)
+        special = np.concatenate([edges, np.nextafter(edges, -np.inf), np.nextafter(edges, np.inf)])
+        span = hi - lo
+        values = rng.uniform(lo - 0.2 * span, hi + 0.2 * span, n)
+        values[:len(special)] = special
+        cols[k] = rng.permutation(values)
+    cols['freq'] = rng.choice(RL_gov.big_freqs_base, n)
+    return [{k: cols[k][i] for k in cols} for i in range(n)], cols
+
+def check_encoder(RL_gov):
+    records, cols = sample_stats(RL_gov, 3000)
+    dims = RL_gov.dims[:-1]
+    expected = [int(np.ravel_multi_index(RL_gov.bucket_state(r), dims)) for r in records]
+    encoder = RL_gov.encoder
+    assert [encoder.encode(r) for r in records] == expected
+    assert encoder.encode_many(cols).tolist() == expected
+    for r, idx in zip(records[:200], expected[:200]):
+        assert encoder.decode(idx) == RL_gov.bucket_state(r)
+
+def test_encoder_matches_bucket_state(rl_gov):
+    check_encoder(rl_gov)
+
+def test_encoder_matches_bucket_state_after_configure(rl_gov):
+    k = rl_gov.LABELS[0]
+    rl_gov.configure({'FREQ_STEP': 3, 'BUCKETS': {k: 7}, 'MAXS': {k: rl_gov.MAXS[k] * 1.3}})
+    check_encoder(rl_gov)
+
+def test_encoder_without_frequency(rl_gov):
+    rl_gov.configure({'FREQ_IN_STATE': 0})
+    check_encoder(rl_gov)
@@ -0,0 +1,71 @@
+import os
+import random
+import threading
+
+import sysfs_reader as sfr
+
+
+def write(path, text):
+    with open(str(path), 'w') as f:
+        f.write(text)
+    return str(path)
+
+def test_parses_ints(tmp_path):
+    reader = sfr.SysfsReader()
+    path = str(tmp_path / "attr")
+    for text, value in [("12345\n", 12345), ("-42\n", -42), ("  7 \n", 7), ("0", 0),
+            ("1500000 800000\n", 1500000)]:
+        write(path, text)
+        assert reader.read_int(path) == value
+
+def test_parses_floats_like_float(tmp_path):
+    reader = sfr.SysfsReader()
+    path = str(tmp_path / "attr")
+    rng = random.Random(1)
+    texts = ["3.14159\n", "-2.5\n", "0.9", "42\n", "1.0000001\n", "  0.046\n"]
+    texts += ["{}.{}".format(rng.randint(0, 10 ** 6), rng.randint(0, 10 ** 9)) for _ in range(200)]
+    for text in texts:
+        write(path, text)
+        assert reader.read_float(path) == float(text)
+
+def test_rereads_held_descriptor(tmp_path):
+    reader = sfr.SysfsReader()
+    path = write(tmp_path / "temp", "45000\n")
+    assert reader.read_int(path) == 45000
+    write(path, "51000\n")
+    assert reader.read_int(path) == 51000
+    assert len(reader.fds) == 1
+    assert reader.reopens == 0
+
+def test_reopens_after_empty_read(tmp_path):
+    reader = sfr.SysfsReader()
+    path = write(tmp_path / "counter", "1\n")
+    assert reader.read_int(path) == 1
+    # The held file goes empty and a new one takes its place, as when the
+    # perf counter module is reloaded:
+    write(path, "")
+    os.rename(write(tmp_path / "new", "2\n"), path)
+    assert reader.read_int(path) == 2
+    assert reader.reopens == 1
+
+def test_reads_columns(tmp_path):
+    reader = sfr.SysfsReader()
+    path = write(tmp_path / "temp", "sensor0 : 45000\nsensor1 : 47000\nsensor2 : -1000\nsensor3 : 9\n")
+    out = [0] * 3
+    assert reader.read_column_ints(path, 2, out) == 3
+    assert out == [45000, 47000, -1000]
+
+def test_reads_strings_and_writes_ints(tmp_path):
+    path = write(tmp_path / "scaling_governor", "  userspace \n")
+    assert sfr.read_str(path) == "userspace"
+    sfr.write_int(path, 50)
+    with open(path) as f:
+        assert f.read() == "50\n"
+    assert sfr.read_int(path) == 50
+
+def test_readers_are_per_thread():
+    readers = []
+    t = threading.Thread(target=lambda: readers.append(sfr.get_reader()))
+    t.start()
+    t.join()
+    assert readers[0] is not sfr.get_reader()
@@ -0,0 +1,87 @@
+import os
+
+import actor_learner as al
+
+def push(ring, seq):
+    return ring.push(seq, seq % 3, seq * 0.5, seq + 1, seq % 2)
+
+'''
+Transitions the learner sees after the next wait(), as tuples; releases them.
+'''
+def drain(ring):
+    assert ring.wait(timeout=1.0)
+    slots = ring.pending()
+    seen = [(int(ring.s[i]), int(ring.a[i]), float(ring.r[i]), int(ring.s_next[i]),
+            int(ring.explore[i])) for i in slots]
+    ring.release(len(slots))
+    return seen
+
+def expected(seqs):
+    return [(seq, seq % 3, seq * 0.5, seq + 1, seq % 2) for seq in seqs]
+
+def test_wraparound():
+    ring = al.TransitionRing(4)
+    seq = 0
+    for batch in (3, 3, 4, 1, 4):
+        seqs = list(range(seq, seq + batch))
+        for s in seqs:
+            assert push(ring, s)
+        seq += batch
+        assert drain(ring) == expected(seqs)
+    assert ring.ctr[0] == ring.ctr[1] == seq
+    assert ring.dropped == 0
+
+def test_full_ring_drops():
+    ring = al.TransitionRing(4)
+    assert all(push(ring, s) for s in range(4))
+    assert not push(ring, 4)
+    assert ring.dropped == 1
+    assert drain(ring) == expected(range(4))
+    # Room again once the learner released the slots:
+    assert push(ring, 5)
+    assert drain(ring) == expected([5])
+
+def test_partial_release():
+    ring = al.TransitionRing(4)
+    for s in range(3):
+        push(ring, s)
+    ring.wait(timeout=1.0)
+    ring.release(1)
+    # Only one slot was freed:
+    assert push(ring, 3) and push(ring, 4) and not push(ring, 5)
+    assert ring.pending().tolist() == [1, 2]
+    assert drain(ring) == expected(range(1, 5))
+
+def test_pending_waits_for_the_bell():
+    ring = al.TransitionRing(4)
+    push(ring, 0)
+    assert drain(ring) == expected([0])
+    push(ring, 1)
+    # Published, but not handed out before the learner has waited:
+    assert len(ring.pending()) == 0
+    assert drain(ring) == expected([1])
+
+def test_close_ends_the_learner():
+    ring = al.TransitionRing(4)
+    push(ring, 0)
+    ring.close()
+    assert ring.wait(timeout=1.0)
+    assert [int(ring.s[i]) for i in ring.pending()] == [0]
+    assert not ring.wait(timeout=1.0)
+
+'''
+Child process: push() must refuse anything but the creating process.
+'''
+def push_from_child(ring):
+    try:
+        push(ring, 0)
+    except Exception:
+        os._exit(0)
+    os._exit(1)
+
+def test_single_writer():
+    ring = al.TransitionRing(4)
+    child = al.fork_process(push_from_child, (ring,))
+    child.join(5.0)
+    assert child.exitcode == 0
+    assert ring.ctr[0] == 0
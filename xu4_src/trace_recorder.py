@@ -0,0 +1,138 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+import threading
+import json
+import os
+
+# Memory-mapped columnar trace recorder.
+# Every control step appends one row. Each column lives in its own .npy file
+# that is preallocated to the segment size and memory-mapped, so appending is
+# a handful of stores into mapped pages; the kernel writes them back. Rows
+# committed so far are kept in a one-element 'rows.npy' counter next to the
+# columns, so a trace cut short by a crash is still readable.
+#
+# When a segment is full the recorder switches to the next one, which a
+# background thread created when the current segment was half full; the
+# control loop never creates files or maps memory itself.
+#
+# Layout:
+#   <directory>/seg_00000/meta.json     column names and dtypes
+#   <directory>/seg_00000/<column>.npy  one array per column
+#   <directory>/seg_00000/rows.npy      number of valid rows
+#
+# Segments open with np.load(mmap_mode='r'), see load_segments().
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+class TraceRecorder(object):
+    '''
+    directory: trace directory; new segments are added after existing ones.
+    columns: list of (name, dtype) pairs, in the order append() takes values.
+    segment_bytes: approximate size of one segment over all columns.
+    '''
+    def __init__(self, directory, columns, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.names = [name for name, dt in columns]
+        self.dtypes = [np.dtype(dt) for name, dt in columns]
+        row_bytes = sum(dt.itemsize for dt in self.dtypes)
+        self.segment_rows = max(1, segment_bytes // row_bytes)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.seg_index = len(segment_dirs(directory))
+        self.cols, self.count = self._create(self.seg_index)
+        self.row = 0
+        self.next_seg = None
+        self.preparer = None
+        self.total_rows = 0
+
+    def _create(self, index):
+        path = os.path.join(self.directory, "seg_{:05d}".format(index))
+        os.makedirs(path)
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({'columns': [[n, dt.str] for n, dt in zip(self.names, self.dtypes)]}, f)
+        cols = [open_memmap(os.path.join(path, name + ".npy"), mode='w+',
+                dtype=dt, shape=(self.segment_rows,))
+                for name, dt in zip(self.names, self.dtypes)]
+        count = open_memmap(os.path.join(path, "rows.npy"), mode='w+',
+                dtype=np.int64, shape=(1,))
+        return cols, count
+
+    def _prepare(self, index):
+        self.next_seg = self._create(index)
+
+    def _rotate(self):
+        old_cols, old_count = self.cols, self.count
+        if self.preparer is None:
+            self._prepare(self.seg_index + 1)
+        else:
+            self.preparer.join()
+            self.preparer = None
+        self.cols, self.count = self.next_seg
+        self.next_seg = None
+        self.seg_index += 1
+        self.row = 0
+        # Write back the finished segment off the control thread:
+        t = threading.Thread(target=_flush, args=(old_cols + [old_count],))
+        t.daemon = True
+        t.start()
+
+    '''
+    Append one row; values are in the column order given to the constructor.
+    '''
+    def append(self, values):
+        if self.row == self.segment_rows:
+            self._rotate()
+        i = self.row
+        for col, v in zip(self.cols, values):
+            col[i] = v
+        self.row = i + 1
+        self.count[0] = i + 1
+        self.total_rows += 1
+        if self.row == self.segment_rows // 2 and self.preparer is None:
+            self.preparer = threading.Thread(target=self._prepare, args=(self.seg_index + 1,))
+            self.preparer.daemon = True
+            self.preparer.start()
+
+    def close(self):
+        if self.preparer is not None:
+            self.preparer.join()
+            self.preparer = None
+        _flush(self.cols + [self.count])
+
+
+def _flush(arrays):
+    for a in arrays:
+        a.flush()
+
+def segment_dirs(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, d) for d in os.listdir(directory)
+            if d.startswith("seg_"))
+
+'''
+Yield one dict per segment mapping column name to a read-only memory-mapped
+array holding only the valid rows. No data is copied.
+'''
+def load_segments(directory):
+    for path in segment_dirs(directory):
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            names = [n for n, dt in json.load(f)['columns']]
+        rows = int(np.load(os.path.join(path, "rows.npy"))[0])
+        yield {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r')[:rows]
+                for name in names}
+
+'''
+Whole trace as one dict of arrays. Segments are concatenated, which copies;
+use load_segments() to stay zero-copy.
+'''
+def load_trace(directory):
+    segs = list(load_segments(directory))
+    if len(segs) == 0:
+        return {}
+    if len(segs) == 1:
+        return segs[0]
+    trace = {}
+    for name in segs[0].keys():
+        trace[name] = np.concatenate([seg[name] for seg in segs])
+    return trace
@@ -0,0 +1,168 @@
+import numpy as np
+import sys
+import time
+
+from state_space_params import PERIOD, big_freqs_base
+import therm_params as tm
+import trace_recorder
+
+# Trace replay backend.
+# Stands in for get_raw_state(), the sysfs notifier wait and the
+# devfreq_utils calls RL_gov uses, feeding recorded samples through the
+# unchanged bucket_state/reward_func/update_Q_off_policy code with no
+# sleeping and no sysfs access:
+#
+#     env = trace_replay.load("blackscholes/raw.npy")
+#     RL_gov.use_backend(env)
+#     RL_gov.Q_learning(4, steps=100000, board=False)
+#
+# Replay is open loop: the next sample is the next recorded one whatever
+# frequency the governor picked. Frequency writes are counted, not applied.
+#
+# Usage: python trace_replay.py <raw.npy | trace directory> [steps]
+# runs Q_learning over the trace and reports the loop throughput.
+
+# Column layouts of the raw.npy dumps written from the notebooks.
+# blackscholes/raw.npy, bodytrack/raw.npy, single_core_tests/raw.npy:
+RAW_COLUMNS_50MS = ['BMPKI', 'IPC_u', 'MPKI', 'DAPKI', 'temp', 'power', 'freq']
+# single_core_tests/bt_200ms_*MHz/raw.npy:
+RAW_COLUMNS_200MS = ['BMPKI', 'IPC_u', 'MPKI', 'temp', 'power', 'freq', 'IPC_p']
+
+class EndOfTrace(Exception):
+    pass
+
+class TraceReplay(object):
+    '''
+    columns: dict of per-sample arrays. Needs 'IPC_u' or 'IPC_p', 'MPKI',
+             'temp' and 'freq' (KHz); missing stats are derived from those.
+    period: period the samples were taken at, in seconds.
+    loop: start over at the end of the trace instead of raising EndOfTrace.
+    '''
+    def __init__(self, columns, period=PERIOD, loop=True):
+        self.period = period
+        self.loop = loop
+        n = len(columns['freq'])
+        freq = np.asarray(columns['freq'], dtype=np.double)
+        # Snap to the OPP table so freq_to_bucket/voltage lookups hit:
+        freq = np.round(freq / 100000.0) * 100000
+        ipc_u = np.asarray(columns.get('IPC_u', columns.get('IPC_p')), dtype=np.double)
+        # Without utilization data assume a fully busy core:
+        ipc_p = np.asarray(columns.get('IPC_p', ipc_u), dtype=np.double)
+        usage = np.asarray(columns['usage'], dtype=np.double) if 'usage' in columns \
+                else np.divide(ipc_p, ipc_u, out=np.ones(n), where=ipc_u > 0)
+        ips = np.asarray(columns['IPS'], dtype=np.double) if 'IPS' in columns \
+                else ipc_p * freq * 1000
+        instructions = np.asarray(columns['instructions'], dtype=np.double) \
+                if 'instructions' in columns else ips * period
+        kinstructions = instructions / 1000.0
+        zeros = np.zeros(n)
+        mpki = np.asarray(columns['MPKI'], dtype=np.double)
+        bmpki = np.asarray(columns.get('BMPKI', zeros), dtype=np.double)
+        # Python lists make the per-step scalar reads cheap:
+        self.stats = {
+            'cycles': np.asarray(columns['cycles'], dtype=np.double).tolist() if 'cycles' in columns
+                    else np.divide(instructions, ipc_u, out=zeros.copy(), where=ipc_u > 0).tolist(),
+            'instructions': instructions.tolist(),
+            'bmisses': np.asarray(columns['bmisses'], dtype=np.double).tolist() if 'bmisses' in columns
+                    else (bmpki * kinstructions).tolist(),
+            'l2misses': np.asarray(columns['l2misses'], dtype=np.double).tolist() if 'l2misses' in columns
+                    else (mpki * kinstructions).tolist(),
+            'BMPKI': bmpki.tolist(),
+            'IPC_u': ipc_u.tolist(),
+            'IPC_p': ipc_p.tolist(),
+            'MPKI': mpki.tolist(),
+            'DAPKI': np.asarray(columns.get('DAPKI', zeros), dtype=np.double).tolist(),
+            'temp': np.asarray(columns['temp'], dtype=np.double).tolist(),
+            'power': np.asarray(columns.get('power', zeros), dtype=np.double).tolist(),
+            'usage': usage.tolist(),
+            'IPS': ips.tolist(),
+            }
+        self.freq = [int(f) for f in freq]
+        self.keys = list(self.stats.keys())
+        self.values = [self.stats[k] for k in self.keys]
+        self.n = n
+        self.i = 0
+        self.applied_freq = None
+        self.freq_writes = 0
+
+    def __len__(self):
+        return self.n
+
+    ###########################################################################
+    # Stand-ins for RL_gov:
+
+    def get_raw_state(self, cpu):
+        i = self.i
+        all_stats = {k: v[i] for k, v in zip(self.keys, self.values)}
+        freq = self.freq[i]
+        all_stats['freq'] = freq
+        all_stats['volt'] = tm.big_f_to_v_MC1[float(freq) / 1000000]
+        return all_stats
+
+    def register_watcher(self, cpu):
+        pass
+
+    def wait_for_sample(self, cpu):
+        self.i += 1
+        if self.i == self.n:
+            if not self.loop:
+                raise EndOfTrace()
+            self.i = 0
+
+    ###########################################################################
+    # Stand-ins for devfreq_utils:
+
+    def getClusterFreq(self, cpu_num):
+        return self.freq[self.i]
+
+    def setClusterFreq(self, cpu_num, frequency):
+        self.applied_freq = int(frequency)
+        self.freq_writes += 1
+
+    def getAvailFreqs(self, cpu_num):
+        return list(big_freqs_base)
+
+    def getTemps(self):
+        return [self.stats['temp'][self.i]] * 5
+
+    def setUserSpace(self, clusters=None):
+        pass
+
+    def unsetUserSpace(self, clusters=None):
+        pass
+
+
+'''
+Load a raw.npy dump (either notebook layout, picked by which column holds
+the frequency) or a directory written by trace_recorder.
+'''
+def load(path, period=None, loop=True):
+    if path.endswith(".npy"):
+        raw = np.load(path)
+        if np.all(raw[:, 6] >= 100000):
+            names = RAW_COLUMNS_50MS
+            period = period if period is not None else 0.050
+        else:
+            names = RAW_COLUMNS_200MS
+            period = period if period is not None else 0.200
+        columns = {name: raw[:, j] for j, name in enumerate(names)}
+    else:
+        columns = dict(trace_recorder.load_trace(path))
+        columns['freq'] = columns['freq_mhz'].astype(np.double) * 1000
+    return TraceReplay(columns, period if period is not None else PERIOD, loop)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("USAGE: {} <raw.npy|trace dir> [steps]".format(sys.argv[0]))
+        sys.exit(0)
+    import RL_gov
+    env = load(sys.argv[1])
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else len(env)
+    RL_gov.use_backend(env)
+    start = time.time()
+    RL_gov.Q_learning(4, steps=steps, board=False)
+    elapsed = time.time() - start
+    print("{} steps in {:.2f} s ({:.0f} steps/s), {} frequency writes".format(
+            steps, elapsed, steps / elapsed, env.freq_writes))
+    RL_gov.timer.dump()
@@ -1,2 +1,2 @@
 #! /bin/bash
-sudo taskset 0x0f python RL_gov.py train
+sudo taskset 0x0f python3 RL_gov.py train
@@ -0,0 +1,87 @@
+import numpy as np
+import argparse
+import time
+
+import RL_gov
+import board_sim
+import offline_train
+import trace_replay
+
+# Vectorized multi-environment Q-learning.
+# Steps N simulated boards (board_sim.BoardSim with boards=N) as one batch:
+# bucketing, rewards, the Q update and epsilon-greedy action selection for
+# all boards are a few array operations per period instead of N passes
+# through the Python control loop. As in Q_learning(), each board's governor
+# observes core 4 and sets the cluster frequency.
+#
+# All boards share one Q table. Transitions that update the same cell in a
+# step are combined by offline_train.batch_update(): their TD errors are
+# averaged, which does not depend on the order of the boards.
+#
+# Usage: python vec_train.py <raw.npy | trace directory> [--boards N]
+#                            [--steps S] [--out Q.npy]
+
+'''
+Observed stats of the watched core (core 4) of every board, in the form
+encoder.encode_many() and reward_terms() take.
+'''
+def observe(sim, cpu=4):
+    c = cpu - 4
+    rows = {k: v[:, c] for k, v in sim.stats.items() if v.ndim == 2}
+    rows['temp'] = sim.temps[:, c]
+    rows['freq'] = sim.freq
+    rows['volt'] = board_sim.volt_lut[sim.freq // 100000]
+    return rows
+
+'''
+Train the global RL_gov.Q for the given number of steps on all boards of sim.
+Returns the number of transitions learned from.
+'''
+def train(sim, steps, epsilon=None, alpha=None, gamma=None, seed=None):
+    epsilon = RL_gov.EPSILON if epsilon is None else epsilon
+    alpha = RL_gov.ALPHA if alpha is None else alpha
+    gamma = RL_gov.GAMMA if gamma is None else gamma
+    if RL_gov.Qf is None:
+        raise Exception("Vectorized training needs the dense Q backend.")
+    rng = np.random.RandomState(seed)
+    Qf = RL_gov.Qf
+    freqs = np.array(RL_gov.big_freqs)
+    boards = sim.boards
+    last_state = None
+    last_action = None
+    for step in range(steps):
+        rows = observe(sim)
+        state = RL_gov.encoder.encode_many(rows)
+        if last_action is not None:
+            reward = RL_gov.reward_terms(rows)[-1]
+            offline_train.batch_update(Qf, last_state, last_action, reward, state, alpha, gamma)
+        # Epsilon-greedy over all boards at once:
+        action = Qf[state].argmax(axis=1)
+        explore = rng.random_sample(boards) < epsilon
+        action[explore] = rng.randint(0, RL_gov.ACTIONS, explore.sum())
+        sim.set_freqs(freqs[action])
+        sim.step()
+        last_state = state
+        last_action = action
+    return (steps - 1) * boards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Q-learning on N simulated boards stepped as one batch.")
+    parser.add_argument('trace', help="raw.npy dump or trace directory driving the simulator")
+    parser.add_argument('--boards', type=int, default=64)
+    parser.add_argument('--steps', type=int, default=10000, help="periods to simulate")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=None, help="save the trained Q here")
+    args = parser.parse_args()
+
+    sim = board_sim.BoardSim(trace_replay.load(args.trace), period=RL_gov.PERIOD,
+            boards=args.boards, seed=args.seed)
+    start = time.time()
+    n = train(sim, args.steps, seed=args.seed)
+    elapsed = time.time() - start
+    print("{} boards x {} steps: {} transitions in {:.2f} s ({:.0f} transitions/s)".format(
+            args.boards, args.steps, n, elapsed, n / elapsed))
+    if args.out is not None:
+        np.save(args.out, RL_gov.Q)
+        print("Saved", args.out)